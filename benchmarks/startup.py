@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Measure the startup cost of mirror-tool commands.
+
+Each command is run several times against a minimal config in a scratch git
+repo, under 'python -X importtime'. The median wall time and time spent
+importing modules are reported per command, along with the slowest imports.
+
+Usage: python benchmarks/startup.py [--runs N] [--budget-ms MS]
+
+With --budget-ms, exits with a non-zero code if any command's median import
+time exceeds the budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+mirror: []
+gitlab_merge:
+  enabled: true
+"""
+
+COMMANDS = [
+    ["--help"],
+    ["validate-config"],
+    ["gitlab-ci-yml"],
+    ["update-local"],
+    ["update", "--dry-run"],
+    ["prefetch"],
+    ["promote", "--dry-run"],
+]
+
+
+def run_once(args, cwd):
+    """Run mirror-tool once, returning (wall time, import times by module),
+    times being in microseconds."""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    # Commands talking to GitLab give up early without these, which is fine
+    # for measuring startup.
+    env.pop("GITLAB_MIRROR_TOKEN", None)
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c"]
+        + ["from mirror_tool.cmd import entrypoint; entrypoint()"]
+        + args,
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = (time.perf_counter() - start) * 1e6
+
+    # Lines are of the form "import time: <self> | <cumulative> | <name>",
+    # with the name indented by its depth in the import tree.
+    imports = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        (self_us, cumulative_us, name) = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            # The header line
+            continue
+        top_level = not name.startswith("  ")
+        imports[name.strip()] = (int(self_us), int(cumulative_us), top_level)
+    return (wall, imports)
+
+
+def import_total(imports):
+    # Only top-level imports are counted, as each one's cumulative time
+    # includes the modules it imported.
+    return sum(
+        cumulative for (_, cumulative, top_level) in imports.values() if top_level
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float)
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to show")
+    args = parser.parse_args()
+
+    over_budget = []
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run(["git", "init", "-q", workdir], check=True)
+        with open(os.path.join(workdir, ".mirror-tool.yaml"), "wt") as f:
+            f.write(CONFIG)
+
+        for command in COMMANDS:
+            walls = []
+            totals = []
+            for _ in range(args.runs):
+                (wall, imports) = run_once(command, workdir)
+                walls.append(wall)
+                totals.append(import_total(imports))
+
+            import_ms = statistics.median(totals) / 1000
+            print(
+                "%-20s wall %7.1f ms  imports %7.1f ms"
+                % (" ".join(command), statistics.median(walls) / 1000, import_ms)
+            )
+            slowest = sorted(imports.items(), key=lambda kv: -kv[1][0])[: args.top]
+            for name, (self_us, _, _) in slowest:
+                print("    %-30s %7.1f ms" % (name, self_us / 1000))
+
+            if args.budget_ms is not None and import_ms > args.budget_ms:
+                over_budget.append(command)
+
+    if over_budget:
+        print(
+            "Over budget of %.1f ms: %s"
+            % (args.budget_ms, ", ".join(" ".join(c) for c in over_budget))
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
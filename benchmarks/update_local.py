@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Measure update-local against generated superprojects.
+
+For each combination of the swept parameters, local bare upstream repos and a
+superproject mirroring them (over file://) are generated. update-local is
+then measured twice: once for the initial update of every mirror, and once
+after adding new commits to each upstream.
+
+Each measurement runs MirrorTool.update_local in a fresh process and records
+its wall time, the number of subprocesses started, and the peak RSS of the
+process and of its largest subprocess.
+
+Usage: python benchmarks/update_local.py [--mirrors 1,10,50] [--depth 20]
+           [--files 10] [--commits 1,10] [--args=--no-checkout] [--json FILE]
+
+Parameters taking a comma-separated list are swept over all combinations.
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GIT_ENV = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="bench",
+    GIT_AUTHOR_EMAIL="bench@example.com",
+    GIT_COMMITTER_NAME="bench",
+    GIT_COMMITTER_EMAIL="bench@example.com",
+)
+
+
+def git(*args, **kwargs):
+    return subprocess.run(["git"] + list(args), env=GIT_ENV, check=True, **kwargs)
+
+
+def add_commits(repo, count, files, first):
+    """Add 'count' commits to the main branch of the bare repo 'repo'.
+
+    The first commit ever made creates all of 'files' files, and every
+    commit after that modifies one of them.
+
+    git fast-import is used, as it's much faster than committing one at a
+    time when generating deep histories.
+    """
+    stream = []
+    for i in range(first, first + count):
+        message = f"commit {i}\n".encode()
+        stream.append(b"commit refs/heads/main\n")
+        stream.append(b"committer bench <bench@example.com> %d +0000\n" % (i + 1))
+        stream.append(b"data %d\n%s" % (len(message), message))
+        if i == first and first:
+            stream.append(b"from refs/heads/main^0\n")
+
+        changed = range(files) if i == 0 else [i % files]
+        for j in changed:
+            content = f"file {j} at commit {i}\n".encode()
+            stream.append(b"M 100644 inline dir%d/file%d\n" % (j % 10, j))
+            stream.append(b"data %d\n%s\n" % (len(content), content))
+
+    git("fast-import", "--quiet", cwd=repo, input=b"".join(stream))
+
+
+def make_superproject(workdir, mirrors, depth, files):
+    upstreams = []
+    for i in range(mirrors):
+        repo = os.path.join(workdir, "upstream", f"repo{i}.git")
+        git("init", "-q", "--bare", "-b", "main", repo)
+        add_commits(repo, depth, files, first=0)
+        upstreams.append(repo)
+
+    superproject = os.path.join(workdir, "super")
+    git("init", "-q", "-b", "main", superproject)
+
+    config = ["mirror:"]
+    for i, repo in enumerate(upstreams):
+        config.append(f"- url: file://{repo}")
+        config.append("  ref: refs/heads/main")
+        config.append(f"  dir: mirrors/repo{i}")
+    config.append("git_config:")
+    config.append("  user.name: bench")
+    config.append("  user.email: bench@example.com")
+    with open(os.path.join(superproject, ".mirror-tool.yaml"), "wt") as f:
+        f.write("\n".join(config) + "\n")
+
+    git("add", ".mirror-tool.yaml", cwd=superproject)
+    git("commit", "-q", "-m", "add config", cwd=superproject)
+
+    return (superproject, upstreams)
+
+
+def measure(superproject, extra_args):
+    """Run update-local in a new process, returning its measurements."""
+    proc = subprocess.run(
+        [sys.executable, __file__, "--measure", superproject]
+        + ["--args=" + " ".join(extra_args)],
+        env=dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(
+                [ROOT] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+            ),
+        ),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    return json.loads(proc.stdout.decode().splitlines()[-1])
+
+
+def measure_here(superproject, extra_args):
+    """Run update-local in this process, and print its measurements as JSON."""
+    from mirror_tool.cmd import MirrorTool
+
+    started = 0
+    lock = threading.Lock()
+    popen = subprocess.Popen
+
+    class CountingPopen(popen):
+        def __init__(self, *args, **kwargs):
+            nonlocal started
+            with lock:
+                started += 1
+            super().__init__(*args, **kwargs)
+
+    # Everything in mirror-tool starts processes via subprocess.Popen.
+    subprocess.Popen = CountingPopen
+
+    os.chdir(superproject)
+    tool = MirrorTool()
+    tool.args = tool.parser.parse_args(["update-local"] + extra_args)
+
+    start = time.perf_counter()
+    try:
+        updates = tool.update_local()
+    finally:
+        tool.git.close()
+    wall = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "wall_s": wall,
+                "subprocesses": started,
+                # ru_maxrss is in KiB on Linux.
+                "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "peak_child_rss_kib": resource.getrusage(
+                    resource.RUSAGE_CHILDREN
+                ).ru_maxrss,
+                "updated": len(updates),
+            }
+        )
+    )
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mirrors", type=int_list, default=[1, 10, 50])
+    parser.add_argument("--depth", type=int_list, default=[20], help="commits")
+    parser.add_argument("--files", type=int_list, default=[10], help="per mirror")
+    parser.add_argument(
+        "--commits", type=int_list, default=[1, 10], help="new commits per update"
+    )
+    parser.add_argument("--args", default="", help="extra arguments for update-local")
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    extra_args = args.args.split()
+
+    if args.measure:
+        measure_here(args.measure, extra_args)
+        return
+
+    results = []
+    print(
+        "%7s %6s %6s %7s  %-11s %9s %6s %9s %9s"
+        % (
+            "mirrors",
+            "depth",
+            "files",
+            "commits",
+            "phase",
+            "wall (s)",
+            "procs",
+            "RSS (MiB)",
+            "git (MiB)",
+        )
+    )
+    for mirrors, depth, files, commits in itertools.product(
+        args.mirrors, args.depth, args.files, args.commits
+    ):
+        with tempfile.TemporaryDirectory() as workdir:
+            (superproject, upstreams) = make_superproject(
+                workdir, mirrors, depth, files
+            )
+
+            phases = [("initial", measure(superproject, extra_args))]
+            for repo in upstreams:
+                add_commits(repo, commits, files, first=depth)
+            phases.append(("incremental", measure(superproject, extra_args)))
+
+        for phase, result in phases:
+            result.update(
+                mirrors=mirrors, depth=depth, files=files, commits=commits, phase=phase
+            )
+            results.append(result)
+            print(
+                "%7d %6d %6d %7d  %-11s %9.2f %6d %9.1f %9.1f"
+                % (
+                    mirrors,
+                    depth,
+                    files,
+                    commits,
+                    phase,
+                    result["wall_s"],
+                    result["subprocesses"],
+                    result["peak_rss_kib"] / 1024,
+                    result["peak_child_rss_kib"] / 1024,
+                )
+            )
+
+    if args.json:
+        with open(args.json, "wt") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
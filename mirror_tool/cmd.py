@@ -4,21 +4,22 @@ import logging
 import os
 import subprocess
 import sys
-from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-import jinja2
-from jsonschema.exceptions import ValidationError
-
 from .conf import Config, Mirror
+from .fetch import Fetcher, upstream_ref
 from .git_config import environ_with_git_config
-from .git_info import UpdateInfo, get_update_info
-from .gitlab import (
-    GitlabPromoteSession,
-    GitlabUpdateSession,
-    render_ci_template_from_config,
+from .git_info import (
+    UpdateInfo,
+    get_update_info,
+    graft_tree,
+    merged_mirrors,
+    upstream_trailer,
 )
-from .jinja import jinja_args
+from .git_session import GitSession
+from .jinja import dataclass_args, jinja_bytecode_cache, jinja_render
+from .object_cache import ObjectCache
 
 LOG = logging.getLogger("mirror-tool")
 
@@ -36,6 +37,9 @@ class MirrorTool:
     def __init__(self):
         self.args: Optional[argparse.Namespace] = None
         self._config: Optional[Config] = None
+        self._fetcher: Optional[Fetcher] = None
+        self._git: Optional[GitSession] = None
+        self._git_env: Optional[dict[str, str]] = None
 
     @property
     def parser(self) -> argparse.ArgumentParser:
@@ -49,6 +53,34 @@ class MirrorTool:
             default=".mirror-tool.yaml",
             help="Path to configuration file for mirror-tool",
         )
+        parser.add_argument(
+            "--cache-dir",
+            type=str,
+            default=os.environ.get("MIRROR_TOOL_CACHE_DIR") or None,
+            help=(
+                "Directory for data kept across runs, such as fetched objects "
+                "(default: $MIRROR_TOOL_CACHE_DIR; if unset, nothing is cached)"
+            ),
+        )
+        parser.add_argument(
+            "--cache-max-size",
+            type=int,
+            default=int(os.environ.get("MIRROR_TOOL_CACHE_MAX_SIZE") or "2048"),
+            help=(
+                "Approximate maximum size in MiB of the objects kept in "
+                "--cache-dir (default: $MIRROR_TOOL_CACHE_MAX_SIZE, or 2048)"
+            ),
+        )
+        parser.add_argument(
+            "--git-backend",
+            choices=["cli", "pygit2"],
+            default=os.environ.get("MIRROR_TOOL_GIT_BACKEND") or "cli",
+            help=(
+                "Implementation used for read-only git queries; 'pygit2' "
+                "requires the optional pygit2 dependency "
+                "(default: $MIRROR_TOOL_GIT_BACKEND, or cli)"
+            ),
+        )
         subparsers = parser.add_subparsers()
 
         validate_config = subparsers.add_parser(
@@ -71,6 +103,15 @@ class MirrorTool:
         add_dryrun(update)
         update.set_defaults(func=self.update)
 
+        prefetch = subparsers.add_parser(
+            "prefetch",
+            help=(
+                "Fetch all mirrors without updating anything, "
+                "for use by a later update with --no-fetch"
+            ),
+        )
+        prefetch.set_defaults(func=self.prefetch)
+
         for p in (update_local, update):
             p.add_argument(
                 "--allow-empty",
@@ -81,6 +122,26 @@ class MirrorTool:
                     "updates; primarily for testing purposes"
                 ),
             )
+            p.add_argument(
+                "--no-fetch",
+                action="store_true",
+                default=False,
+                help=(
+                    "Don't fetch mirrors; use the revisions fetched by an "
+                    "earlier prefetch command"
+                ),
+            )
+            p.add_argument(
+                "--no-checkout",
+                action="store_true",
+                default=False,
+                help=(
+                    "Create update commits without using the index or working "
+                    "tree, which are left as is; works in a bare repository"
+                ),
+            )
+
+        for p in (update_local, update, prefetch):
             p.add_argument(
                 "--skip",
                 action="append",
@@ -108,7 +169,9 @@ class MirrorTool:
     @property
     def config(self) -> Config:
         if not self._config:
-            self._config = Config.from_file(self.args.conf)
+            self._config = Config.from_file(
+                self.args.conf, cache_dir=self.cache_subdir("config")
+            )
         return self._config
 
     @property
@@ -118,32 +181,72 @@ class MirrorTool:
             out.extend(arg.split(","))
         return out
 
+    @property
+    def object_cache(self) -> Optional[ObjectCache]:
+        if not self.args.cache_dir:
+            return None
+        return ObjectCache(
+            os.path.join(self.args.cache_dir, "git"),
+            max_size_mb=self.args.cache_max_size,
+            run_cmd=self.run_git_cmd,
+        )
+
+    def cache_subdir(self, name: str) -> Optional[str]:
+        if not self.args.cache_dir:
+            return None
+        return os.path.join(self.args.cache_dir, name)
+
     def run_cmd(
-        self, args, check=True, silent=False, env=None, capture_output=None
+        self, args, check=True, silent=False, env=None, capture_output=None, input=None
     ) -> subprocess.CompletedProcess:
         if not silent:
             LOG.info("+ %s" % " ".join(args))
-        return subprocess.run(args, check=check, env=env, capture_output=capture_output)
+        return subprocess.run(
+            args, check=check, env=env, capture_output=capture_output, input=input
+        )
+
+    @property
+    def git_env(self) -> dict[str, str]:
+        # Built once per run rather than copying the environment per command.
+        if self._git_env is None:
+            self._git_env = environ_with_git_config(self.config.git_config, os.environ)
+        return self._git_env
+
+    @property
+    def git(self) -> GitSession:
+        if self._git:
+            return self._git
+
+        if self.args.git_backend == "pygit2":
+            try:
+                from .git_pygit2 import Pygit2Session
+            except ImportError:
+                LOG.error("pygit2 must be installed to use --git-backend=pygit2.")
+                sys.exit(82)
+            self._git = Pygit2Session(env=self.git_env)
+        else:
+            self._git = GitSession(env=self.git_env)
+
+        return self._git
 
     def run_git_cmd(self, *args, **kwargs):
-        kwargs["env"] = environ_with_git_config(self.config.git_config, os.environ)
+        kwargs["env"] = self.git_env
         return self.run_cmd(*args, **kwargs)
 
     def commitmsg_for_update(self, update: UpdateInfo) -> str:
-        jinja_env = jinja2.Environment(
-            loader=jinja2.DictLoader({"commitmsg": self.config.commitmsg})
-        )
-        return jinja_env.get_template("commitmsg").render(jinja_args(**asdict(update)))
+        return jinja_render(self.config.commitmsg, **dataclass_args(update))
+
+    def commitmsg_for_updates(self, updates: list[UpdateInfo]) -> str:
+        return jinja_render(self.config.commitmsg_combined, updates=updates)
 
     def update_local_mirror(self, mirror: Mirror) -> UpdateInfo:
-        self.run_git_cmd(
-            ["git", "fetch", mirror.url, f"+{mirror.ref}:refs/mirror-tool/to-merge"]
-        )
+        # Upstream must have already been fetched by Fetcher.
+        to_merge = upstream_ref(mirror)
 
-        revision = subprocess.check_output(
-            ["git", "rev-parse", "refs/mirror-tool/to-merge"], text=True
-        ).strip()
-        update_info = get_update_info(rev_from="HEAD", rev_to=revision, mirror=mirror)
+        (revision,) = self.git.resolve([to_merge])
+        update_info = get_update_info(
+            rev_from="HEAD", rev_to=revision, mirror=mirror, git=self.git
+        )
 
         self.run_git_cmd(
             [
@@ -153,7 +256,7 @@ class MirrorTool:
                 "ours",
                 "--no-commit",
                 "--allow-unrelated-histories",
-                "refs/mirror-tool/to-merge",
+                revision,
             ]
         )
 
@@ -168,13 +271,31 @@ class MirrorTool:
                 "read-tree",
                 f"--prefix={mirror.dir}/",
                 "-u",
-                "refs/mirror-tool/to-merge",
+                revision,
             ]
         )
 
+        if not update_info.changed:
+            # The upstream commits may all be present already, e.g. if another
+            # mirror of the same upstream was just updated, while the content
+            # of this mirror's dir has nevertheless changed.
+            update_info.changed = (
+                self.run_git_cmd(
+                    ["git", "diff", "--cached", "--quiet"], check=False
+                ).returncode
+                != 0
+            )
+
         if update_info.changed or self.args.allow_empty:
             commitmsg = self.commitmsg_for_update(update_info)
-            commit_cmd = ["git", "commit", "-m", commitmsg]
+            commit_cmd = [
+                "git",
+                "commit",
+                "-m",
+                commitmsg,
+                "--trailer",
+                upstream_trailer(mirror, revision),
+            ]
             if self.args.allow_empty:
                 commit_cmd.append("--allow-empty")
 
@@ -182,16 +303,238 @@ class MirrorTool:
 
         return update_info
 
-    def update_local(self) -> list[UpdateInfo]:
-        cfg = self.config
+    def update_local_tree(self, mirrors: list[Mirror]) -> list[UpdateInfo]:
+        """Update mirrors with the same commits as update_local_mirror, but
+        built directly from tree objects, without using the index or working tree.
+
+        HEAD is only updated once all commits have been created.
+        """
+        (base,) = self.git.resolve(["HEAD"])
+        head = base
 
         updates = []
+        for mirror in mirrors:
+            # Upstream must have already been fetched by Fetcher.
+            (revision, upstream_tree, head_tree) = self.git.resolve(
+                [
+                    upstream_ref(mirror),
+                    f"{upstream_ref(mirror)}^{{tree}}",
+                    f"{head}^{{tree}}",
+                ]
+            )
+            update_info = get_update_info(
+                rev_from=head, rev_to=revision, mirror=mirror, git=self.git
+            )
+
+            tree = graft_tree(head, mirror.dir, upstream_tree, git=self.git)
+
+            if not update_info.changed:
+                update_info.changed = tree != head_tree
+
+            if update_info.changed or self.args.allow_empty:
+                # As with git merge, an upstream revision already merged (e.g.
+                # by another mirror of the same upstream) isn't a new parent.
+                parents = [head]
+                if not self.git.is_ancestor(revision, head):
+                    parents.append(revision)
+
+                head = self.commit_tree(
+                    tree,
+                    parents,
+                    self.commitmsg_for_update(update_info),
+                    [upstream_trailer(mirror, revision)],
+                )
+
+            updates.append(update_info)
+
+        if head != base:
+            self.set_head(head, base, "mirror-tool: update mirrors")
+
+        return updates
+
+    def commit_tree(
+        self, tree: str, parents: list[str], message: str, trailers: list[str]
+    ) -> str:
+        # The message is given the same trailer handling and cleanup as by
+        # 'git commit -m <message> --trailer <trailer>', so that commits are
+        # identical to those made via the index.
+        if not message.endswith("\n"):
+            message += "\n"
+        cmd = ["git", "interpret-trailers"]
+        for trailer in trailers:
+            cmd.extend(["--trailer", trailer])
+        message_bytes = self.run_git_cmd(
+            cmd, input=message.encode("utf-8"), capture_output=True, silent=True
+        ).stdout
+        message_bytes = self.run_git_cmd(
+            ["git", "stripspace"],
+            input=message_bytes,
+            capture_output=True,
+            silent=True,
+        ).stdout
+
+        cmd = ["git", "commit-tree", tree]
+        for parent in parents:
+            cmd.extend(["-p", parent])
+        cmd.extend(["-F", "-"])
+        return (
+            self.run_git_cmd(cmd, input=message_bytes, capture_output=True)
+            .stdout.decode("utf-8")
+            .strip()
+        )
+
+    def set_head(self, commit: str, old_head: str, reason: str):
+        if self.args.no_checkout:
+            self.run_git_cmd(
+                ["git", "update-ref", "-m", reason, "HEAD", commit, old_head]
+            )
+        else:
+            # Only files which differ between the old and new HEAD are updated.
+            self.run_git_cmd(["git", "reset", "--quiet", "--keep", commit])
+
+    def update_local_combined(self, mirrors: list[Mirror]) -> list[UpdateInfo]:
+        """Update all mirrors by a single merge commit, having the upstream
+        revision of each updated mirror as a parent."""
+        (head, tree) = self.git.resolve(["HEAD", "HEAD^{tree}"])
+
+        updates: list[tuple[UpdateInfo, str]] = []
+        for mirror in mirrors:
+            # Upstream must have already been fetched by Fetcher.
+            (revision, upstream_tree) = self.git.resolve(
+                [upstream_ref(mirror), f"{upstream_ref(mirror)}^{{tree}}"]
+            )
+            update_info = get_update_info(
+                rev_from="HEAD", rev_to=revision, mirror=mirror, git=self.git
+            )
+
+            new_tree = graft_tree(tree, mirror.dir, upstream_tree, git=self.git)
+            update_info.changed = update_info.changed or new_tree != tree
+            tree = new_tree
+
+            updates.append((update_info, revision))
+
+        merged = [(u, revision) for (u, revision) in updates if u.changed]
+        if not merged and self.args.allow_empty:
+            merged = updates
 
-        for mirror in cfg.mirrors:
+        if merged:
+            parents = [head]
+            for _, revision in merged:
+                if revision not in parents and not self.git.is_ancestor(revision, head):
+                    parents.append(revision)
+
+            commit = self.commit_tree(
+                tree,
+                parents,
+                self.commitmsg_for_updates([u for (u, _) in merged]),
+                [upstream_trailer(u.mirror, r) for (u, r) in merged],
+            )
+            self.set_head(commit, head, f"mirror-tool: update {len(merged)} mirror(s)")
+
+        return [u for (u, _) in updates]
+
+    @property
+    def mirrors(self) -> list[Mirror]:
+        """Configured mirrors, excluding any skipped by command-line arguments."""
+        out = []
+        for mirror in self.config.mirrors:
             if mirror.dir in self.skip:
                 LOG.info("Skipping update of %s", mirror.dir)
                 continue
-            updates.append(self.update_local_mirror(mirror))
+            out.append(mirror)
+        return out
+
+    @property
+    def fetcher(self) -> Fetcher:
+        if not self._fetcher:
+            self._fetcher = Fetcher(
+                self.config.fetch, run_cmd=self.run_git_cmd, cache=self.object_cache
+            )
+        return self._fetcher
+
+    def changed_mirrors(self, mirrors: list[Mirror]) -> list[Mirror]:
+        """Returns those of 'mirrors' which may have changed upstream.
+
+        This is determined without fetching, by comparing the revisions
+        currently advertised by each upstream with HEAD.
+        """
+        revisions = self.fetcher.remote_revisions(mirrors)
+        unchanged = merged_mirrors(
+            [
+                (m, revisions[(m.url, m.ref)])
+                for m in mirrors
+                if (m.url, m.ref) in revisions
+            ],
+            git=self.git,
+            cache_dir=self.cache_subdir("git-info"),
+        )
+
+        out = []
+        for mirror in mirrors:
+            if mirror in unchanged:
+                LOG.info("%s is already up-to-date.", mirror.dir)
+                continue
+            out.append(mirror)
+        return out
+
+    def ensure_fetched(self, mirrors: list[Mirror]):
+        fetched = (
+            self.run_git_cmd(
+                [
+                    "git",
+                    "for-each-ref",
+                    "--format=%(refname)",
+                    "refs/mirror-tool/upstream/",
+                ],
+                capture_output=True,
+                silent=True,
+            )
+            .stdout.decode("utf-8")
+            .split()
+        )
+
+        missing = [m.dir for m in mirrors if upstream_ref(m) not in fetched]
+        if missing:
+            LOG.error(
+                "Mirror(s) have not been fetched: %s (try `prefetch').",
+                ", ".join(missing),
+            )
+            sys.exit(81)
+
+    def prefetch(self):
+        self.fetcher.fetch_all(self.mirrors)
+
+        LOG.info("Mirror(s) fetched.")
+
+    def update_local(self) -> list[UpdateInfo]:
+        mirrors = self.mirrors
+
+        # Unless asked to create commits regardless, there's nothing to do
+        # for mirrors which haven't changed since the last update.
+        if (
+            self.config.fetch.probe
+            and not self.args.no_fetch
+            and not self.args.allow_empty
+        ):
+            mirrors = self.changed_mirrors(mirrors)
+
+        # Fetch everything up front, concurrently. The updates themselves are
+        # then applied one at a time in config order, so the resulting history
+        # doesn't depend on the order in which fetches complete.
+        self.fetcher.fetch_all(mirrors, remote=not self.args.no_fetch)
+        if self.args.no_fetch:
+            self.ensure_fetched(mirrors)
+
+        # git caches refs, so any process started before fetching may not
+        # see the fetched refs.
+        self.git.close()
+
+        if self.config.combine_commits:
+            updates = self.update_local_combined(mirrors)
+        elif self.args.no_checkout:
+            updates = self.update_local_tree(mirrors)
+        else:
+            updates = [self.update_local_mirror(mirror) for mirror in mirrors]
 
         LOG.info("Mirror(s) locally updated.")
 
@@ -204,37 +547,84 @@ class MirrorTool:
             LOG.info("No remote targets are enabled for update.")
             return
 
+        from .gitlab import GitlabUpdateSession
+
         gitlab = GitlabUpdateSession(
             self.config.gitlab_merge,
             run_cmd=self.run_cmd,
             updates=updates,
             dry_run=self.args.dry_run,
+            cache_dir=self.cache_subdir("gitlab"),
         )
-        gitlab.ensure_merge_request_exists()
+        try:
+            gitlab.ensure_merge_request_exists()
+            gitlab.log_stats()
+        finally:
+            gitlab.close()
 
     def promote(self):
         if not self.config.gitlab_promote:
             LOG.info("No remote targets have any promotion rules.")
             return
 
-        for promote in self.config.gitlab_promote:
-            LOG.info("Checking %s => %s promotion...", promote.src, promote.dest)
-            gitlab = GitlabPromoteSession(
-                promote, run_cmd=self.run_cmd, dry_run=self.args.dry_run
+        from requests.adapters import HTTPAdapter
+
+        from .gitlab import BACKGROUND_JOBS, GitlabPromoteSession
+
+        # All rules share one connection pool.
+        adapter = HTTPAdapter()
+        sessions = [
+            GitlabPromoteSession(
+                promote,
+                run_cmd=self.run_cmd,
+                dry_run=self.args.dry_run,
+                cache_dir=self.cache_subdir("gitlab"),
+                adapter=adapter,
             )
-            gitlab.ensure_promotion_merge_request_exists()
+            for promote in self.config.gitlab_promote
+        ]
+
+        def promote_one(session: "GitlabPromoteSession"):
+            promote = session.gitlab_promote
+            LOG.info("Checking %s => %s promotion...", promote.src, promote.dest)
+            try:
+                session.ensure_promotion_merge_request_exists()
+            finally:
+                session.log_stats()
+                session.close()
+
+        # Rules are independent, so they're all processed even if some fail.
+        failed = 0
+        with ThreadPoolExecutor(max_workers=BACKGROUND_JOBS) as executor:
+            futures = [executor.submit(promote_one, s) for s in sessions]
+            for session, future in zip(sessions, futures):
+                promote = session.gitlab_promote
+                try:
+                    future.result()
+                except Exception:
+                    LOG.exception(
+                        "%s => %s promotion failed.", promote.src, promote.dest
+                    )
+                    failed += 1
+                else:
+                    LOG.info("%s => %s promotion done.", promote.src, promote.dest)
+
+        if failed:
+            LOG.error("%s of %s promotion(s) failed.", failed, len(sessions))
+            sys.exit(83)
 
     def gitlab_ci_yml(self):
         if not self.config.gitlab_merge.enabled:
             LOG.info("GitLab features are not enabled in config.")
             return
 
+        from .gitlab import render_ci_template_from_config
+
         print(render_ci_template_from_config(self.config))
 
     def validate_config(self):
-        try:
-            self.config.validate()
-        except ValidationError as ex:
+        errors = self.config.validation_errors()
+        for ex in errors:
             LOG.error(
                 "%s: configuration error\n  Path: %s\n  Object: %s\n  Cause: %s",
                 self.args.conf,
@@ -242,6 +632,8 @@ class MirrorTool:
                 ex.instance,
                 ex.message,
             )
+        if errors:
+            LOG.error("%s: %s configuration error(s)", self.args.conf, len(errors))
             sys.exit(80)
 
         LOG.info(
@@ -258,7 +650,14 @@ class MirrorTool:
         logging.basicConfig(level=logging.WARNING, format="%(message)s")
         LOG.setLevel(logging.INFO)
         self.args = self.parser.parse_args(args)
-        self.args.func()
+        jinja_bytecode_cache(self.cache_subdir("jinja"))
+        try:
+            self.args.func()
+        finally:
+            if self._git:
+                self._git.close()
+            if self._fetcher:
+                self._fetcher.close()
 
 
 def entrypoint():
@@ -1,15 +1,26 @@
 import datetime
+import hashlib
+import json
+import logging
 import os
-from dataclasses import asdict, dataclass, field
-from typing import Any, Dict, List
-
-import jsonschema
-from ruamel.yaml import YAML
+from dataclasses import dataclass, field
+from functools import cache, cached_property
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
+from .file_cache import load_json, prune_cache, touch, write_atomic
 from .git_info import Commit, UpdateInfo
-from .jinja import jinja_validate
+from .jinja import dataclass_args, jinja_validate
 from .shared import Mirror
 
+if TYPE_CHECKING:  # pragma: no cover
+    from jsonschema.exceptions import ValidationError
+
+LOG = logging.getLogger("mirror-tool")
+
+# Maximum number of parsed configs kept in a cache dir, e.g. for several
+# branches sharing a cache.
+CONFIG_CACHE_LIMIT = 10
+
 CONFIG_SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
     "definitions": {
@@ -83,24 +94,66 @@ CONFIG_SCHEMA = {
             "items": {"$ref": "#/definitions/gitlabMerge"},
         },
         "git_config": {"type": "object"},
+        "fetch": {
+            "type": "object",
+            "properties": {
+                "jobs": {"type": "integer", "minimum": 1, "maximum": 100},
+                "jobs_per_host": {"type": "integer", "minimum": 1, "maximum": 100},
+                "probe": {"type": "boolean"},
+            },
+            "additionalProperties": False,
+        },
         "commitmsg": {
             "type": "string",
             "minLength": 1,
             "maxLength": 8000,
         },
+        "combine_commits": {"type": "boolean"},
+        "commitmsg_combined": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 8000,
+        },
     },
     "required": [],
     "additionalProperties": False,
 }
 
 
-@dataclass
+@cache
+def config_validator():
+    """Returns a validator for CONFIG_SCHEMA.
+
+    It's built once rather than on each validation, as the schema never
+    changes. The schema itself is checked by the tests.
+    """
+    # jsonschema is imported only when validating, as it's comparatively slow
+    # to import and most commands don't need it.
+    import jsonschema
+
+    return jsonschema.validators.validator_for(CONFIG_SCHEMA)(CONFIG_SCHEMA)
+
+
+@dataclass(frozen=True, slots=True)
+class FetchConfig:
+    jobs: int = 4
+    """Maximum number of fetches to run concurrently."""
+
+    jobs_per_host: int = 2
+    """Maximum number of fetches to run concurrently against any single host."""
+
+    probe: bool = True
+    """If True, mirrors are checked for changes before fetching, and unchanged
+    mirrors are not fetched or updated."""
+
+
+@dataclass(frozen=True, slots=True)
 class GitlabMergeComments:
     create: str = ""
     update: str = ""
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GitlabCommon:
     src: str = "latest"
     dest: str = "main"
@@ -153,12 +206,12 @@ class GitlabCommon:
         return "".join(["https://", "token:", self.token_final, "@", url_noscheme])
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GitlabMerge(GitlabCommon):
     enabled: bool = False
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GitlabPromote(GitlabCommon):
     title: str = "Promote changes"
     description: str = "Automated promotion between branches."
@@ -311,19 +364,32 @@ VALIDATE_MERGEREQUEST = {
 }
 
 
+def parse_yaml(content: bytes) -> Any:
+    # ruamel.yaml is imported only when parsing, as it's comparatively slow to
+    # import and parsing is often avoided by the cache.
+    from ruamel.yaml import YAML
+
+    return YAML(typ="safe").load(content)
+
+
 class Config:
+    """The configuration of mirror-tool.
+
+    Each part of the config is built from the raw config once, when first used.
+    """
+
     def __init__(self, raw):
         self._raw = raw
 
-    @property
+    @cached_property
     def gitlab_merge(self) -> GitlabMerge:
         raw = (self._raw.get("gitlab_merge") or {}).copy()
         raw_comment = raw.get("comment") or {}
         raw["comment"] = GitlabMergeComments(**raw_comment)
         return GitlabMerge(**raw)
 
-    @property
-    def gitlab_promote(self) -> List[GitlabPromote]:
+    @cached_property
+    def gitlab_promote(self) -> Tuple[GitlabPromote, ...]:
         out = []
         raw = self._raw.get("gitlab_promote") or []
         for elem in raw:
@@ -331,18 +397,19 @@ class Config:
             raw_comment = elem.get("comment") or {}
             elem["comment"] = GitlabMergeComments(**raw_comment)
             out.append(GitlabPromote(**elem))
-        return out
+        return tuple(out)
 
     @property
     def git_config(self) -> Dict[str, Any]:
         return self._raw.get("git_config") or {}
 
-    @property
-    def mirrors(self) -> List[Mirror]:
-        out = []
-        for elem in self._raw.get("mirror") or []:
-            out.append(Mirror(**elem))
-        return out
+    @cached_property
+    def fetch(self) -> FetchConfig:
+        return FetchConfig(**(self._raw.get("fetch") or {}))
+
+    @cached_property
+    def mirrors(self) -> Tuple[Mirror, ...]:
+        return tuple(Mirror(**elem) for elem in self._raw.get("mirror") or [])
 
     @property
     def commitmsg(self) -> str:
@@ -351,24 +418,64 @@ class Config:
             or "merging {{mirror.dir}} at {{datetime_minute}}"
         )
 
-    def validate(self) -> None:
-        jsonschema.validate(self._raw, CONFIG_SCHEMA)
-
-        mirror_dirs = {mirror.dir for mirror in self.mirrors}
-        if len(mirror_dirs) != len(self.mirrors):
-            raise jsonschema.ValidationError(
-                message="Multiple mirrors defined using same dir",
-                path=["mirror"],
-                instance=self.mirrors,
-            )
+    @property
+    def combine_commits(self) -> bool:
+        return bool(self._raw.get("combine_commits"))
+
+    @property
+    def commitmsg_combined(self) -> str:
+        return (
+            self._raw.get("commitmsg_combined")
+            or "merging {{updates|map(attribute='mirror.dir')|join(', ')}} "
+            "at {{datetime_minute}}"
+        )
 
-        self.jinja_validate_all()
+    def validate(self) -> None:
+        """Raise a ValidationError if the config is invalid.
+
+        See validation_errors for a method reporting every error.
+        """
+        for error in self.validation_errors():
+            raise error
+
+    def validation_errors(self) -> List["ValidationError"]:
+        """Returns all errors found in the config, in one pass over it."""
+        from jsonschema.exceptions import ValidationError, best_match
+
+        # Each error is narrowed to its most relevant cause, as would be
+        # raised by jsonschema.validate.
+        errors = [
+            best_match([error]) for error in config_validator().iter_errors(self._raw)
+        ]
+        if errors:
+            # The rest of the checks rely on the config matching the schema.
+            return errors
+
+        mirror_dirs = set()
+        for i, mirror in enumerate(self.mirrors):
+            if mirror.dir in mirror_dirs:
+                errors.append(
+                    ValidationError(
+                        message="Multiple mirrors defined using same dir",
+                        path=["mirror", i],
+                        instance=mirror.dir,
+                    )
+                )
+            mirror_dirs.add(mirror.dir)
+
+        errors.extend(self.jinja_validate_all())
+        return errors
+
+    def jinja_validate_all(self) -> List["ValidationError"]:
+        from jsonschema.exceptions import ValidationError
 
-    def jinja_validate_all(self):
         updates = [VALIDATE_UPDATEINFO, VALIDATE_UPDATEINFO]
         jinja_templates = []
         jinja_templates.append(
-            (["commitmsg"], self.commitmsg, asdict(VALIDATE_UPDATEINFO))
+            (["commitmsg"], self.commitmsg, dataclass_args(VALIDATE_UPDATEINFO))
+        )
+        jinja_templates.append(
+            (["commitmsg_combined"], self.commitmsg_combined, {"updates": updates})
         )
 
         def append_gitlab_common(base_path, instance, **kwargs):
@@ -393,14 +500,21 @@ class Config:
             base_path = ["gitlab_promote", i]
             append_gitlab_common(base_path, elem, src_mr=VALIDATE_MERGEREQUEST)
 
+        errors = []
         for path, template, kwargs in jinja_templates:
-            self.jinja_validate(template, path, **kwargs)
+            try:
+                self.jinja_validate(template, path, **kwargs)
+            except ValidationError as exc:
+                errors.append(exc)
+        return errors
 
     def jinja_validate(self, template, path, **kwargs):
+        from jsonschema.exceptions import ValidationError
+
         try:
             jinja_validate(template, **kwargs)
         except Exception as exc:
-            raise jsonschema.ValidationError(
+            raise ValidationError(
                 message="Invalid Jinja template: %s" % str(exc),
                 path=path,
                 instance="<jinja template starting: %r...>" % (template[:50]),
@@ -408,7 +522,40 @@ class Config:
             )
 
     @classmethod
-    def from_file(cls, filename=".mirror-tool.yaml") -> "Config":
-        with open(filename, "rt") as f:
-            raw = YAML(typ="safe").load(f)
+    def from_file(
+        cls, filename=".mirror-tool.yaml", cache_dir: Optional[str] = None
+    ) -> "Config":
+        """Load config from a YAML file.
+
+        If 'cache_dir' is set, the parsed config is kept in that directory and
+        reused while the file's content is unchanged, avoiding parsing YAML.
+        Only the CONFIG_CACHE_LIMIT most recently used configs are kept.
+        """
+        with open(filename, "rb") as f:
+            content = f.read()
+
+        if not cache_dir:
+            return cls(parse_yaml(content))
+
+        cache_path = os.path.join(
+            cache_dir, hashlib.sha256(content).hexdigest() + ".json"
+        )
+        cached_raw = load_json(cache_path)
+        if cached_raw is not None:
+            touch(cache_path)
+            return cls(cached_raw)
+
+        raw = parse_yaml(content)
+
+        # Only configs surviving a round trip through JSON can be cached.
+        try:
+            cached = json.dumps(raw)
+        except TypeError:
+            return cls(raw)
+        if json.loads(cached) != raw:
+            return cls(raw)
+
+        write_atomic(cache_path, cached)
+        prune_cache(cache_dir, CONFIG_CACHE_LIMIT, ".json")
+
         return cls(raw)
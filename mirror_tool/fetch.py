@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+from .conf import FetchConfig
+from .object_cache import ObjectCache
+from .shared import Mirror
+
+LOG = logging.getLogger("mirror-tool")
+
+RunCmd = Callable[..., subprocess.CompletedProcess]
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def url_host(url: str) -> str:
+    """Returns the host from a git remote URL, or "" if the URL refers to
+    a local path."""
+    if "://" in url:
+        return urlsplit(url).hostname or ""
+
+    # scp-like syntax: [user@]host:path
+    (head, sep, _) = url.partition(":")
+    if sep and "/" not in head:
+        return head.rpartition("@")[2]
+
+    return ""
+
+
+def upstream_ref(mirror: Mirror) -> str:
+    """Returns the local ref into which the upstream of 'mirror' is fetched.
+
+    Mirrors using the same url and ref share a single local ref.
+    """
+    key = hashlib.sha1(f"{mirror.url}\n{mirror.ref}".encode("utf-8")).hexdigest()
+    return f"refs/mirror-tool/upstream/{key}"
+
+
+class Fetcher:
+    """Fetches the upstreams of any number of mirrors concurrently.
+
+    If an ObjectCache is provided, upstreams are fetched into the cache and
+    then from the cache into the current repo.
+    """
+
+    def __init__(
+        self,
+        fetch_config: FetchConfig,
+        run_cmd: RunCmd,
+        cache: Optional[ObjectCache] = None,
+    ):
+        self.fetch_config = fetch_config
+        self.run_cmd = run_cmd
+        self.cache = cache
+
+    def for_each_url(
+        self, fn: Callable[[str, T], R], args: Dict[str, T]
+    ) -> Dict[str, R]:
+        """Call fn(url, arg) for every item in 'args', concurrently within the
+        configured limits.
+
+        Returns a dict mapping each url to the value returned by fn.
+        Raises if any call raises.
+        """
+        # Urls waiting to be processed, by host.
+        pending: Dict[str, Deque[str]] = {}
+        for url in args:
+            pending.setdefault(url_host(url), deque()).append(url)
+
+        running: Dict[str, int] = {host: 0 for host in pending}
+        results: Dict[str, R] = {}
+        errors: Dict[str, Exception] = {}
+        cond = threading.Condition()
+
+        def next_url() -> Optional[str]:
+            # Picks a url from the least busy host which is below its limit,
+            # waiting only if every host with pending urls is at its limit.
+            with cond:
+                while True:
+                    hosts = [host for host in pending if pending[host]]
+                    if not hosts:
+                        return None
+                    host = min(hosts, key=lambda h: running[h])
+                    if running[host] < self.fetch_config.jobs_per_host:
+                        running[host] += 1
+                        return pending[host].popleft()
+                    cond.wait()
+
+        def worker() -> None:
+            while True:
+                url = next_url()
+                if url is None:
+                    return
+                try:
+                    results[url] = fn(url, args[url])
+                except Exception as exc:
+                    errors[url] = exc
+                with cond:
+                    running[url_host(url)] -= 1
+                    cond.notify_all()
+
+        jobs = min(self.fetch_config.jobs, len(args))
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            for future in [executor.submit(worker) for _ in range(jobs)]:
+                future.result()
+
+        # Propagate the first error, if any.
+        for url in args:
+            if url in errors:
+                raise errors[url]
+        return {url: results[url] for url in args}
+
+    def close(self) -> None:
+        """Stop using the object cache, if any.
+
+        The current repo is detached from the cache first, so that it doesn't
+        depend on objects which may later be evicted.
+        """
+        if self.cache:
+            self.cache.detach()
+            self.cache.close()
+
+    def fetch_url(self, url: str, refspecs: Dict[str, str]) -> None:
+        fetch_args = ["fetch", "--no-write-fetch-head", url] + list(refspecs.values())
+
+        if not self.cache:
+            self.run_cmd(["git"] + fetch_args)
+            return
+
+        with self.cache.url_lock(url):
+            self.cache.git(*fetch_args)
+            for local_ref in refspecs:
+                self.cache.touch(local_ref)
+
+    def ls_remote_url(self, url: str, refs: List[str]) -> Dict[str, str]:
+        output = self.run_cmd(
+            ["git", "ls-remote", url] + refs, capture_output=True
+        ).stdout.decode("utf-8")
+
+        out = {}
+        for line in output.splitlines():
+            (revision, _, name) = line.partition("\t")
+            # Patterns passed to ls-remote also match partial ref names, so
+            # only exact matches are used here.
+            if name in refs:
+                out[name] = revision
+        return out
+
+    def remote_revisions(self, mirrors: List[Mirror]) -> Dict[Tuple[str, str], str]:
+        """Look up the current upstream revision of each mirror without fetching.
+
+        Returns a dict mapping (url, ref) to revisions. Mirrors whose ref could
+        not be unambiguously resolved are omitted.
+        """
+        refs: Dict[str, List[str]] = {}
+        for mirror in mirrors:
+            # ls-remote can only resolve full ref names exactly.
+            if mirror.ref.startswith("refs/") or mirror.ref == "HEAD":
+                url_refs = refs.setdefault(mirror.url, [])
+                if mirror.ref not in url_refs:
+                    url_refs.append(mirror.ref)
+
+        out = {}
+        for url, revisions in self.for_each_url(self.ls_remote_url, refs).items():
+            for ref, revision in revisions.items():
+                out[(url, ref)] = revision
+        return out
+
+    def fetch_from_cache(self, local_refs: List[str]) -> None:
+        # All objects are already in the cache, so this only updates refs.
+        self.cache.attach()
+        self.run_cmd(
+            ["git", "fetch", "--no-write-fetch-head", self.cache.path]
+            + [f"+{ref}:{ref}" for ref in local_refs]
+        )
+        self.cache.evict(protect=local_refs)
+
+    def fetch_all(self, mirrors: List[Mirror], remote: bool = True) -> None:
+        """Fetch upstreams of all given mirrors.
+
+        Mirrors sharing the same url are fetched by a single command.
+        Once this returns, the upstream of each mirror is available locally
+        at upstream_ref(mirror). Raises if any fetch fails.
+
+        If 'remote' is False, nothing is fetched from the mirrors' urls.
+        Upstreams previously fetched into the object cache, if any, are
+        still made available locally.
+        """
+        if self.cache:
+            self.cache.open()
+
+        refspecs: Dict[str, Dict[str, str]] = {}
+        for mirror in mirrors:
+            local_ref = upstream_ref(mirror)
+            url_refspecs = refspecs.setdefault(mirror.url, {})
+            url_refspecs[local_ref] = f"+{mirror.ref}:{local_ref}"
+
+        if remote:
+            self.for_each_url(self.fetch_url, refspecs)
+
+        if not self.cache:
+            return
+
+        local_refs = [ref for url_refspecs in refspecs.values() for ref in url_refspecs]
+        if not remote:
+            cached_refs = self.cache.refs()
+            local_refs = [ref for ref in local_refs if ref in cached_refs]
+            for ref in local_refs:
+                self.cache.touch(ref)
+
+        if local_refs:
+            self.fetch_from_cache(local_refs)
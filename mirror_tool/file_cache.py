@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Optional
+
+LOG = logging.getLogger("mirror-tool")
+
+
+def load_text(path: str) -> Optional[str]:
+    """Returns the content of the cache file at 'path', or None if it can't
+    be read, e.g. as it doesn't exist."""
+    try:
+        with open(path, "rt") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def load_json(path: str) -> Optional[Any]:
+    """Returns the content of the JSON cache file at 'path', or None if it
+    can't be read or is corrupt."""
+    content = load_text(path)
+    if content is None:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        LOG.debug("Ignoring corrupt cache file %s", path, exc_info=True)
+        return None
+
+
+def write_atomic(path: str, content: str) -> None:
+    """Write 'content' to the cache file at 'path'.
+
+    The file is written and renamed so that concurrent runs never see a
+    partial file. As a cache is only an optimization, failing to write it is
+    logged rather than raised.
+    """
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wt") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        LOG.warning("Failed to write cache file %s: %s", path, exc)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_json(path: str, data: Any) -> None:
+    """Write 'data' as JSON to the cache file at 'path', as by write_atomic."""
+    write_atomic(path, json.dumps(data))
+
+
+def prune_cache(path: str, limit: int, suffix: str = "") -> None:
+    """Removes the least recently used files ending with 'suffix' from the
+    directory at 'path', leaving at most 'limit' of them.
+
+    Files are considered used when written or touched.
+    """
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.endswith(suffix) and not entry.name.endswith(".tmp"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        # Removed by a concurrent run.
+                        pass
+    except OSError as exc:
+        LOG.warning("Failed to prune cache %s: %s", path, exc)
+        return
+
+    entries.sort(reverse=True)
+    for _, entry_path in entries[limit:]:
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
+
+
+def touch(path: str) -> None:
+    """Marks a cache file as recently used, so it's kept by prune_cache."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
@@ -1,99 +1,30 @@
 import logging
 import os
 import subprocess
+from contextlib import closing
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Generator, List
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from .shared import Mirror
+from .file_cache import load_json, store_json
+from .git_session import GitSession
+from .shared import Commit, Mirror
 
 LOG = logging.getLogger("mirror-tool")
 COMMIT_LIMIT = int(os.getenv("MIRROR_TOOL_COMMIT_LIMIT") or "20")
 
+# Maximum number of superproject commits read to find recorded revisions.
+RECORD_LIMIT = int(os.getenv("MIRROR_TOOL_RECORD_LIMIT") or "1000")
 
-class GitParseError(RuntimeError):
-    pass
-
-
-@dataclass
-class Commit:
-    """Contains info on a single commit."""
-
-    revision: str
-    """The commit's revision (SHA1)."""
-
-    revision_abbrev: str
-    """The commit's abbreviated revision."""
-
-    author_name: str
-    """The author's name."""
-
-    author_email: str
-    """The author's email."""
-
-    author_email_local: str
-    """The local part of the author's email (prior to the '@' character)."""
-
-    author_datetime: datetime
-    """The 'author' timestamp."""
-
-    committer_name: str
-    """The committer's name."""
-
-    committer_email: str
-    """The committer's email."""
-
-    committer_email_local: str
-    """The local part of the committer's email (prior to the '@' character)."""
-
-    committer_datetime: datetime
-    """The 'committer' timestamp."""
-
-    subject: str
-    """The subject line from the commit message."""
-
-    body: str = ""
-    """The body of the commit message."""
-
-    url: str = ""
-    """A URL at which this commit can possibly be accessed.
-
-    This value is guessed based on the Git hosting service which appears to be in use
-    for the mirrored repo. It might be wrong or missing in some cases.
-    """
-
-    @classmethod
-    def from_log(cls, log: bytes) -> Generator["Commit", None, None]:
-        # Parse a git log into Commit objects.
-        # Log should be generated by command:
-        # git log --pretty=format:%H%n%h%n%an%n%ae%n%al%n%at%n%cn%n%ce%n%cl%n%ct%n%s%n%b -z
+# Trailer recording the upstream revision merged by each update commit.
+UPSTREAM_TRAILER = "Mirror-Tool-Upstream"
 
-        commit_logs = log.split(b"\x00")
 
-        for commit_log in commit_logs:
-            lines = commit_log.decode("utf-8").splitlines()
-            if not lines:
-                continue
-
-            kwargs = {}
-
-            kwargs["revision"] = lines.pop(0)
-            kwargs["revision_abbrev"] = lines.pop(0)
-            kwargs["author_name"] = lines.pop(0)
-            kwargs["author_email"] = lines.pop(0)
-            kwargs["author_email_local"] = lines.pop(0)
-            kwargs["author_datetime"] = datetime.utcfromtimestamp(int(lines.pop(0)))
-            kwargs["committer_name"] = lines.pop(0)
-            kwargs["committer_email"] = lines.pop(0)
-            kwargs["committer_email_local"] = lines.pop(0)
-            kwargs["committer_datetime"] = datetime.utcfromtimestamp(int(lines.pop(0)))
-            kwargs["subject"] = lines.pop(0)
-            kwargs["body"] = "\n".join(lines)
-
-            yield Commit(**kwargs)
+class GitParseError(RuntimeError):
+    pass
 
 
-@dataclass
+@dataclass(slots=True)
 class UpdateInfo:
     """Contains info on an update for a single mirror."""
 
@@ -134,26 +65,19 @@ def get_update_info(
     mirror: Mirror,
     rev_from: str = "HEAD",
     commit_limit: int = COMMIT_LIMIT,
+    git: Optional[GitSession] = None,
 ) -> UpdateInfo:
-    logs = subprocess.check_output(
-        [
-            "git",
-            "log",
-            "-z",
-            "--pretty=format:%H%n%h%n%an%n%ae%n%al%n%at%n%cn%n%ce%n%cl%n%ct%n%s%n%b",
-            f"{rev_from}..{rev_to}",
-        ],
-        text=False,
-    )
+    git = git or GitSession()
 
-    commits = list(Commit.from_log(logs))
-    add_urls(mirror, commits)
-    count = len(commits)
-    elided = 0
+    # Counting is cheap compared to formatting and parsing the log, which
+    # matters when pulling in a large history (e.g. first import of a mirror).
+    # Hence only the commits which will actually be used are logged.
+    count = git.count_commits(rev_from, rev_to)
 
-    if len(commits) > commit_limit:
-        commits = commits[:commit_limit]
-        elided = count - len(commits)
+    commits = []
+    if count:
+        commits = list(git.log(rev_from, rev_to, commit_limit))
+        add_urls(mirror, commits)
 
     changed = True if count else False
 
@@ -161,6 +85,186 @@ def get_update_info(
         mirror=mirror,
         changed=changed,
         commit_count=count,
-        commit_elided_count=elided,
+        commit_elided_count=count - len(commits),
         commits=commits,
     )
+
+
+def graft_tree(rev: str, path: str, tree: str, git: Optional[GitSession] = None) -> str:
+    """Returns a tree equal to the tree of 'rev', but with the subtree at 'path'
+    replaced by 'tree'. New tree objects are written as needed.
+
+    Only the trees along 'path' are rewritten, so the cost of this does not
+    depend on the number of files in the repo. No index or working tree is
+    used.
+    """
+    git = git or GitSession()
+    parts = [p for p in path.split("/") if p not in ("", ".")]
+
+    # Work upwards from the mirror dir to the top-level tree.
+    for i in reversed(range(len(parts))):
+        parent = "/".join(parts[:i])
+        ls_tree = subprocess.run(
+            ["git", "ls-tree", "-z", f"{rev}:{parent}"],
+            capture_output=True,
+            check=(i == 0),
+            env=git.env,
+        )
+
+        entries = {}
+        # If the parent dir doesn't exist in 'rev', it's created here.
+        if ls_tree.returncode == 0:
+            for entry in ls_tree.stdout.split(b"\x00"):
+                if entry:
+                    entries[entry.partition(b"\t")[2]] = entry
+
+        name = parts[i].encode("utf-8")
+        entries[name] = b"040000 tree " + tree.encode("utf-8") + b"\t" + name
+
+        tree = (
+            subprocess.run(
+                ["git", "mktree", "-z"],
+                input=b"".join(entry + b"\x00" for entry in entries.values()),
+                capture_output=True,
+                check=True,
+                env=git.env,
+            )
+            .stdout.decode("utf-8")
+            .strip()
+        )
+
+    return tree
+
+
+def upstream_trailer(mirror: Mirror, revision: str) -> str:
+    """Returns a trailer recording that 'revision' was merged into 'mirror'."""
+    return f"{UPSTREAM_TRAILER}: {revision} {mirror.dir}"
+
+
+def _load_recorded(path: str) -> Tuple[Optional[str], Dict[str, str]]:
+    data = load_json(path)
+    if data is None:
+        return (None, {})
+    try:
+        return (data["commit"], data["revisions"])
+    except (KeyError, TypeError):
+        LOG.debug("Ignoring corrupt cache file %s", path, exc_info=True)
+        return (None, {})
+
+
+def _store_recorded(path: str, commit: str, revisions: Dict[str, str]) -> None:
+    store_json(path, {"commit": commit, "revisions": revisions})
+
+
+def recorded_revisions(
+    dirs: Iterable[str],
+    rev_from: str = "HEAD",
+    git: Optional[GitSession] = None,
+    cache_dir: Optional[str] = None,
+) -> Dict[str, str]:
+    """Returns the upstream revision most recently merged into each of 'dirs',
+    as recorded by update commits in the first-parent history of 'rev_from'.
+
+    At most RECORD_LIMIT commits are read, and only for as long as some dir
+    hasn't been found. Dirs with no recorded revision within those commits,
+    e.g. if only updated by older versions of mirror-tool, are omitted.
+
+    If 'cache_dir' is set, the revisions recorded for all dirs as of the most
+    recent lookup are kept there, so that later lookups only need to read the
+    commits made since then.
+    """
+    wanted = set(dirs)
+    out: Dict[str, str] = {}
+    if not wanted:
+        return out
+
+    cache_path = os.path.join(cache_dir, "recorded.json") if cache_dir else None
+    (cached_commit, cached) = _load_recorded(cache_path) if cache_path else (None, {})
+
+    git = git or GitSession()
+    head = None
+    complete = False
+    with closing(git.trailers(rev_from, UPSTREAM_TRAILER)) as trailers:
+        for commit, values in islice(trailers, RECORD_LIMIT):
+            head = head or commit
+            if commit == cached_commit:
+                for mirror_dir, revision in cached.items():
+                    out.setdefault(mirror_dir, revision)
+                complete = True
+                break
+
+            for value in values:
+                (revision, _, mirror_dir) = value.partition(" ")
+                out.setdefault(mirror_dir, revision)
+
+            # Without a cache, there's no use in reading further than needed.
+            if not cache_path and wanted <= out.keys():
+                break
+        else:
+            complete = True
+
+    if cache_path and complete and head and head != cached_commit:
+        _store_recorded(cache_path, head, out)
+
+    return {d: out[d] for d in wanted if d in out}
+
+
+def merged_mirrors(
+    revisions: List[Tuple[Mirror, str]],
+    rev_from: str = "HEAD",
+    git: Optional[GitSession] = None,
+    cache_dir: Optional[str] = None,
+) -> List[Mirror]:
+    """Returns those of the given mirrors which are up-to-date in 'rev_from' with
+    respect to the paired upstream revision.
+
+    A mirror is up-to-date if its dir has the same content as the upstream
+    revision, and the upstream revision has already been merged.
+    Upstream revisions need not be available locally.
+
+    'cache_dir' is used as in recorded_revisions.
+    """
+    if not revisions:
+        return []
+
+    session = git or GitSession()
+    try:
+        return _merged_mirrors(revisions, rev_from, session, cache_dir)
+    finally:
+        if not git:
+            session.close()
+
+
+def _merged_mirrors(
+    revisions: List[Tuple[Mirror, str]],
+    rev_from: str,
+    git: GitSession,
+    cache_dir: Optional[str],
+) -> List[Mirror]:
+    # Look up all trees in one go.
+    queries = []
+    for mirror, revision in revisions:
+        queries.extend([f"{revision}^{{tree}}", f"{rev_from}:{mirror.dir}"])
+    trees = git.resolve(queries, missing_ok=True)
+
+    # Only mirrors having the same content as upstream can be up-to-date.
+    candidates = []
+    for i, (mirror, revision) in enumerate(revisions):
+        (upstream_tree, mirror_tree) = trees[i * 2 : i * 2 + 2]
+        if upstream_tree == mirror_tree and upstream_tree:
+            candidates.append((mirror, revision))
+
+    if not candidates:
+        return []
+
+    recorded = recorded_revisions(
+        [mirror.dir for mirror, _ in candidates], rev_from, git, cache_dir
+    )
+
+    out = []
+    for mirror, revision in candidates:
+        # The recorded revision saves walking history to find the merge.
+        if recorded.get(mirror.dir) == revision or git.is_ancestor(revision, rev_from):
+            out.append(mirror)
+
+    return out
@@ -0,0 +1,115 @@
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pygit2
+
+from .git_session import GitSession
+from .shared import Commit
+
+
+def email_local(email: str) -> str:
+    return email.partition("@")[0]
+
+
+def message_parts(message: str) -> tuple[str, str]:
+    # Split a commit message into subject and body, as git log's %s and %b.
+    (subject, _, body) = message.lstrip("\n").partition("\n\n")
+    subject = " ".join(line.strip() for line in subject.splitlines())
+    body = "\n".join(body.strip("\n").splitlines())
+    return (subject, body)
+
+
+def message_trailers(message: str, key: str) -> List[str]:
+    # Trailers are only looked for in the last paragraph, which can't be the
+    # subject.
+    paragraphs = message.strip().split("\n\n")
+    if len(paragraphs) < 2:
+        return []
+
+    prefix = f"{key.lower()}:"
+    return [
+        line[len(prefix) :].strip()
+        for line in paragraphs[-1].splitlines()
+        if line.lower().startswith(prefix)
+    ]
+
+
+class Pygit2Session(GitSession):
+    """Answers read-only queries on the current repo in-process, using pygit2.
+
+    This requires the optional pygit2 dependency.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._repo: Optional[pygit2.Repository] = None
+
+    @property
+    def repo(self) -> pygit2.Repository:
+        if self._repo is None:
+            self._repo = pygit2.Repository(pygit2.discover_repository(os.getcwd()))
+        return self._repo
+
+    def resolve(self, names: List[str], missing_ok: bool = False) -> List[str]:
+        out = []
+        for name in names:
+            try:
+                out.append(str(self.repo.revparse_single(name).id))
+            except (KeyError, ValueError):
+                if not missing_ok:
+                    raise ValueError(f"Can't resolve {name}")
+                out.append("")
+        return out
+
+    def is_ancestor(self, revision: str, rev_from: str) -> bool:
+        try:
+            (revision_id, rev_from_id) = [
+                self.repo.revparse_single(rev).peel(pygit2.Commit).id
+                for rev in (revision, rev_from)
+            ]
+        except (KeyError, ValueError):
+            return False
+        return revision_id == rev_from_id or self.repo.descendant_of(
+            rev_from_id, revision_id
+        )
+
+    def walk(self, rev_from: str, rev_to: str) -> Iterator[pygit2.Commit]:
+        walker = self.repo.walk(self.repo.revparse_single(rev_to).id)
+        walker.hide(self.repo.revparse_single(rev_from).id)
+        return walker
+
+    def count_commits(self, rev_from: str, rev_to: str) -> int:
+        return sum(1 for _ in self.walk(rev_from, rev_to))
+
+    def log(self, rev_from: str, rev_to: str, limit: int) -> Iterable[Commit]:
+        for commit in islice(self.walk(rev_from, rev_to), limit):
+            (subject, body) = message_parts(commit.message)
+            yield Commit(
+                revision=str(commit.id),
+                revision_abbrev=commit.short_id,
+                author_name=commit.author.name,
+                author_email=commit.author.email,
+                author_email_local=email_local(commit.author.email),
+                author_datetime=datetime.utcfromtimestamp(commit.author.time),
+                committer_name=commit.committer.name,
+                committer_email=commit.committer.email,
+                committer_email_local=email_local(commit.committer.email),
+                committer_datetime=datetime.utcfromtimestamp(commit.committer.time),
+                subject=subject,
+                body=body,
+            )
+
+    def trailers(self, rev_from: str, key: str) -> Iterator[Tuple[str, List[str]]]:
+        commit = self.repo.revparse_single(rev_from).peel(pygit2.Commit)
+        while True:
+            yield (str(commit.id), message_trailers(commit.message, key))
+            if not commit.parents:
+                return
+            commit = commit.parents[0]
+
+    def close(self) -> None:
+        # libgit2 caches some repository state, so a later query may reopen
+        # the repository to see changes made by other processes.
+        self._repo = None
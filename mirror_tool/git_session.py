@@ -0,0 +1,155 @@
+import subprocess
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .shared import Commit
+
+# Queries are written to git cat-file in batches whose output fits within this
+# many bytes, so that neither process can block on a full pipe while the other
+# is also blocked. This is no larger than the smallest pipe buffer on Linux.
+PIPE_CHUNK = 4096
+
+
+class GitSession:
+    """Answers read-only queries on the current repo.
+
+    This implementation runs the git command-line tool. Object queries are
+    answered by a single long-lived 'git cat-file --batch-check' process,
+    rather than running a new git process for each query. The process is
+    started on first use and stopped by close().
+
+    Subclasses may answer the same queries by other means, see git_pygit2.
+    """
+
+    def __init__(self, env: Optional[Dict[str, str]] = None):
+        self.env = env
+        self._cat_file: Optional[subprocess.Popen] = None
+
+    def resolve(self, names: List[str], missing_ok: bool = False) -> List[str]:
+        """Returns the object IDs of the given object names, e.g. "HEAD",
+        "refs/heads/main^{tree}" or "HEAD:some/dir".
+
+        If an object doesn't exist, raises unless 'missing_ok' is True, in which
+        case "" is returned for that object.
+        """
+        if not self._cat_file:
+            self._cat_file = subprocess.Popen(
+                ["git", "cat-file", "--batch-check=%(objectname)"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                env=self.env,
+            )
+
+        out = []
+        batch: List[str] = []
+        size = 0
+        for name in names:
+            # Each line of output is an object ID or the name with a reason.
+            line_size = max(len(name.encode("utf-8")) + len(" ambiguous"), 40) + 1
+            if batch and size + line_size > PIPE_CHUNK:
+                out.extend(self._resolve_batch(batch, missing_ok))
+                (batch, size) = ([], 0)
+            batch.append(name)
+            size += line_size
+
+        out.extend(self._resolve_batch(batch, missing_ok))
+        return out
+
+    def _resolve_batch(self, names: List[str], missing_ok: bool) -> List[str]:
+        self._cat_file.stdin.write("".join(f"{name}\n" for name in names))
+        self._cat_file.stdin.flush()
+
+        out = []
+        for name in names:
+            line = self._cat_file.stdout.readline()
+            if not line:
+                raise RuntimeError("git cat-file exited unexpectedly")
+
+            # Any object which couldn't be found is echoed back with a reason,
+            # e.g. "<name> missing".
+            line = line.strip()
+            if " " in line:
+                if not missing_ok:
+                    raise ValueError(f"Can't resolve {name}: {line}")
+                line = ""
+            out.append(line)
+
+        return out
+
+    def is_ancestor(self, revision: str, rev_from: str) -> bool:
+        """Returns True if 'revision' is reachable from 'rev_from'."""
+        return (
+            subprocess.run(
+                ["git", "merge-base", "--is-ancestor", revision, rev_from],
+                env=self.env,
+            ).returncode
+            == 0
+        )
+
+    def count_commits(self, rev_from: str, rev_to: str) -> int:
+        """Returns the number of commits reachable from 'rev_to' and not from
+        'rev_from'."""
+        return int(
+            subprocess.check_output(
+                ["git", "rev-list", "--count", f"{rev_from}..{rev_to}"],
+                text=True,
+                env=self.env,
+            ).strip()
+        )
+
+    def log(self, rev_from: str, rev_to: str, limit: int) -> Iterable[Commit]:
+        """Returns up to 'limit' of the commits reachable from 'rev_to' and not
+        from 'rev_from', in git log order."""
+        logs = subprocess.check_output(
+            [
+                "git",
+                "log",
+                "-z",
+                f"--max-count={limit}",
+                "--pretty=format:%H%n%h%n%an%n%ae%n%al%n%at%n%cn%n%ce%n%cl%n%ct%n%s%n%b",
+                f"{rev_from}..{rev_to}",
+            ],
+            text=False,
+            env=self.env,
+        )
+        return Commit.from_log(logs)
+
+    def trailers(self, rev_from: str, key: str) -> Iterator[Tuple[str, List[str]]]:
+        """Yields (commit ID, values of all trailers named 'key') for each commit
+        on the first-parent history of 'rev_from', starting from the most
+        recent.
+
+        History is only read as far as the caller consumes the iterator.
+        """
+        with subprocess.Popen(
+            [
+                "git",
+                "log",
+                "--first-parent",
+                f"--format=%x00%H%n%(trailers:key={key},valueonly)",
+                rev_from,
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
+            env=self.env,
+        ) as proc:
+            try:
+                commit = None
+                values: List[str] = []
+                for line in proc.stdout:
+                    if line.startswith("\x00"):
+                        if commit:
+                            yield (commit, values)
+                        (commit, values) = (line[1:].strip(), [])
+                    elif line.strip():
+                        values.append(line.strip())
+                if commit:
+                    yield (commit, values)
+            finally:
+                proc.terminate()
+
+    def close(self) -> None:
+        if self._cat_file:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file = None
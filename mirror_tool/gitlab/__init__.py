@@ -1,4 +1,21 @@
-from .ci_template import render_ci_template_from_config
-from .common import GitlabException, GitlabSession
-from .promote import GitlabPromoteSession
-from .update import GitlabUpdateSession
+import importlib
+
+# Names exported by this package, by the module defining them.
+# They're imported when first used, so that commands not talking to GitLab
+# don't need to import requests.
+_EXPORTS = {
+    "render_ci_template_from_config": ".ci_template",
+    "BACKGROUND_JOBS": ".common",
+    "GitlabException": ".common",
+    "GitlabSession": ".common",
+    "GitlabPromoteSession": ".promote",
+    "GitlabUpdateSession": ".update",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
@@ -1,8 +1,7 @@
 import textwrap
 
-import jinja2
-
 from ..conf import Config
+from ..jinja import jinja_template
 
 TEMPLATE = textwrap.dedent(
     """
@@ -48,9 +47,7 @@ TEMPLATE = textwrap.dedent(
 
 
 def render_ci_template_from_args(**kwargs) -> str:
-    env = jinja2.Environment()
-    loader = jinja2.DictLoader({"template": TEMPLATE})
-    return loader.load(env, "template").render(**kwargs)
+    return jinja_template(TEMPLATE).render(**kwargs)
 
 
 def render_ci_template_from_config(conf: Config) -> str:
@@ -1,25 +1,53 @@
 import logging
+import os
 import pprint
+import re
 import subprocess
-from typing import Any, Callable, Dict, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, TypeVar
+from urllib.parse import quote
 
-import jinja2
 import requests
+from requests.adapters import HTTPAdapter
 
 from ..conf import GitlabCommon
+from ..file_cache import load_text, prune_cache, touch, write_atomic
+from ..jinja import jinja_template
+from . import http_cache
+from .http_cache import CachingSession
 
 LOG = logging.getLogger("mirror-tool")
 SHARED_LABEL = "mirror-tool"
 
+# Fields of merge requests used by mirror-tool.
+MR_FIELDS = ("iid", "web_url", "sha", "labels", "merge_commit_sha")
+
+# Maximum number of operations run in the background by a session at once.
+BACKGROUND_JOBS = 4
+
 RunCmd = Callable[..., subprocess.CompletedProcess]
 
+T = TypeVar("T")
+
 
 class GitlabException(RuntimeError):
     pass
 
 
+def remote_branch_ref(branch: str) -> str:
+    """Returns the local ref into which remote 'branch' is fetched."""
+    return f"refs/mirror-tool/dest/{branch}"
+
+
 class GitlabSession:
-    def __init__(self, gitlab_info: GitlabCommon, run_cmd: RunCmd, dry_run: bool):
+    def __init__(
+        self,
+        gitlab_info: GitlabCommon,
+        run_cmd: RunCmd,
+        dry_run: bool,
+        cache_dir: Optional[str] = None,
+        adapter: Optional[HTTPAdapter] = None,
+    ):
         for field in ("api_v4_url", "project_id", "push_url"):
             if not getattr(gitlab_info, field):
                 raise GitlabException(
@@ -33,32 +61,72 @@ class GitlabSession:
         self.gitlab_info = gitlab_info
         self.api_v4_url = gitlab_info.api_v4_url
         self.project_id = gitlab_info.project_id
-        self.requests = requests.Session()
+        self.cache_dir = cache_dir
+        self.requests = CachingSession(cache_dir)
         self.requests.headers["PRIVATE-TOKEN"] = gitlab_info.token_final
+        if adapter:
+            # Sessions given the same adapter share its connection pool.
+            self.requests.mount("https://", adapter)
+            self.requests.mount("http://", adapter)
 
         self.run_cmd = run_cmd
         self.dry_run = dry_run
-
-        jinja_loader = jinja2.DictLoader(
-            {
-                "title": self.gitlab_info.title,
-                "description": self.gitlab_info.description,
-                "comment.create": self.gitlab_info.comment.create,
-                "comment.update": self.gitlab_info.comment.update,
-            }
-        )
-        self.jinja_env = jinja2.Environment(loader=jinja_loader)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.jinja_templates = {
+            "title": self.gitlab_info.title,
+            "description": self.gitlab_info.description,
+            "comment.create": self.gitlab_info.comment.create,
+            "comment.update": self.gitlab_info.comment.update,
+        }
         self.jinja_args = {}
 
+        # Remote branches which have been fetched into local refs.
+        self.fetched_branches: set[str] = set()
+
+        # Tree IDs of commits, by commit ID.
+        self.tree_ids: dict[str, str] = {}
+
+    def log_stats(self) -> None:
+        if self.requests.retry_count or self.requests.throttled_time:
+            LOG.info(
+                "GitLab requests were delayed by %.1f seconds in total; "
+                "%s request(s) were retried.",
+                self.requests.throttled_time,
+                self.requests.retry_count,
+            )
+
+    def in_background(self, fn: Callable[..., T], *args) -> "Future[T]":
+        """Start fn(*args) in the background, so that it may overlap with
+        other API requests or git commands.
+
+        Returns a Future for the result. Threads are only started once needed,
+        and stopped by close().
+        """
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=BACKGROUND_JOBS, thread_name_prefix="gitlab"
+            )
+        return self._executor.submit(fn, *args)
+
+    def close(self) -> None:
+        """Stop any background work, waiting for anything already started."""
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
     def jinja_render(self, template_name, *args, **kwargs):
         kwargs.update(self.jinja_args)
-        return self.jinja_env.get_template(template_name).render(*args, **kwargs)
+        template = jinja_template(self.jinja_templates[template_name])
+        return template.render(*args, **kwargs)
+
+    @property
+    def project_url(self):
+        return "".join([self.api_v4_url, "/projects/", str(self.project_id)])
 
     @property
     def project_mrs_url(self):
-        return "".join(
-            [self.api_v4_url, "/projects/", str(self.project_id), "/merge_requests"]
-        )
+        return self.project_url + "/merge_requests"
 
     def response_ok(self, doing_what, response):
         if not response.ok:
@@ -82,24 +150,56 @@ class GitlabSession:
             raise GitlabException(f"Could not {doing_what}.")
 
     def ensure_pushed_to(self, revision, dest):
+        return self.ensure_pushed({dest: revision})
+
+    def ensure_pushed(self, revisions: Dict[str, str]) -> None:
+        """Make each remote branch in 'revisions' point at the given revision.
+
+        Branches already pointing at the revision are left alone. The others
+        are updated by a single atomic push, which fails without updating
+        anything if any of them changed since they were checked.
+        """
         if self.dry_run:
-            LOG.info(
-                "DRY RUN: if not using --dry-run, would now push %s to %s",
-                revision,
-                dest,
-            )
+            for dest, revision in revisions.items():
+                LOG.info(
+                    "DRY RUN: if not using --dry-run, would now push %s to %s",
+                    revision,
+                    dest,
+                )
+            return
+
+        leases = []
+        refspecs = []
+        for dest, revision in revisions.items():
+            current = self.remote_branch_commit(dest)
+            if current and current == self.commit_id(revision):
+                LOG.info("Remote %s is already at %s.", dest, revision)
+                continue
+
+            if current is None:
+                # Remote state is unknown, so the push can only be forced.
+                refspecs.append(f"+{revision}:refs/heads/{dest}")
+            else:
+                # An empty value means the branch must not exist.
+                leases.append(f"--force-with-lease=refs/heads/{dest}:{current}")
+                refspecs.append(f"{revision}:refs/heads/{dest}")
+
+        if not refspecs:
             return
 
         self.run_git_silent(
-            [
-                "git",
-                "push",
-                self.gitlab_info.push_url_final,
-                f"+{revision}:refs/heads/{dest}",
-            ],
-            f"push {revision} to {dest} branch",
+            ["git", "push", "--atomic", self.gitlab_info.push_url_final]
+            + leases
+            + refspecs,
+            "push "
+            + ", ".join(
+                f"{revision} to {dest} branch" for dest, revision in revisions.items()
+            ),
         )
 
+        # Anything known about the remote branches is now out of date.
+        self.requests.forget()
+
     def mutable_mr_attributes(self) -> Dict[str, Any]:
         return dict(
             title=self.jinja_render("title"),
@@ -187,42 +287,44 @@ class GitlabSession:
 
         LOG.info("Commented on: %s", mr.get("web_url") or "<unknown merge request URL>")
 
-    def find_mrs_with_fields(self, fields) -> Tuple[dict, dict]:
-        """Searches for MRs matching passed fields.
-
-        Returns a tuple of:
+    def find_mrs(self, fields, per_page=20, trim=True) -> Iterator[dict]:
+        """Yields MRs matching passed fields, most recently created first.
 
-          (list of matching MRs created by mirror-tool,
-           list of all matching MRs)
+        Pages of results are only requested as the iterator is consumed.
+        If 'trim' is True, only the fields of each MR used by mirror-tool
+        are kept.
         """
+        params = {"order_by": "created_at", "sort": "desc", "per_page": per_page}
+        params.update(fields)
 
-        # Note: for the time being, lack of pagination here should be OK.
-        #
-        # - default sort will return newest MRs first.
-        # - default pagination is to return first page only.
-        #
-        # So, default behavior is to return ~20 most recent MRs only.
-        # It should be OK for the purpose of this tool.
-        response = self.requests.get(
-            self.project_mrs_url,
-            params=fields,
-        )
+        page = "1"
+        while page:
+            response = self.requests.get(
+                self.project_mrs_url, params={**params, "page": page}
+            )
+            self.response_ok("find merge request", response)
 
-        self.response_ok("find merge request", response)
+            for mr in response.json():
+                if trim:
+                    mr = {key: mr[key] for key in MR_FIELDS if key in mr}
+                yield mr
 
-        mrs = response.json()
-        out = []
-        for mr in mrs:
-            if SHARED_LABEL in (mr.get("labels") or []):
-                out.append(mr)
+            # Empty on the last page.
+            page = response.headers.get("X-Next-Page")
 
-        return (out, mrs)
+    def find_own_mr(self, fields, trim=True) -> Optional[dict]:
+        """Returns the most recent MR created by mirror-tool matching passed
+        fields, or None."""
+        fields = {**fields, "labels": SHARED_LABEL}
+        for mr in self.find_mrs(fields, per_page=1, trim=trim):
+            if SHARED_LABEL in (mr.get("labels") or []):
+                return mr
+        return None
 
     def find_single_mr(self, fields) -> dict:
-        (mrs_own, mrs_all) = self.find_mrs_with_fields(fields)
+        mr = self.find_own_mr(fields)
 
-        if mrs_own:
-            mr = mrs_own[0]
+        if mr:
             mr_url = mr.get("web_url") or "<unknown url>"
             LOG.info(
                 "Found existing merge request: %s",
@@ -230,8 +332,9 @@ class GitlabSession:
             )
             return mr
 
-        if mrs_all:
-            mr_url = mrs_all[0].get("web_url") or "<unknown url>"
+        # Only need to know whether any other MR exists.
+        for mr in self.find_mrs({**fields, "view": "simple"}, per_page=1):
+            mr_url = mr.get("web_url") or "<unknown url>"
 
             # If we get here, that means we found an MR for the right
             # branches but it apparently wasn't created by us?
@@ -257,19 +360,140 @@ class GitlabSession:
         mr = self.find_single_mr(find_fields)
         update_fn(mr)
 
+    def fetch_remote_branches(self, branches: Iterable[str]) -> None:
+        """Fetch remote 'branches' into local refs, by a single command."""
+        branches = sorted(set(branches))
+        self.run_git_silent(
+            ["git", "fetch", "--no-write-fetch-head", self.gitlab_info.push_url_final]
+            + [
+                f"+refs/heads/{branch}:{remote_branch_ref(branch)}"
+                for branch in branches
+            ],
+            f"fetch remote branch(es) {', '.join(branches)}",
+        )
+        self.fetched_branches.update(branches)
+
+    def commit_id(self, revision: str) -> Optional[str]:
+        """Returns the full commit ID of local 'revision', or None if unknown."""
+        if re.fullmatch("[0-9a-f]{40}", revision):
+            return revision
+
+        proc = self.run_cmd(
+            ["git", "rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}"],
+            check=False,
+            silent=True,
+            capture_output=True,
+        )
+        if proc.returncode != 0:
+            return None
+        return proc.stdout.decode("utf-8").strip()
+
+    def _tree_id_path(self, commit: str) -> str:
+        return os.path.join(self.cache_dir, "trees", commit)
+
+    def tree_id(self, revision: str) -> Optional[str]:
+        """Returns the tree ID of 'revision', or None if the revision isn't
+        available locally.
+
+        As a commit's tree never changes, tree IDs of commits given by ID are
+        remembered, including across runs if a cache directory is used. Only
+        the most recently used tree IDs are kept in the cache directory.
+        """
+        if revision in self.tree_ids:
+            return self.tree_ids[revision]
+
+        is_commit_id = re.fullmatch("[0-9a-f]{40}", revision)
+        if is_commit_id and self.cache_dir:
+            cached = load_text(self._tree_id_path(revision))
+            if cached and re.fullmatch("[0-9a-f]{40}", cached):
+                touch(self._tree_id_path(revision))
+                self.tree_ids[revision] = cached
+                return cached
+
+        proc = self.run_cmd(
+            ["git", "rev-parse", "--verify", "--quiet", f"{revision}^{{tree}}"],
+            check=False,
+            silent=True,
+            capture_output=True,
+        )
+        if proc.returncode != 0:
+            return None
+
+        tree = proc.stdout.decode("utf-8").strip()
+        if is_commit_id:
+            self.tree_ids[revision] = tree
+            if self.cache_dir:
+                write_atomic(self._tree_id_path(revision), tree)
+                prune_cache(
+                    os.path.dirname(self._tree_id_path(revision)),
+                    http_cache.CACHE_LIMIT,
+                )
+        return tree
+
+    def remote_branch_commit(self, branch: str) -> Optional[str]:
+        """Returns the commit ID at remote 'branch' according to the GitLab API,
+        an empty string if the branch doesn't exist, or None if that couldn't
+        be determined."""
+
+        # https://docs.gitlab.com/ee/api/branches.html#get-single-repository-branch
+        response = self.requests.get(
+            "".join([self.project_url, "/repository/branches/", quote(branch, safe="")])
+        )
+        if response.status_code == 404:
+            return ""
+        if not response.ok:
+            return None
+        return response.json()["commit"]["id"]
+
+    def commit_in_remote_branch_api(self, commit: str, branch: str) -> Optional[bool]:
+        """Returns True if 'commit' is reachable from remote 'branch' according
+        to the GitLab API, or None if that couldn't be determined."""
+
+        head = self.remote_branch_commit(branch)
+        if not head:
+            return None
+        if head == commit:
+            return True
+
+        # https://docs.gitlab.com/ee/api/repositories.html#merge-base
+        response = self.requests.get(
+            self.project_url + "/repository/merge_base",
+            params={"refs[]": [commit, branch]},
+        )
+        if response.status_code in (400, 404):
+            # The branch exists, so it must be the commit which GitLab doesn't
+            # know about. Then it can't be in the branch.
+            return False
+        if not response.ok:
+            return None
+        return response.json()["id"] == commit
+
     def revision_in_remote_branch(self, revision: str, branch: str) -> bool:
         """Returns True if 'revision' appears to be reachable from remote 'branch'."""
 
+        # Ask GitLab first, as that's much cheaper than fetching the branch.
+        commit = self.commit_id(revision)
+        if commit:
+            reachable = self.commit_in_remote_branch_api(commit, branch)
+            if reachable is not None:
+                if reachable:
+                    LOG.info(
+                        "Revision %s is already reachable from remote %s.",
+                        revision,
+                        branch,
+                    )
+                return reachable
+
+        LOG.debug("Checking %s in %s via fetch", revision, branch)
+        return self.revision_in_fetched_branch(revision, branch)
+
+    def revision_in_fetched_branch(self, revision: str, branch: str) -> bool:
+        """Like revision_in_remote_branch, but checked locally after fetching
+        the branch."""
+
         # Make sure we have latest version of that branch in a local ref...
-        self.run_git_silent(
-            [
-                "git",
-                "fetch",
-                self.gitlab_info.push_url_final,
-                f"+refs/heads/{branch}:refs/mirror-tool/dest-branch",
-            ],
-            f"fetch remote branch {branch}",
-        )
+        if branch not in self.fetched_branches:
+            self.fetch_remote_branches([branch])
 
         # Is that revision already reachable from target branch?
         # Note: this will also fail if 'revision' isn't even recognizable as a revision.
@@ -281,7 +505,7 @@ class GitlabSession:
                 "merge-base",
                 "--is-ancestor",
                 revision,
-                "refs/mirror-tool/dest-branch",
+                remote_branch_ref(branch),
             ],
             check=False,
         )
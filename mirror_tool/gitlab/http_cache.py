@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from ..file_cache import load_json, prune_cache, store_json, touch
+from .throttle import ThrottledSession
+
+LOG = logging.getLogger("mirror-tool")
+
+# Maximum number of entries kept by each of the GitLab caches in a cache dir.
+CACHE_LIMIT = int(os.getenv("MIRROR_TOOL_GITLAB_CACHE_LIMIT") or "1000")
+
+COMMIT_ID = re.compile("[0-9a-f]{40}")
+
+
+class CachingSession(ThrottledSession):
+    """A requests session avoiding repeated downloads of GET responses.
+
+    Within the lifetime of the session, identical GET requests are answered
+    from memory until any other request succeeds (as that may have changed
+    the results). The session may be used from several threads at once.
+
+    If 'cache_dir' is set, responses having an ETag or Last-Modified header
+    are also kept in that directory and later requested conditionally, so
+    that resources unchanged since an earlier run are not downloaded again.
+    Responses for URLs naming a commit ID are not kept, as those are rarely
+    requested again once the commit is no longer new, and only the
+    CACHE_LIMIT most recently used responses are kept.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self._memo: dict[str, requests.Response] = {}
+
+        # Incremented whenever responses are forgotten, so that a response to
+        # a GET overlapping with a modification in another thread isn't kept.
+        self._generation = 0
+        self._memo_lock = threading.Lock()
+
+    def forget(self) -> None:
+        """Forget all GET responses, for use after changing something on the
+        server by other means."""
+        with self._memo_lock:
+            self._memo.clear()
+            self._generation += 1
+
+    def _cache_path(self, request: requests.PreparedRequest) -> str:
+        # Responses may differ per user, so the token is part of the key.
+        # It's hashed to avoid storing it.
+        key = "\n".join([request.headers.get("PRIVATE-TOKEN") or "", request.url])
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name + ".json")
+
+    def _store(self, path: str, response: requests.Response) -> None:
+        store_json(
+            path,
+            {
+                "url": response.url,
+                "headers": dict(response.headers),
+                "content": response.content.decode("utf-8"),
+            },
+        )
+        prune_cache(self.cache_dir, CACHE_LIMIT, ".json")
+
+    def _cached_response(
+        self, request: requests.PreparedRequest, cached: dict
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = cached["url"]
+        response.headers = CaseInsensitiveDict(cached["headers"])
+        response._content = cached["content"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.request = request
+        return response
+
+    def _send_conditional(
+        self, request: requests.PreparedRequest, **kwargs
+    ) -> requests.Response:
+        path = self._cache_path(request)
+        cached = load_json(path)
+
+        if cached:
+            validators = CaseInsensitiveDict(cached["headers"])
+            if "ETag" in validators:
+                request.headers["If-None-Match"] = validators["ETag"]
+            if "Last-Modified" in validators:
+                request.headers["If-Modified-Since"] = validators["Last-Modified"]
+
+        response = super().send(request, **kwargs)
+
+        if cached and response.status_code == 304:
+            LOG.debug("Not modified: %s", request.url)
+            touch(path)
+            return self._cached_response(request, cached)
+
+        if (
+            response.status_code == 200
+            and ("ETag" in response.headers or "Last-Modified" in response.headers)
+            and not COMMIT_ID.search(request.url)
+        ):
+            self._store(path, response)
+
+        return response
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            response = super().send(request, **kwargs)
+            if response.ok:
+                self.forget()
+            return response
+
+        with self._memo_lock:
+            if request.url in self._memo:
+                return self._memo[request.url]
+            generation = self._generation
+
+        if self.cache_dir:
+            response = self._send_conditional(request, **kwargs)
+        else:
+            response = super().send(request, **kwargs)
+
+        with self._memo_lock:
+            if response.ok and generation == self._generation:
+                self._memo[request.url] = response
+        return response
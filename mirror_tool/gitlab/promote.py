@@ -1,17 +1,25 @@
 import logging
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
 
 from ..conf import GitlabPromote
 from ..jinja import jinja_args
-from .common import SHARED_LABEL, GitlabSession, RunCmd
+from .common import GitlabSession, RunCmd
 
 LOG = logging.getLogger("mirror-tool")
 
 
 class GitlabPromoteSession(GitlabSession):
     def __init__(
-        self, gitlab_promote: GitlabPromote, run_cmd: RunCmd, dry_run: bool = False
+        self,
+        gitlab_promote: GitlabPromote,
+        run_cmd: RunCmd,
+        dry_run: bool = False,
+        cache_dir: Optional[str] = None,
+        adapter: Optional[HTTPAdapter] = None,
     ):
-        super().__init__(gitlab_promote, run_cmd, dry_run)
+        super().__init__(gitlab_promote, run_cmd, dry_run, cache_dir, adapter)
         self.gitlab_promote = gitlab_promote
 
         self.jinja_args = jinja_args(updates=[])
@@ -24,24 +32,21 @@ class GitlabPromoteSession(GitlabSession):
             self.gitlab_promote.working_branch, self.gitlab_promote.dest
         )
 
-    def find_merged_mr(self) -> dict:
+    def find_merged_mr(self) -> Optional[dict]:
         LOG.info("Looking for previous MRs to %s...", self.gitlab_promote.src)
-        (mrs_own, _) = self.find_mrs_with_fields(
-            {
-                "target_branch": self.gitlab_promote.src,
-                "labels": SHARED_LABEL,
-                "state": "merged",
-            },
+
+        # The full MR is kept, as it's made available to Jinja contexts.
+        mr = self.find_own_mr(
+            {"target_branch": self.gitlab_promote.src, "state": "merged"}, trim=False
         )
 
-        if mrs_own:
-            mr = mrs_own[0]
+        if mr:
             mr_url = mr.get("web_url") or "<unknown url>"
             LOG.info(
                 "Found existing merge request: %s",
                 mr_url,
             )
-            return mr
+        return mr
 
     def ensure_promotion_merge_request_exists(self):
         # Locate the latest submitted MR by ourselves to the target branch.
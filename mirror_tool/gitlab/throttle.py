@@ -0,0 +1,117 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+LOG = logging.getLogger("mirror-tool")
+
+# Methods which may be retried after a failure without risk of doing anything twice.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Responses which may succeed if retried later.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ThrottledSession(requests.Session):
+    """A requests session which slows down rather than failing when the
+    server is busy.
+
+    Requests are paced according to GitLab's RateLimit-* headers, so that the
+    remaining requests allowed are spread until the rate limit resets.
+
+    Requests rejected as rate-limited (which have not been processed) are
+    retried, as are idempotent requests which failed due to a transient
+    server error.
+    Retries are delayed according to the Retry-After header if present, or
+    otherwise by exponential backoff with jitter.
+    """
+
+    max_retries = 5
+    """Maximum number of times to retry a single request."""
+
+    backoff = 1.0
+    """Delay, in seconds, before the first retry of a request."""
+
+    max_delay = 60.0
+    """Maximum delay, in seconds, before any single request."""
+
+    def __init__(self):
+        super().__init__()
+
+        self.throttled_time = 0.0
+        """Total number of seconds for which requests have been delayed."""
+
+        self.retry_count = 0
+        """Total number of requests retried."""
+
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+
+    def _delay(self, seconds: float) -> None:
+        """Ensure no requests are sent for 'seconds' from now."""
+        seconds = min(seconds, self.max_delay)
+        with self._lock:
+            self._not_before = max(self._not_before, time.monotonic() + seconds)
+
+    def _wait(self) -> None:
+        with self._lock:
+            delay = self._not_before - time.monotonic()
+            if delay > 0:
+                self.throttled_time += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pace(self, response: requests.Response) -> None:
+        remaining = response.headers.get("RateLimit-Remaining")
+        reset = response.headers.get("RateLimit-Reset")
+        if not (remaining and reset):
+            return
+
+        try:
+            window = float(reset) - time.time()
+            interval = window / (int(remaining) + 1)
+        except ValueError:
+            return
+
+        if interval > 0:
+            self._delay(interval)
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
+
+    def _should_retry(self, response: requests.Response, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if response.status_code == 429:
+            return True
+        return (
+            response.request.method in IDEMPOTENT_METHODS
+            and response.status_code in RETRY_STATUSES
+        )
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            self._wait()
+
+            response = super().send(request, **kwargs)
+            self._pace(response)
+            if not self._should_retry(response, attempt):
+                return response
+
+            delay = self._retry_delay(response, attempt)
+            LOG.warning(
+                "Unexpected response from GitLab: %s %s, retrying in %.1f seconds...",
+                response.status_code,
+                response.reason,
+                delay,
+            )
+            self._delay(delay)
+            with self._lock:
+                self.retry_count += 1
+            attempt += 1
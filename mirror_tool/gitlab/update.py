@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 from ..conf import GitlabMerge
 from ..git_info import UpdateInfo
@@ -15,8 +16,9 @@ class GitlabUpdateSession(GitlabSession):
         run_cmd,
         updates: list[UpdateInfo],
         dry_run: bool = False,
+        cache_dir: Optional[str] = None,
     ):
-        super().__init__(gitlab_merge, run_cmd, dry_run)
+        super().__init__(gitlab_merge, run_cmd, dry_run, cache_dir)
         self.gitlab_merge = gitlab_merge
         self.updates = updates
         self.jinja_args = jinja_args(updates=self.updates)
@@ -35,23 +37,23 @@ class GitlabUpdateSession(GitlabSession):
 
         mr_revision = mr["sha"]
 
-        # Make sure we have the MR revision.
-        self.run_git_silent(
-            [
-                "git",
-                "fetch",
-                self.gitlab_info.push_url_final,
-                f"+{mr_revision}:refs/mirror-tool/existing-mr",
-            ],
-            f"fetch remote revision {mr_revision}",
-        )
+        # The MR's content is the same if its commit has the same tree.
+        # That can often be determined without fetching the MR's commit,
+        # as the commit may be available locally, or its tree ID cached.
+        mr_tree = self.tree_id(mr_revision)
+        if not mr_tree:
+            self.run_git_silent(
+                [
+                    "git",
+                    "fetch",
+                    self.gitlab_info.push_url_final,
+                    f"+{mr_revision}:refs/mirror-tool/existing-mr",
+                ],
+                f"fetch remote revision {mr_revision}",
+            )
+            mr_tree = self.tree_id(mr_revision)
 
-        if (
-            self.run_cmd(
-                ["git", "diff", "--quiet", revision, mr_revision], check=False
-            ).returncode
-            != 0
-        ):
+        if not mr_tree or mr_tree != self.tree_id(revision):
             # There are differences in content => it's not up-to-date
             LOG.info(
                 "MR %s needs an update: there are differences in content.", web_url
@@ -68,17 +70,21 @@ class GitlabUpdateSession(GitlabSession):
         return True
 
     def ensure_merge_request_exists(self, revision="HEAD"):
-        if self.revision_in_remote_branch(revision, self.gitlab_merge.dest):
-            return
-
         # Let's see if there's already an MR by us between src and dest branch.
+        # This is only needed if the revision isn't already in the dest branch,
+        # but is looked up meanwhile, as checking that can take a while.
         find_fields = {
             "state": "opened",
             "source_branch": self.gitlab_merge.src,
             "target_branch": self.gitlab_merge.dest,
         }
-        (ours, _) = self.find_mrs_with_fields(find_fields)
-        if ours and self.is_mr_uptodate(ours[0], revision):
+        find_ours = self.in_background(self.find_own_mr, find_fields)
+
+        if self.revision_in_remote_branch(revision, self.gitlab_merge.dest):
+            return
+
+        ours = find_ours.result()
+        if ours and self.is_mr_uptodate(ours, revision):
             # Don't need to do anything.
             return
 
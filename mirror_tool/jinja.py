@@ -1,8 +1,14 @@
+import dataclasses
 import datetime
+import hashlib
 import os
-from typing import Any
+import threading
+from typing import TYPE_CHECKING, Any, Optional
 
-import jinja2
+from .file_cache import prune_cache, touch
+
+if TYPE_CHECKING:  # pragma: no cover
+    import jinja2
 
 
 def jinja_args(**kwargs) -> dict[str, Any]:
@@ -18,7 +24,120 @@ def jinja_args(**kwargs) -> dict[str, Any]:
     return out
 
 
+def dataclass_args(obj) -> dict[str, Any]:
+    """Returns the fields of a dataclass instance as a dict for use as template
+    arguments.
+
+    As with dataclasses.asdict, nested dataclasses and lists of them become
+    dicts and lists, so templates may use mapping access such as
+    mirror['dir'] or mirror.items(). Unlike it, other values are used as-is
+    rather than deep-copied.
+    """
+    return {
+        f.name: _template_value(getattr(obj, f.name)) for f in dataclasses.fields(obj)
+    }
+
+
+def _template_value(value: Any) -> Any:
+    if dataclasses.is_dataclass(value):
+        return dataclass_args(value)
+    if isinstance(value, list):
+        return [_template_value(elem) for elem in value]
+    return value
+
+
+# Sources of all templates used in this process, by name.
+# Names are a hash of the source, so each distinct source is compiled once
+# per environment however many times it is rendered.
+_SOURCES: dict[str, str] = {}
+_LOCK = threading.Lock()
+
+# Environments by whether they are strict, created when first used.
+_ENVS: dict[bool, "jinja2.Environment"] = {}
+_BYTECODE_CACHE_DIR: Optional[str] = None
+
+# Maximum number of compiled templates kept in a cache dir.
+BYTECODE_CACHE_LIMIT = 100
+
+
+def _load_source(name: str) -> Optional[str]:
+    with _LOCK:
+        return _SOURCES.get(name)
+
+
+def _new_bytecode_cache(directory: str) -> "jinja2.BytecodeCache":
+    import jinja2
+
+    class BytecodeCache(jinja2.FileSystemBytecodeCache):
+        # Keeps only the most recently used templates, as each changed
+        # template source adds a file.
+        def load_bytecode(self, bucket: "jinja2.bccache.Bucket") -> None:
+            super().load_bytecode(bucket)
+            if bucket.code is not None:
+                touch(self._get_cache_filename(bucket))
+
+        def dump_bytecode(self, bucket: "jinja2.bccache.Bucket") -> None:
+            super().dump_bytecode(bucket)
+            prune_cache(self.directory, BYTECODE_CACHE_LIMIT, ".cache")
+
+    os.makedirs(directory, exist_ok=True)
+    return BytecodeCache(directory)
+
+
+def _new_env(strict: bool) -> "jinja2.Environment":
+    # jinja2 is imported only once templates are used, as it's comparatively
+    # slow to import.
+    import jinja2
+
+    bytecode_cache = None
+    if _BYTECODE_CACHE_DIR:
+        bytecode_cache = _new_bytecode_cache(_BYTECODE_CACHE_DIR)
+
+    return jinja2.Environment(
+        loader=jinja2.FunctionLoader(_load_source),
+        undefined=jinja2.StrictUndefined if strict else jinja2.Undefined,
+        bytecode_cache=bytecode_cache,
+        cache_size=-1,
+    )
+
+
+def jinja_env(strict: bool = False) -> "jinja2.Environment":
+    """Returns the environment used for all templates.
+
+    If 'strict', the environment used for validation is returned instead, in
+    which undefined variables are an error.
+    """
+    with _LOCK:
+        if strict not in _ENVS:
+            _ENVS[strict] = _new_env(strict)
+        return _ENVS[strict]
+
+
+def jinja_template(source: str, strict: bool = False) -> "jinja2.Template":
+    """Returns the template compiled from 'source', compiling it only if not
+    already done."""
+    name = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    with _LOCK:
+        _SOURCES[name] = source
+    return jinja_env(strict).get_template(name)
+
+
+def jinja_bytecode_cache(cache_dir: Optional[str]) -> None:
+    """Keep compiled templates in 'cache_dir' (if set) across runs.
+
+    Only the BYTECODE_CACHE_LIMIT most recently used templates are kept.
+    """
+    global _BYTECODE_CACHE_DIR
+
+    with _LOCK:
+        _BYTECODE_CACHE_DIR = cache_dir
+        # Environments are created again, with the new setting, when next used.
+        _ENVS.clear()
+
+
+def jinja_render(template: str, **kwargs) -> str:
+    return jinja_template(template).render(jinja_args(**kwargs))
+
+
 def jinja_validate(template: str, **kwargs):
-    loader = jinja2.DictLoader({"template": template})
-    env = jinja2.Environment(undefined=jinja2.StrictUndefined)
-    loader.load(env, "template").render(jinja_args(**kwargs))
+    jinja_template(template, strict=True).render(jinja_args(**kwargs))
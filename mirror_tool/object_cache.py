@@ -0,0 +1,266 @@
+import fcntl
+import hashlib
+import logging
+import os
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional, Tuple
+
+LOG = logging.getLogger("mirror-tool")
+
+RunCmd = Callable[..., subprocess.CompletedProcess]
+
+# Least recently used refs are evicted in batches of this fraction of the
+# evictable refs, as each batch costs a git gc of the whole cache.
+EVICT_BATCHES = 4
+
+
+class ObjectCache:
+    """A bare git repository keeping fetched upstream objects across runs.
+
+    The cache is attached to the superproject as an alternate object store,
+    so that objects fetched into the cache are usable without being copied.
+
+    Multiple processes may use a single cache concurrently. Each process holds
+    a shared lock on the cache for as long as it may need objects from the cache,
+    and objects are only evicted while holding an exclusive lock.
+
+    As objects may be evicted once no process holds the shared lock, the
+    superproject is detached from the cache, after copying the objects it
+    borrowed, before the lock is released. The refs of the superproject when
+    the cache was attached are recorded, so that only objects not reachable
+    from those need to be copied.
+    """
+
+    def __init__(self, path: str, max_size_mb: int, run_cmd: RunCmd):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.run_cmd = run_cmd
+        self._lock_fd: Optional[int] = None
+        self._local_tips: Optional[List[str]] = None
+
+    @property
+    def objects_path(self) -> str:
+        return os.path.join(self.path, "objects")
+
+    def _meta_path(self, *parts: str) -> str:
+        return os.path.join(self.path, "mirror-tool", *parts)
+
+    def git(self, *args: str, **kwargs) -> subprocess.CompletedProcess:
+        return self.run_cmd(["git", f"--git-dir={self.path}"] + list(args), **kwargs)
+
+    def open(self) -> None:
+        """Create the cache if needed and lock it for use by this process.
+
+        The lock is held until close() is called or the process exits.
+        """
+        if self._lock_fd is not None:
+            return
+
+        os.makedirs(self._meta_path("used"), exist_ok=True)
+        os.makedirs(self._meta_path("locks"), exist_ok=True)
+
+        self._lock_fd = os.open(self._meta_path("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+
+        if not os.path.exists(os.path.join(self.path, "HEAD")):
+            self.run_cmd(["git", "init", "--quiet", "--bare", self.path])
+
+    def close(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _alternates(self) -> Tuple[str, List[str]]:
+        """Returns the path of the current repo's alternates file, and the
+        object stores listed in it."""
+        path = (
+            self.run_cmd(
+                ["git", "rev-parse", "--git-path", "objects/info/alternates"],
+                capture_output=True,
+                silent=True,
+            )
+            .stdout.decode("utf-8")
+            .strip()
+        )
+
+        existing = []
+        if os.path.exists(path):
+            with open(path, "rt") as f:
+                existing = f.read().splitlines()
+
+        return (path, existing)
+
+    def attach(self) -> None:
+        """Attach the cache as an alternate object store of the current repo."""
+        (alternates, existing) = self._alternates()
+
+        if self.objects_path not in existing:
+            # All objects reachable from these are in the current repo itself.
+            self._local_tips = (
+                self.run_cmd(
+                    ["git", "show-ref", "--head", "--hash"],
+                    check=False,
+                    capture_output=True,
+                    silent=True,
+                )
+                .stdout.decode("utf-8")
+                .split()
+            )
+
+            LOG.info("Using object cache at %s", self.path)
+            os.makedirs(os.path.dirname(alternates), exist_ok=True)
+            with open(alternates, "at") as f:
+                f.write(self.objects_path + "\n")
+
+    def detach(self) -> None:
+        """Make the current repo independent of the cache, if attached.
+
+        Objects borrowed from the cache are copied into the repo first, so the
+        repo stays intact when they're later evicted from the cache.
+        """
+        (alternates, existing) = self._alternates()
+        if self.objects_path not in existing:
+            return
+
+        if self._local_tips is None:
+            # Attached by an earlier process, so anything may be borrowed.
+            self.run_cmd(["git", "repack", "-a", "-d", "--quiet"])
+        else:
+            self._copy_borrowed(self._local_tips)
+            self._local_tips = None
+
+        remaining = [path for path in existing if path != self.objects_path]
+        if remaining:
+            with open(alternates, "wt") as f:
+                f.write("".join(path + "\n" for path in remaining))
+        else:
+            os.remove(alternates)
+
+    def _copy_borrowed(self, local_tips: List[str]) -> None:
+        # Objects which may be borrowed are those reachable from refs, other
+        # than from refs which existed before attaching. The index isn't
+        # considered, as it matches HEAD after any successful update.
+        objects = self.run_cmd(
+            ["git", "rev-list", "--objects", "--all", "--reflog", "--stdin"],
+            input="".join(f"^{tip}\n" for tip in local_tips).encode("utf-8"),
+            capture_output=True,
+            silent=True,
+        ).stdout
+        if not objects:
+            return
+
+        pack = (
+            self.run_cmd(
+                ["git", "rev-parse", "--git-path", "objects/pack/pack"],
+                capture_output=True,
+                silent=True,
+            )
+            .stdout.decode("utf-8")
+            .strip()
+        )
+        self.run_cmd(
+            ["git", "pack-objects", "--quiet", pack],
+            input=objects,
+            capture_output=True,
+        )
+
+    @contextmanager
+    def url_lock(self, url: str):
+        """Serializes fetches of the same url across all users of the cache."""
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        with open(self._meta_path("locks", name), "at") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def touch(self, ref: str) -> None:
+        """Record that 'ref' in the cache has just been used."""
+        name = hashlib.sha1(ref.encode("utf-8")).hexdigest()
+        with open(self._meta_path("used", name), "wt") as f:
+            f.write(ref)
+
+    def refs(self) -> set[str]:
+        """Returns the names of all refs in the cache."""
+        output = self.git(
+            "for-each-ref", "--format=%(refname)", capture_output=True, silent=True
+        ).stdout.decode("utf-8")
+        return set(output.split())
+
+    def size(self) -> int:
+        """Returns the approximate size of the cache's objects, in bytes."""
+        output = self.git(
+            "count-objects", "-v", capture_output=True, silent=True
+        ).stdout.decode("utf-8")
+
+        size_kib = 0
+        for line in output.splitlines():
+            (key, _, value) = line.partition(": ")
+            if key in ("size", "size-pack"):
+                size_kib += int(value)
+
+        return size_kib * 1024
+
+    def evict(self, protect: Iterable[str] = ()) -> None:
+        """Evict least recently used refs, and the objects only reachable from
+        them, until the cache no longer exceeds its maximum size.
+
+        Refs in 'protect' are never evicted. Nothing is evicted while any other
+        process is using the cache.
+        """
+        if self.size() <= self.max_size:
+            return
+
+        # Only one process may evict at a time. This lock is taken while still
+        # holding the shared lock, so that no other process can take the
+        # exclusive lock in the window while the shared lock is converted
+        # below, which isn't atomic.
+        with open(self._meta_path("evict-lock"), "at") as evict_lock:
+            try:
+                fcntl.flock(evict_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                LOG.info("Object cache is being evicted by another process.")
+                return
+
+            # Other processes only ever take the shared lock, so it can be
+            # reacquired without waiting whether or not this succeeds.
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                LOG.info("Object cache is in use by another process, not evicting.")
+                fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+                return
+
+            try:
+                self._evict(set(protect))
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+
+    def _evict(self, protect: set[str]) -> None:
+        candidates = []
+        used_dir = self._meta_path("used")
+        for name in os.listdir(used_dir):
+            path = os.path.join(used_dir, name)
+            with open(path, "rt") as f:
+                ref = f.read()
+            if ref not in protect:
+                candidates.append((os.stat(path).st_mtime, ref, path))
+
+        candidates.sort()
+        batch_size = max(1, len(candidates) // EVICT_BATCHES)
+
+        while candidates:
+            (batch, candidates) = (candidates[:batch_size], candidates[batch_size:])
+            for _, ref, _ in batch:
+                LOG.info("Evicting %s from object cache", ref)
+
+            self.git(
+                "update-ref",
+                "--stdin",
+                input="".join(f"delete {ref}\n" for _, ref, _ in batch).encode("utf-8"),
+            )
+            for _, _, path in batch:
+                os.remove(path)
+
+            self.git("gc", "--quiet", "--prune=now")
+            if self.size() <= self.max_size:
+                break
@@ -1,8 +1,97 @@
 from dataclasses import dataclass
+from datetime import datetime
+from typing import Generator
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Mirror:
     url: str
     ref: str
     dir: str = "upstream"
+
+
+@dataclass(slots=True)
+class Commit:
+    """Contains info on a single commit."""
+
+    revision: str
+    """The commit's revision (SHA1)."""
+
+    revision_abbrev: str
+    """The commit's abbreviated revision."""
+
+    author_name: str
+    """The author's name."""
+
+    author_email: str
+    """The author's email."""
+
+    author_email_local: str
+    """The local part of the author's email (prior to the '@' character)."""
+
+    author_datetime: datetime
+    """The 'author' timestamp."""
+
+    committer_name: str
+    """The committer's name."""
+
+    committer_email: str
+    """The committer's email."""
+
+    committer_email_local: str
+    """The local part of the committer's email (prior to the '@' character)."""
+
+    committer_datetime: datetime
+    """The 'committer' timestamp."""
+
+    subject: str
+    """The subject line from the commit message."""
+
+    body: str = ""
+    """The body of the commit message."""
+
+    url: str = ""
+    """A URL at which this commit can possibly be accessed.
+
+    This value is guessed based on the Git hosting service which appears to be in use
+    for the mirrored repo. It might be wrong or missing in some cases.
+    """
+
+    @classmethod
+    def from_log(cls, log: bytes) -> Generator["Commit", None, None]:
+        # Parse a git log into Commit objects.
+        # Log should be generated by command:
+        # git log --pretty=format:%H%n%h%n%an%n%ae%n%al%n%at%n%cn%n%ce%n%cl%n%ct%n%s%n%b -z
+        #
+        # Each entry is located by offset within the log and only decoded once
+        # the generator reaches it, without copying the log into a list of
+        # entries first.
+        view = memoryview(log)
+        start = 0
+
+        while start <= len(log):
+            end = log.find(b"\x00", start)
+            if end == -1:
+                end = len(log)
+
+            lines = str(view[start:end], "utf-8").splitlines()
+            start = end + 1
+            if not lines:
+                continue
+
+            kwargs = {}
+
+            kwargs["revision"] = lines.pop(0)
+            kwargs["revision_abbrev"] = lines.pop(0)
+            kwargs["author_name"] = lines.pop(0)
+            kwargs["author_email"] = lines.pop(0)
+            kwargs["author_email_local"] = lines.pop(0)
+            kwargs["author_datetime"] = datetime.utcfromtimestamp(int(lines.pop(0)))
+            kwargs["committer_name"] = lines.pop(0)
+            kwargs["committer_email"] = lines.pop(0)
+            kwargs["committer_email_local"] = lines.pop(0)
+            kwargs["committer_datetime"] = datetime.utcfromtimestamp(int(lines.pop(0)))
+            kwargs["subject"] = lines.pop(0)
+            kwargs["body"] = "\n".join(lines)
+
+            yield Commit(**kwargs)
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+import mirror_tool
+
+BENCHMARKS = os.path.join(
+    os.path.dirname(os.path.dirname(mirror_tool.__file__)), "benchmarks"
+)
+
+
+def test_update_local_benchmark(tmpdir):
+    """The update-local benchmark runs and records its measurements."""
+
+    results_file = tmpdir.join("results.json")
+    subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, "update_local.py")]
+        + ["--mirrors", "2", "--depth", "3", "--files", "2", "--commits", "1,2"]
+        + ["--json", str(results_file)],
+        check=True,
+        capture_output=True,
+    )
+
+    results = json.loads(results_file.read())
+
+    assert [(r["commits"], r["phase"], r["updated"]) for r in results] == [
+        (1, "initial", 2),
+        (1, "incremental", 2),
+        (2, "initial", 2),
+        (2, "incremental", 2),
+    ]
+    for result in results:
+        assert result["wall_s"] > 0
+        assert result["subprocesses"] > 0
+        assert result["peak_rss_kib"] > 0
+
+
+def test_startup_benchmark():
+    """The startup benchmark runs within a generous budget."""
+
+    proc = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, "startup.py")]
+        + ["--runs", "1", "--budget-ms", "10000"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    assert "validate-config" in proc.stdout
@@ -0,0 +1,45 @@
+from mirror_tool.cmd import MirrorTool
+from mirror_tool.conf import VALIDATE_UPDATEINFO, Config
+
+
+def test_commitmsg_for_update():
+    """Commit messages are rendered from UpdateInfo objects."""
+
+    tool = MirrorTool()
+    tool._config = Config(
+        {
+            "commitmsg": (
+                "Merge {{ commits[0].revision_abbrev }} to {{ mirror.dir }}\n"
+                "{% for commit in commits %}"
+                "- {{ commit['subject'] }} ({{ commit.author_datetime.year }})"
+                "{% endfor %}"
+            )
+        }
+    )
+
+    assert tool.commitmsg_for_update(VALIDATE_UPDATEINFO) == (
+        "Merge 55810cd to upstream\n"
+        "- Merge pull request #33 from rohanpm/empty-log (2022)"
+    )
+
+
+def test_commitmsg_mapping_access():
+    """Templates may access the update's objects as mappings."""
+
+    tool = MirrorTool()
+    tool._config = Config(
+        {
+            "commitmsg": (
+                "{{ mirror['dir'] }}"
+                "{% for key, value in mirror.items() %} {{ key }}={{ value }}"
+                "{% endfor %}\n"
+                "{{ commits[0].keys()|list|length }} {{ commits|first is mapping }}"
+            )
+        }
+    )
+
+    assert tool.commitmsg_for_update(VALIDATE_UPDATEINFO) == (
+        "upstream url=https://example.com/foo"
+        " ref=refs/heads/quux dir=upstream\n"
+        "13 True"
+    )
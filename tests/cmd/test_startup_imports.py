@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import mirror_tool
+
+# Dependencies which are comparatively slow to import.
+SLOW_MODULES = {"jinja2", "jsonschema", "requests", "ruamel.yaml"}
+
+CONFIG = textwrap.dedent(
+    """
+    mirror: []
+    gitlab_merge:
+      enabled: false
+    """
+)
+
+CONFIG_GITLAB = textwrap.dedent(
+    """
+    mirror: []
+    gitlab_merge:
+      enabled: true
+    """
+)
+
+
+def imported_modules(args, cwd):
+    """Returns the names of all modules imported while running mirror-tool
+    with the given args, as reported by 'python -X importtime'."""
+
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(mirror_tool.__file__))]
+        + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c"]
+        + ["from mirror_tool.cmd import entrypoint; entrypoint()"]
+        + args,
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    out = set()
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:"):
+            out.add(line.split("|")[-1].strip())
+    return out
+
+
+@pytest.mark.parametrize(
+    "args, config, allowed",
+    [
+        (["--help"], CONFIG, set()),
+        (["validate-config"], CONFIG, {"jinja2", "jsonschema", "ruamel.yaml"}),
+        (["gitlab-ci-yml"], CONFIG_GITLAB, {"jinja2", "ruamel.yaml"}),
+        (["update-local"], CONFIG, {"ruamel.yaml"}),
+        (["update"], CONFIG, {"ruamel.yaml"}),
+        (["prefetch"], CONFIG, {"ruamel.yaml"}),
+        (["promote"], CONFIG, {"ruamel.yaml"}),
+        # With a cache dir, parsing the config can be avoided too.
+        (["--cache-dir", "cache", "update-local"], CONFIG, set()),
+    ],
+)
+def test_startup_imports(tmpdir, run_git, args, config, allowed):
+    """Each command imports only the slow dependencies it needs."""
+
+    run_git("init", "-q", tmpdir)
+    run_git("-C", tmpdir, "commit", "-q", "--allow-empty", "-m", "initial")
+    tmpdir.join(".mirror-tool.yaml").write(config)
+
+    if "--cache-dir" in args:
+        # Warm the cache first.
+        imported_modules(args, str(tmpdir))
+
+    imported = imported_modules(args, str(tmpdir))
+
+    assert "mirror_tool.cmd" in imported
+    assert imported & SLOW_MODULES <= allowed
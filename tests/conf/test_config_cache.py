@@ -0,0 +1,98 @@
+import dataclasses
+import json
+import os
+
+import pytest
+
+from mirror_tool import conf
+from mirror_tool.conf import Config
+
+
+def test_model_built_once():
+    """Parts of the config are built once and can't be modified."""
+
+    config = Config(
+        {
+            "mirror": [{"url": "https://example.com/repo", "ref": "main"}],
+            "gitlab_promote": [{"src": "a", "dest": "b"}],
+        }
+    )
+
+    assert config.mirrors is config.mirrors
+    assert config.gitlab_merge is config.gitlab_merge
+    assert config.gitlab_promote is config.gitlab_promote
+    assert config.fetch is config.fetch
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.mirrors[0].dir = "other"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.gitlab_promote[0].dest = "c"
+
+
+def test_parsed_config_cached(tmpdir, monkeypatch):
+    """Parsed config is kept in cache dir and reused while unchanged."""
+
+    conf_file = tmpdir.join("mirror-tool.yaml")
+    conf_file.write("mirror:\n- url: https://example.com/repo\n  ref: main\n")
+    cache_dir = tmpdir.join("cache")
+
+    config = Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+    assert config.mirrors[0].url == "https://example.com/repo"
+    assert len(cache_dir.listdir()) == 1
+
+    # Loading again doesn't need to parse any YAML.
+    with monkeypatch.context() as m:
+        m.setattr(conf, "parse_yaml", None)
+        config = Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+    assert config.mirrors[0].url == "https://example.com/repo"
+
+    # Changed content is parsed again.
+    conf_file.write("mirror:\n- url: https://example.com/other\n  ref: main\n")
+    config = Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+    assert config.mirrors[0].url == "https://example.com/other"
+    assert len(cache_dir.listdir()) == 2
+
+    # Corrupt cache is ignored and replaced.
+    for path in cache_dir.listdir():
+        path.write("{")
+    config = Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+    assert config.mirrors[0].url == "https://example.com/other"
+    config = Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+    assert config.mirrors[0].url == "https://example.com/other"
+
+
+def test_config_cache_bounded(tmpdir, monkeypatch):
+    """Only the most recently used parsed configs are kept."""
+
+    monkeypatch.setattr(conf, "CONFIG_CACHE_LIMIT", 2)
+    conf_file = tmpdir.join("mirror-tool.yaml")
+    cache_dir = tmpdir.join("cache")
+
+    for url in ("a", "b", "a", "c"):
+        conf_file.write(f"mirror:\n- url: https://example.com/{url}\n  ref: main\n")
+        Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+        for i, path in enumerate(sorted(cache_dir.listdir(), key=lambda p: p.mtime())):
+            # Keep the order of use, despite coarse file timestamps.
+            os.utime(str(path), (i, i))
+
+    # The config least recently used was removed.
+    assert sorted(
+        json.loads(path.read())["mirror"][0]["url"] for path in cache_dir.listdir()
+    ) == ["https://example.com/a", "https://example.com/c"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    ["git_config:\n  some.date: 2022-05-10\n", "git_config:\n  1: one\n"],
+    ids=["not-json", "json-differs"],
+)
+def test_uncacheable_config(tmpdir, content):
+    """Configs which can't be represented as JSON are not cached."""
+
+    conf_file = tmpdir.join("mirror-tool.yaml")
+    conf_file.write(content)
+    cache_dir = tmpdir.join("cache")
+
+    config = Config.from_file(str(conf_file), cache_dir=str(cache_dir))
+    assert config.git_config
+    assert not cache_dir.exists()
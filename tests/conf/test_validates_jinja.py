@@ -24,3 +24,15 @@ def test_validates_jinja_templates():
 
     # And where
     assert list(exc.value.path) == ["gitlab_promote", 0, "comment", "create"]
+
+
+def test_validates_combined_commitmsg():
+    """Config validation renders commitmsg_combined with a list of updates."""
+
+    conf = Config({"commitmsg_combined": "{{ updates[0].mirror.oops }}"})
+
+    with pytest.raises(jsonschema.ValidationError) as exc:
+        conf.validate()
+
+    assert "Invalid Jinja template" in str(exc)
+    assert list(exc.value.path) == ["commitmsg_combined"]
@@ -0,0 +1,60 @@
+import jsonschema
+import pytest
+
+from mirror_tool.conf import CONFIG_SCHEMA, Config, config_validator
+
+
+def test_schema_is_valid():
+    """The precompiled validator uses a valid schema."""
+    type(config_validator()).check_schema(CONFIG_SCHEMA)
+
+
+def test_collects_schema_errors():
+    """Every part of the config not matching the schema is reported at once."""
+
+    conf = Config(
+        {
+            "mirror": [
+                {"url": "https://example.com/ok", "ref": "refs/heads/main"},
+                {"url": "https://example.com/a", "ref": "x", "dir": "../a"},
+                {"url": "https://example.com/b"},
+            ],
+            "fetch": {"jobs": 0},
+        }
+    )
+
+    errors = conf.validation_errors()
+
+    assert sorted(".".join(map(str, e.absolute_path)) for e in errors) == [
+        "fetch.jobs",
+        "mirror.1.dir",
+        "mirror.1.ref",
+        "mirror.2",
+    ]
+
+
+def test_collects_semantic_errors():
+    """Duplicate dirs and every invalid template are reported at once."""
+
+    mirror = {"url": "https://example.com/repo", "ref": "refs/heads/main"}
+    conf = Config(
+        {
+            "mirror": [mirror, mirror, mirror],
+            "commitmsg": "{{ oops }}",
+            "gitlab_promote": [{"title": "{{ broken"}],
+        }
+    )
+
+    errors = conf.validation_errors()
+
+    assert [list(e.path) for e in errors] == [
+        ["mirror", 1],
+        ["mirror", 2],
+        ["commitmsg"],
+        ["gitlab_promote", 0, "title"],
+    ]
+
+    # validate still raises, with the first of those errors
+    with pytest.raises(jsonschema.ValidationError) as exc:
+        conf.validate()
+    assert exc.value.message == "Multiple mirrors defined using same dir"
@@ -1,6 +1,10 @@
+from subprocess import check_call
+
 import pytest
 import requests_mock
 
+from mirror_tool.git_config import environ_with_git_config
+
 
 @pytest.fixture(autouse=True)
 def requests_mocker():
@@ -8,3 +12,15 @@ def requests_mocker():
     # requests without it being noticed.
     with requests_mock.Mocker() as m:
         yield m
+
+
+@pytest.fixture
+def run_git():
+    env = environ_with_git_config(
+        {"user.name": "test", "user.email": "mirror-tool@example.com"}
+    )
+
+    def run(*args, **kwargs):
+        return check_call(["git"] + [str(a) for a in args], env=env, **kwargs)
+
+    return run
@@ -0,0 +1,83 @@
+import logging
+import os
+
+from mirror_tool.file_cache import (
+    load_json,
+    prune_cache,
+    store_json,
+    touch,
+    write_atomic,
+)
+
+
+def test_store_load(tmpdir, caplog):
+    """JSON cache files round-trip, and missing or corrupt files are ignored."""
+    caplog.set_level(logging.DEBUG, logger="mirror-tool")
+
+    path = str(tmpdir.join("sub", "file.json"))
+    assert load_json(path) is None
+
+    store_json(path, {"a": [1, 2]})
+    assert load_json(path) == {"a": [1, 2]}
+
+    write_atomic(path, "{not json")
+    assert load_json(path) is None
+    assert "Ignoring corrupt cache file" in caplog.text
+
+    # No temporary files were left behind.
+    assert tmpdir.join("sub").listdir() == [tmpdir.join("sub", "file.json")]
+
+
+def test_write_fails(tmpdir, monkeypatch, caplog):
+    """Failing to write a cache file only logs a warning."""
+
+    tmpdir.join("file").write("")
+    write_atomic(str(tmpdir.join("file", "cache.json")), "{}")
+    assert "Failed to write cache file" in caplog.text
+
+    def replace(*_):
+        raise OSError("simulated error")
+
+    monkeypatch.setattr(os, "replace", replace)
+    caplog.clear()
+    write_atomic(str(tmpdir.join("cache.json")), "{}")
+    assert "simulated error" in caplog.text
+    assert tmpdir.listdir() == [tmpdir.join("file")]
+
+
+def test_prune(tmpdir):
+    """Only the most recently used files with the given suffix are kept."""
+
+    for i, name in enumerate(["a.json", "b.json", "c.json", "other", "d.tmp"]):
+        tmpdir.join(name).write(name)
+        os.utime(str(tmpdir.join(name)), (i, i))
+    touch(str(tmpdir.join("a.json")))
+
+    prune_cache(str(tmpdir), 2, ".json")
+
+    assert sorted(p.basename for p in tmpdir.listdir()) == [
+        "a.json",
+        "c.json",
+        "d.tmp",
+        "other",
+    ]
+
+
+def test_prune_concurrent(monkeypatch, tmpdir):
+    """Pruning tolerates files removed meanwhile by another run."""
+
+    tmpdir.join("dangling").mksymlinkto(tmpdir.join("missing"))
+    for name in ("a", "b"):
+        tmpdir.join(name).write(name)
+
+    remove = os.remove
+
+    def remove_twice(path):
+        remove(path)
+        remove(path)
+
+    monkeypatch.setattr(os, "remove", remove_twice)
+    prune_cache(str(tmpdir), 1)
+    touch(str(tmpdir.join("missing")))
+
+    assert len(tmpdir.listdir()) == 2
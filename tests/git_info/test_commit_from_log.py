@@ -1,3 +1,5 @@
+import pytest
+
 from mirror_tool.git_info import Commit
 
 
@@ -6,3 +8,27 @@ def test_empty_commits():
 
     commits = list(Commit.from_log(b"\x00\x00\x00"))
     assert commits == []
+
+
+def test_parses_lazily():
+    """Entries are only parsed as they're consumed."""
+
+    entry = (
+        b"55810cd62082f26ec39a9df332af1aa9db6e6b91\n55810cd\n"
+        b"Rohan McGovern\nrohan@mcgovern.id.au\nrohan\n1654554814\n"
+        b"GitHub\nnoreply@github.com\nnoreply\n1654554814\n"
+        b"Merge pull request #33 from rohanpm/empty-log\n"
+    )
+
+    # A log where the second entry is broken
+    commits = Commit.from_log(entry + b"\x00not a valid entry")
+
+    # The first commit can still be obtained
+    commit = next(commits)
+    assert commit.revision_abbrev == "55810cd"
+    assert commit.subject == "Merge pull request #33 from rohanpm/empty-log"
+    assert commit.body == ""
+
+    # The problem is only noticed once the broken entry is reached
+    with pytest.raises(IndexError):
+        next(commits)
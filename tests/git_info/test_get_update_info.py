@@ -63,11 +63,26 @@ Improve README and package metadata
 """
 
 
-def test_get_update_info_limits(monkeypatch):
-    def return_sample_log(*args, **kwargs):
-        return SAMPLE_LOG
+def fake_check_output(commands):
+    # Returns a check_output replacement simulating git commands against
+    # the history in SAMPLE_LOG, recording each command run.
+    entries = SAMPLE_LOG.split(b"\x00")
+
+    def check_output(args, **kwargs):
+        commands.append(args)
+        if args[1] == "rev-list":
+            return f"{len(entries)}\n"
+
+        assert args[1] == "log"
+        limit = int(args[3][len("--max-count=") :])
+        return b"\x00".join(entries[:limit])
+
+    return check_output
 
-    monkeypatch.setattr(subprocess, "check_output", return_sample_log)
+
+def test_get_update_info_limits(monkeypatch):
+    commands = []
+    monkeypatch.setattr(subprocess, "check_output", fake_check_output(commands))
 
     mirror = Mirror(url="https://example.com", ref="refs/heads/main")
 
@@ -105,3 +120,30 @@ def test_get_update_info_limits(monkeypatch):
 
     # The generated commits should be in the same order as with no limit
     assert update_limit.commits == update_all.commits[:2]
+
+    # It should only have asked git for the commits it needed
+    assert commands[-2] == ["git", "rev-list", "--count", "HEAD..a"]
+    assert commands[-1][:4] == ["git", "log", "-z", "--max-count=2"]
+
+
+def test_get_update_info_unchanged(monkeypatch):
+    """get_update_info does not bother with logs if there are no commits."""
+
+    commands = []
+
+    def check_output(args, **kwargs):
+        commands.append(args)
+        return "0\n"
+
+    monkeypatch.setattr(subprocess, "check_output", check_output)
+
+    mirror = Mirror(url="https://example.com", ref="refs/heads/main")
+    update = get_update_info("a", mirror, rev_from="b")
+
+    # It should tell us that nothing changed
+    assert not update.changed
+    assert update.commit_count == 0
+    assert update.commits == []
+
+    # And only needed to count the commits to know that
+    assert commands == [["git", "rev-list", "--count", "b..a"]]
@@ -0,0 +1,28 @@
+import os
+import subprocess
+
+from mirror_tool.git_info import graft_tree
+from mirror_tool.git_session import GitSession
+
+
+def test_graft_tree_uses_session_env(tmpdir, monkeypatch, run_git):
+    """graft_tree runs git with the environment of the given session."""
+
+    repo = tmpdir.join("repo")
+    run_git("init", "-b", "main", repo)
+    repo.mkdir("vendor").join("README").write("vendored code")
+    repo.join("file").write("content")
+    run_git("add", ".", cwd=str(repo))
+    run_git("commit", "-m", "initial", cwd=str(repo))
+
+    # Not in the repo, so only the session's GIT_DIR locates it.
+    monkeypatch.chdir(str(tmpdir))
+    git = GitSession(env=dict(os.environ, GIT_DIR=str(repo.join(".git"))))
+    (file_tree,) = git.resolve(["HEAD^{tree}"])
+
+    tree = graft_tree("HEAD", "vendor/new", file_tree, git=git)
+
+    ls_tree = subprocess.check_output(
+        ["git", "ls-tree", "-r", "--name-only", tree], cwd=str(repo), text=True
+    )
+    assert ls_tree == "file\nvendor/README\nvendor/new/file\nvendor/new/vendor/README\n"
@@ -0,0 +1,71 @@
+from subprocess import check_output
+
+from mirror_tool.conf import Mirror
+from mirror_tool.git_info import merged_mirrors
+
+
+def test_merged_mirrors_empty(monkeypatch):
+    """merged_mirrors with no mirrors returns nothing without running git."""
+
+    def no_run(*args, **kwargs):
+        raise AssertionError("should not be called")
+
+    monkeypatch.setattr("subprocess.run", no_run)
+
+    assert merged_mirrors([]) == []
+
+
+def test_merged_mirrors_unknown_revision(tmpdir, monkeypatch, run_git):
+    """merged_mirrors does not consider a mirror up-to-date if the upstream
+    revision isn't available locally."""
+
+    run_git("init", "-b", "main", tmpdir)
+    tmpdir.join("mirror1").mkdir().join("file").write("1")
+    run_git("add", "mirror1", cwd=str(tmpdir))
+    run_git("commit", "-m", "add mirror1", cwd=str(tmpdir))
+    monkeypatch.chdir(str(tmpdir))
+
+    mirror = Mirror(url="../repo1", ref="refs/heads/main", dir="mirror1")
+    assert merged_mirrors([(mirror, "a" * 40)]) == []
+
+
+def test_merged_mirrors_unrecorded(tmpdir, monkeypatch, run_git):
+    """merged_mirrors checks ancestry of upstream revisions if no revision
+    was recorded for a mirror."""
+
+    upstream = tmpdir.join("upstream")
+    run_git("init", "-b", "main", upstream)
+    upstream.join("file").write("1")
+    run_git("add", "file", cwd=str(upstream))
+    run_git("commit", "-m", "upstream commit", cwd=str(upstream))
+
+    # A superproject which has merged the upstream, without a trailer.
+    reposuper = tmpdir.join("super")
+    run_git("init", "-b", "main", reposuper)
+    run_git("commit", "--allow-empty", "-m", "initial", cwd=str(reposuper))
+    run_git("fetch", "../upstream", "main:upstream", cwd=str(reposuper))
+    run_git(
+        "merge",
+        "-s",
+        "ours",
+        "--no-commit",
+        "--allow-unrelated-histories",
+        "upstream",
+        cwd=str(reposuper),
+    )
+    run_git("read-tree", "--prefix=mirror1/", "-u", "upstream", cwd=str(reposuper))
+    run_git("commit", "-m", "merge upstream", cwd=str(reposuper))
+
+    # And another upstream commit with the same content, not yet merged.
+    run_git("commit", "--allow-empty", "-m", "empty", cwd=str(upstream))
+    run_git("fetch", "../upstream", "main:upstream", cwd=str(reposuper))
+
+    monkeypatch.chdir(str(reposuper))
+    mirror = Mirror(url="../upstream", ref="refs/heads/main", dir="mirror1")
+    (merged, unmerged) = [
+        check_output(["git", "rev-parse", rev], text=True).strip()
+        for rev in ("upstream~", "upstream")
+    ]
+
+    assert merged_mirrors([(mirror, merged)]) == [mirror]
+    assert merged_mirrors([(mirror, unmerged)]) == []
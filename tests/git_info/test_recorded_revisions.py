@@ -0,0 +1,162 @@
+import sys
+import textwrap
+
+from mirror_tool import git_info
+from mirror_tool.cmd import entrypoint
+from mirror_tool.git_info import recorded_revisions
+from mirror_tool.git_session import GitSession
+
+TRAILER = "Mirror-Tool-Upstream"
+
+
+def test_recorded_revisions_empty():
+    """recorded_revisions with no dirs returns nothing."""
+    assert recorded_revisions([]) == {}
+
+
+def test_recorded_revisions(tmpdir, monkeypatch, run_git):
+    """recorded_revisions returns the most recently recorded revision per dir."""
+
+    run_git("init", "-b", "main", tmpdir)
+    monkeypatch.chdir(str(tmpdir))
+
+    def commit(*trailers):
+        cmd = ["commit", "--allow-empty", "-m", "some commit"]
+        for trailer in trailers:
+            cmd.extend(["--trailer", f"Mirror-Tool-Upstream: {trailer}"])
+        run_git(*cmd)
+
+    commit("a1 dir1")
+    commit("a2 dir2")
+    commit()
+    commit("b1 dir1")
+    commit("b2 some dir")
+
+    assert recorded_revisions(["dir1", "dir2", "some dir", "dir3"]) == {
+        "dir1": "b1",
+        "dir2": "a2",
+        "some dir": "b2",
+    }
+
+    # Lookup can be done from any revision.
+    assert recorded_revisions(["dir1"], rev_from="HEAD~2") == {"dir1": "a1"}
+
+
+def test_recorded_revisions_limit(tmpdir, monkeypatch, run_git):
+    """recorded_revisions reads a bounded number of commits."""
+
+    run_git("init", "-b", "main", tmpdir)
+    monkeypatch.chdir(str(tmpdir))
+
+    run_git("commit", "--allow-empty", "-m", "x", "--trailer", f"{TRAILER}: a1 dir1")
+    for _ in range(3):
+        run_git("commit", "--allow-empty", "-m", "no trailer")
+
+    monkeypatch.setattr(git_info, "RECORD_LIMIT", 3)
+    assert recorded_revisions(["dir1"]) == {}
+
+    monkeypatch.setattr(git_info, "RECORD_LIMIT", 4)
+    assert recorded_revisions(["dir1"]) == {"dir1": "a1"}
+
+
+def test_recorded_revisions_cache(tmpdir, monkeypatch, run_git):
+    """With a cache dir, later lookups only read commits made since the
+    previous lookup, even for dirs never recorded."""
+
+    repo = tmpdir.join("repo")
+    cache_dir = str(tmpdir.join("cache"))
+    run_git("init", "-b", "main", repo)
+    monkeypatch.chdir(str(repo))
+
+    def commit(*trailers):
+        cmd = ["commit", "--allow-empty", "-m", "some commit"]
+        for trailer in trailers:
+            cmd.extend(["--trailer", f"{TRAILER}: {trailer}"])
+        run_git(*cmd)
+
+    read = []
+    trailers = GitSession.trailers
+
+    def counting_trailers(self, *args):
+        for item in trailers(self, *args):
+            read.append(item[0])
+            yield item
+
+    monkeypatch.setattr(GitSession, "trailers", counting_trailers)
+
+    commit("a1 dir1")
+    commit("a2 dir2")
+    commit()
+
+    dirs = ["dir1", "dir2", "dir3"]
+    assert recorded_revisions(dirs, cache_dir=cache_dir) == {"dir1": "a1", "dir2": "a2"}
+    assert len(read) == 3
+
+    commit("b1 dir1")
+    commit()
+
+    read.clear()
+    assert recorded_revisions(dirs, cache_dir=cache_dir) == {"dir1": "b1", "dir2": "a2"}
+    # Only the new commits, and the one found in the cache, were read
+    assert len(read) == 3
+
+    read.clear()
+    assert recorded_revisions(dirs, cache_dir=cache_dir) == {"dir1": "b1", "dir2": "a2"}
+    assert len(read) == 1
+
+    # A lookup from elsewhere in history still works
+    assert recorded_revisions(dirs, "HEAD~2", cache_dir=cache_dir) == {
+        "dir1": "a1",
+        "dir2": "a2",
+    }
+
+    # And a corrupt cache is ignored
+    for corrupt in ("oops", "[]"):
+        tmpdir.join("cache", "recorded.json").write(corrupt)
+        assert recorded_revisions(dirs, cache_dir=cache_dir) == {
+            "dir1": "b1",
+            "dir2": "a2",
+        }
+
+
+def test_update_records_revisions(tmpdir, monkeypatch, run_git):
+    """update-local records the merged upstream revision of each mirror."""
+
+    repo1 = tmpdir.join("repo1")
+    reposuper = tmpdir.join("super")
+
+    run_git("init", "-b", "main", repo1)
+    run_git("init", "-b", "main", reposuper)
+
+    repo1.join("file1").write("1")
+    run_git("add", "file1", cwd=str(repo1))
+    run_git("commit", "-m", "commit in repo1", cwd=str(repo1))
+
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1-copy
+            git_config:
+              user.name: test
+              user.email: tester@example.com
+            """
+        )
+    )
+    run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+    run_git("commit", "-m", "add config", cwd=str(reposuper))
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+    entrypoint()
+
+    revision = repo1.join(".git/refs/heads/main").read().strip()
+    assert recorded_revisions(["mirror1", "mirror1-copy"]) == {
+        "mirror1": revision,
+        "mirror1-copy": revision,
+    }
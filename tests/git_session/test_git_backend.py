@@ -0,0 +1,128 @@
+import sys
+import textwrap
+
+import pytest
+
+from mirror_tool.cmd import MirrorTool, entrypoint
+from mirror_tool.conf import Config
+from mirror_tool.git_session import GitSession
+
+
+def test_pygit2_not_installed(monkeypatch, caplog):
+    """Selecting the pygit2 backend without pygit2 installed fails cleanly."""
+
+    monkeypatch.setitem(sys.modules, "pygit2", None)
+    monkeypatch.delitem(sys.modules, "mirror_tool.git_pygit2", raising=False)
+
+    tool = MirrorTool()
+    tool.args = tool.parser.parse_args(["--git-backend", "pygit2", "update-local"])
+    tool._config = Config({})
+
+    with pytest.raises(SystemExit) as exc:
+        tool.git
+
+    assert exc.value.code == 82
+    assert "pygit2 must be installed to use --git-backend=pygit2." in caplog.text
+
+
+@pytest.fixture
+def repo(tmpdir, monkeypatch, run_git):
+    run_git("init", "-b", "main", tmpdir)
+    monkeypatch.chdir(str(tmpdir))
+
+    tmpdir.mkdir("some dir").join("file").write("1")
+    run_git("add", ".")
+    run_git("commit", "-m", "first\n\nSome body\ntext.\n\nMirror-Tool-Upstream: a x")
+    run_git("checkout", "-b", "other")
+    run_git("commit", "--allow-empty", "-m", "on other branch")
+    run_git("checkout", "main")
+    run_git("commit", "--allow-empty", "-m", "Mirror-Tool-Upstream: not a trailer")
+    run_git("merge", "--no-ff", "-m", "merge\n\nMirror-Tool-Upstream: b y", "other")
+    run_git(
+        "commit",
+        "--allow-empty",
+        "-m",
+        "a long\nsubject\n\nbody\n\nmirror-tool-upstream: c x\nOther: foo",
+    )
+
+    return tmpdir
+
+
+def test_pygit2_session(repo):
+    """Pygit2Session answers queries the same as GitSession."""
+
+    pytest.importorskip("pygit2")
+    from mirror_tool.git_pygit2 import Pygit2Session
+
+    cli = GitSession()
+    pygit2 = Pygit2Session()
+
+    names = ["HEAD", "HEAD^{tree}", "HEAD:some dir", "HEAD:other", "other"]
+    assert pygit2.resolve(names, missing_ok=True) == cli.resolve(names, missing_ok=True)
+    with pytest.raises(ValueError):
+        pygit2.resolve(["HEAD:other"])
+
+    for rev, rev_from in [
+        ("HEAD", "HEAD"),
+        ("other", "HEAD"),
+        ("HEAD", "other"),
+        ("a" * 40, "HEAD"),
+    ]:
+        assert pygit2.is_ancestor(rev, rev_from) == cli.is_ancestor(rev, rev_from)
+
+    for rev_from, rev_to in [("HEAD~3", "HEAD"), ("HEAD", "HEAD~3")]:
+        assert pygit2.count_commits(rev_from, rev_to) == cli.count_commits(
+            rev_from, rev_to
+        )
+        assert list(pygit2.log(rev_from, rev_to, 3)) == list(
+            cli.log(rev_from, rev_to, 3)
+        )
+
+    key = "Mirror-Tool-Upstream"
+    trailers = list(pygit2.trailers("HEAD", key))
+    assert [v for (_, values) in trailers for v in values] == ["c x", "b y", "a x"]
+    assert trailers[0][0] == cli.resolve(["HEAD"])[0]
+    assert list(pygit2.trailers("HEAD", key)) == list(cli.trailers("HEAD", key))
+
+    pygit2.close()
+    cli.close()
+
+
+def test_update_pygit2(tmpdir, monkeypatch, caplog, run_git):
+    """update-local works with the pygit2 backend."""
+
+    pytest.importorskip("pygit2")
+
+    repo1 = tmpdir.join("repo1")
+    reposuper = tmpdir.join("super")
+    run_git("init", "-b", "main", repo1)
+    run_git("init", "-b", "main", reposuper)
+
+    repo1.join("file1").write("1")
+    run_git("add", "file1", cwd=str(repo1))
+    run_git("commit", "-m", "commit in repo1", cwd=str(repo1))
+
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1
+            git_config:
+              user.name: test
+              user.email: tester@example.com
+            """
+        )
+    )
+    run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+    run_git("commit", "-m", "add config", cwd=str(reposuper))
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "--git-backend", "pygit2", "update-local"])
+    entrypoint()
+    assert reposuper.join("mirror1/file1").read() == "1"
+
+    caplog.clear()
+    entrypoint()
+    assert "mirror1 is already up-to-date." in caplog.text
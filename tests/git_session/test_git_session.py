@@ -0,0 +1,96 @@
+import os
+import threading
+
+import pytest
+
+from mirror_tool.git_session import GitSession
+
+
+@pytest.fixture
+def repo(tmpdir, monkeypatch, run_git):
+    run_git("init", "-b", "main", tmpdir)
+    tmpdir.mkdir("some dir").join("file").write("1")
+    run_git("add", ".", cwd=str(tmpdir))
+    run_git("commit", "-m", "some commit", cwd=str(tmpdir))
+    monkeypatch.chdir(str(tmpdir))
+    return tmpdir
+
+
+def test_resolve(repo, run_git):
+    """GitSession resolves many object names with a single process."""
+
+    session = GitSession()
+    (head,) = session.resolve(["HEAD"])
+    process = session._cat_file
+
+    (tree, subtree, missing) = session.resolve(
+        ["HEAD^{tree}", "HEAD:some dir", "HEAD:other dir"], missing_ok=True
+    )
+
+    # It should have resolved everything as expected
+    assert len(head) == 40
+    assert len(tree) == 40
+    assert len(subtree) == 40
+    assert len({head, tree, subtree}) == 3
+    assert missing == ""
+
+    # All using the same process
+    assert session._cat_file is process
+
+    session.close()
+    assert process.returncode == 0
+
+    # Closing again is harmless
+    session.close()
+
+
+def test_resolve_missing(repo):
+    """GitSession raises on missing objects unless asked not to."""
+
+    session = GitSession()
+    with pytest.raises(ValueError) as exc:
+        session.resolve(["HEAD", "refs/heads/other"])
+
+    assert "Can't resolve refs/heads/other: refs/heads/other missing" in str(exc.value)
+    session.close()
+
+
+def test_resolve_exited(repo):
+    """GitSession raises if git exits unexpectedly."""
+
+    session = GitSession()
+    session.resolve(["HEAD"])
+
+    session._cat_file.kill()
+    session._cat_file.wait()
+    session._cat_file.stdin = open(os.devnull, "wt")
+
+    with pytest.raises(RuntimeError) as exc:
+        session.resolve(["HEAD"])
+
+    assert "git cat-file exited unexpectedly" in str(exc.value)
+
+
+def test_resolve_many(repo):
+    """GitSession resolves more names than fit in a pipe buffer at once."""
+
+    session = GitSession()
+    names = ["HEAD", "HEAD:some dir", "refs/heads/other"] * 10000
+    result = []
+
+    # Run in a thread so that a deadlock fails the test instead of hanging it.
+    thread = threading.Thread(
+        target=lambda: result.extend(session.resolve(names, missing_ok=True)),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(60)
+
+    if thread.is_alive():
+        session._cat_file.kill()
+    assert not thread.is_alive()
+
+    assert len(result) == len(names)
+    assert len(set(result)) == 3
+    assert result[-1] == ""
+    session.close()
@@ -0,0 +1,22 @@
+import pytest
+
+from mirror_tool.conf import GitlabMerge
+from mirror_tool.gitlab import GitlabUpdateSession
+
+
+@pytest.fixture
+def make_session(monkeypatch):
+    """Returns a function creating update sessions for a GitLab project at
+    https://example.com/api/projects/123."""
+
+    def make(cache_dir=None, token="abc123-not-a-real-token"):
+        monkeypatch.setenv("GITLAB_MIRROR_TOKEN", token)
+
+        merge = GitlabMerge(
+            api_v4_url="https://example.com/api",
+            project_id=123,
+            push_url="https://example.com/push",
+        )
+        return GitlabUpdateSession(merge, run_cmd=None, updates=[], cache_dir=cache_dir)
+
+    return make
@@ -0,0 +1,239 @@
+import json
+import os
+import sys
+import textwrap
+import threading
+
+import requests_mock
+
+from mirror_tool.cmd import entrypoint
+from mirror_tool.gitlab import GitlabPromoteSession, http_cache
+
+MRS_URL = "https://example.com/api/projects/123/merge_requests"
+
+
+def test_memoizes_gets(make_session, requests_mocker: requests_mock.Mocker):
+    """Identical GETs within a session are only requested once, until
+    something else has been done."""
+
+    session = make_session()
+
+    requests_mocker.get(MRS_URL, json=[{"iid": 1, "labels": ["mirror-tool"]}])
+    requests_mocker.put(MRS_URL + "/1", json={})
+
+    for _ in range(2):
+        assert session.find_own_mr({"state": "opened"})["iid"] == 1
+    assert requests_mocker.call_count == 1
+
+    # A different query is not answered from memory.
+    session.find_own_mr({"state": "merged"})
+    assert requests_mocker.call_count == 2
+
+    # Any successful modification means queries have to be repeated.
+    session.requests.put(MRS_URL + "/1", json={})
+    session.find_own_mr({"state": "opened"})
+    assert requests_mocker.call_count == 4
+
+
+def test_failed_requests_not_memoized(
+    make_session, requests_mocker: requests_mock.Mocker
+):
+    """Failed GETs are repeated, and failed modifications keep memoized GETs."""
+
+    session = make_session()
+
+    requests_mocker.get(MRS_URL + "/1", status_code=404)
+    requests_mocker.get(MRS_URL + "/2", json={"iid": 2})
+    requests_mocker.post(MRS_URL, status_code=409)
+
+    assert not session.requests.get(MRS_URL + "/1").ok
+    assert session.requests.get(MRS_URL + "/2").json() == {"iid": 2}
+    session.requests.post(MRS_URL, json={})
+
+    assert not session.requests.get(MRS_URL + "/1").ok
+    assert session.requests.get(MRS_URL + "/2").json() == {"iid": 2}
+
+    assert [r.method for r in requests_mocker.request_history] == [
+        "GET",
+        "GET",
+        "POST",
+        "GET",
+    ]
+
+
+def test_overlapping_modification_not_memoized(
+    make_session, requests_mocker: requests_mock.Mocker
+):
+    """A GET overlapping with a modification, e.g. from another thread, isn't
+    memoized, as it may have been answered before the modification."""
+
+    session = make_session()
+
+    def get_mr(request, context):
+        if requests_mocker.call_count == 1:
+            session.requests.put(MRS_URL + "/1", json={})
+        return {"iid": 1}
+
+    requests_mocker.get(MRS_URL + "/1", json=get_mr)
+    requests_mocker.put(MRS_URL + "/1", json={})
+
+    for _ in range(3):
+        session.requests.get(MRS_URL + "/1")
+
+    # Requested again after the overlapping request, and memoized since.
+    assert [r.method for r in requests_mocker.request_history] == [
+        "GET",
+        "PUT",
+        "GET",
+    ]
+
+
+def test_close(make_session):
+    """Background work is stopped by close()."""
+
+    session = make_session()
+    session.close()
+
+    assert session.in_background(lambda x: x * 2, 21).result() == 42
+    thread_count = threading.active_count()
+    session.close()
+    session.close()
+
+    assert threading.active_count() < thread_count
+
+
+def test_conditional_requests(
+    make_session, tmpdir, requests_mocker: requests_mock.Mocker
+):
+    """With a cache dir, validators are kept across sessions and unchanged
+    responses are reused."""
+
+    cache_dir = str(tmpdir.join("gitlab"))
+
+    requests_mocker.get(
+        MRS_URL,
+        json=[{"iid": 1, "labels": ["mirror-tool"]}],
+        headers={"ETag": 'W/"abc"', "Last-Modified": "Wed, 21 Oct 2026 07:28:00 GMT"},
+    )
+    assert make_session(cache_dir).find_own_mr({})["iid"] == 1
+    assert "If-None-Match" not in requests_mocker.last_request.headers
+
+    # In a later session, the server says the resource is unchanged.
+    requests_mocker.get(
+        MRS_URL, status_code=304, headers={"ETag": 'W/"abc"', "X-Next-Page": ""}
+    )
+    assert make_session(cache_dir).find_own_mr({})["iid"] == 1
+
+    headers = requests_mocker.last_request.headers
+    assert headers["If-None-Match"] == 'W/"abc"'
+    assert headers["If-Modified-Since"] == "Wed, 21 Oct 2026 07:28:00 GMT"
+
+    # Cached responses are not shared between different tokens.
+    session = make_session(cache_dir, token="another-token")
+    session.requests.get(MRS_URL)
+    assert "If-None-Match" not in requests_mocker.last_request.headers
+
+
+def test_conditional_request_changed(
+    make_session, tmpdir, requests_mocker: requests_mock.Mocker
+):
+    """Changed responses replace those in the cache dir, and responses
+    without validators or corrupt cache files are ignored."""
+
+    cache_dir = tmpdir.join("gitlab")
+
+    requests_mocker.get(MRS_URL + "/1", json={"iid": 1}, headers={"ETag": '"v1"'})
+    requests_mocker.get(MRS_URL + "/2", json={"iid": 2})
+    for iid in (1, 2):
+        make_session(str(cache_dir)).requests.get(f"{MRS_URL}/{iid}")
+
+    # Only the response having an ETag was stored.
+    assert len(cache_dir.listdir()) == 1
+
+    requests_mocker.get(
+        MRS_URL + "/1", json={"iid": 1, "sha": "a1b2"}, headers={"ETag": '"v2"'}
+    )
+    response = make_session(str(cache_dir)).requests.get(MRS_URL + "/1")
+    assert response.json() == {"iid": 1, "sha": "a1b2"}
+    assert requests_mocker.last_request.headers["If-None-Match"] == '"v1"'
+
+    response = make_session(str(cache_dir)).requests.get(MRS_URL + "/1")
+    assert requests_mocker.last_request.headers["If-None-Match"] == '"v2"'
+
+    cache_dir.listdir()[0].write("not json")
+    make_session(str(cache_dir)).requests.get(MRS_URL + "/1")
+    assert "If-None-Match" not in requests_mocker.last_request.headers
+
+
+def test_cache_dir_bounded(
+    make_session, monkeypatch, tmpdir, requests_mocker: requests_mock.Mocker
+):
+    """Responses for commit IDs aren't stored, and only the most recently
+    used responses are kept."""
+
+    monkeypatch.setattr(http_cache, "CACHE_LIMIT", 2)
+    cache_dir = tmpdir.join("gitlab")
+    session = make_session(str(cache_dir))
+
+    # Asking whether a commit is in a branch.
+    commit = "0123456789abcdef0123456789abcdef01234567"
+    merge_base_url = MRS_URL.replace("merge_requests", "repository/merge_base")
+    requests_mocker.get(merge_base_url, json={"id": commit}, headers={"ETag": "1"})
+    session.requests.get(merge_base_url, params={"refs[]": [commit, "main"]})
+    assert not cache_dir.exists()
+
+    for iid in (1, 2, 3):
+        requests_mocker.get(
+            f"{MRS_URL}/{iid}", json={"iid": iid}, headers={"ETag": "1"}
+        )
+
+    # The first response is used again before the last is stored.
+    for iid in (1, 2):
+        make_session(str(cache_dir)).requests.get(f"{MRS_URL}/{iid}")
+    for path in cache_dir.listdir():
+        os.utime(str(path), (0, 0))
+
+    requests_mocker.get(f"{MRS_URL}/1", status_code=304)
+    make_session(str(cache_dir)).requests.get(f"{MRS_URL}/1")
+    make_session(str(cache_dir)).requests.get(f"{MRS_URL}/3")
+
+    # Then the response which wasn't used recently was removed.
+    assert sorted(json.loads(path.read())["url"] for path in cache_dir.listdir()) == [
+        f"{MRS_URL}/1",
+        f"{MRS_URL}/3",
+    ]
+
+
+def test_promote_uses_cache_dir(tmpdir, monkeypatch):
+    """GitLab sessions keep their cache within --cache-dir."""
+
+    tmpdir.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror: []
+            gitlab_promote:
+            - src: mysrc
+              dest: mydest
+            """
+        )
+    )
+
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setattr(
+        sys, "argv", ["", "--cache-dir", str(tmpdir.join("cache")), "promote"]
+    )
+    monkeypatch.setenv("CI_API_V4_URL", "https://gitlab.example.com/api")
+    monkeypatch.setenv("CI_PROJECT_ID", "123")
+    monkeypatch.setenv("CI_PROJECT_URL", "https://gitlab.example.com/best/project")
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123")
+
+    cache_dirs = []
+    monkeypatch.setattr(
+        GitlabPromoteSession,
+        "ensure_promotion_merge_request_exists",
+        lambda self: cache_dirs.append(self.requests.cache_dir),
+    )
+
+    entrypoint()
+
+    assert cache_dirs == [str(tmpdir.join("cache", "gitlab"))]
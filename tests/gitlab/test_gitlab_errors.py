@@ -38,6 +38,13 @@ def test_push_fails(monkeypatch, requests_mocker: requests_mock.Mocker):
         json=[],
     )
 
+    # Remote branch state can't be determined.
+    requests_mocker.get(
+        "https://example.com//projects/123/repository/branches/latest",
+        status_code=403,
+        json={},
+    )
+
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_error, updates=[])
 
     # In this test just simulate that the revision is not already present while
@@ -77,6 +84,12 @@ def test_request_fails(monkeypatch, requests_mocker: requests_mock.Mocker, caplo
         json={"some": "response"},
     )
 
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/branches/latest",
+        status_code=404,
+        json={},
+    )
+
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_ok, updates=[])
 
     # In this test just simulate that the revision is not already present while
@@ -0,0 +1,93 @@
+import requests_mock
+
+from mirror_tool.conf import GitlabPromote
+from mirror_tool.gitlab import GitlabPromoteSession
+
+MRS_URL = "https://example.com/api/projects/123/merge_requests"
+
+
+def test_find_mrs_paginates(make_session, requests_mocker: requests_mock.Mocker):
+    """find_mrs requests pages lazily and trims MRs to the fields used."""
+
+    session = make_session()
+
+    requests_mocker.get(
+        MRS_URL + "?page=1",
+        json=[
+            {"iid": 1, "web_url": "https://example.com/mr/1", "head_pipeline": {}},
+            {"iid": 2, "web_url": "https://example.com/mr/2", "sha": "a1b2"},
+        ],
+        headers={"X-Next-Page": "2"},
+    )
+    requests_mocker.get(
+        MRS_URL + "?page=2",
+        json=[{"iid": 3, "labels": ["mirror-tool"], "diff_refs": {}}],
+        headers={"X-Next-Page": ""},
+    )
+
+    mrs = session.find_mrs({"state": "opened"}, per_page=2)
+
+    # Getting the first couple of MRs should only request the first page.
+    assert next(mrs) == {"iid": 1, "web_url": "https://example.com/mr/1"}
+    assert next(mrs) == {"iid": 2, "web_url": "https://example.com/mr/2", "sha": "a1b2"}
+    assert requests_mocker.call_count == 1
+
+    # Filtering and sorting should have been done by the server.
+    assert requests_mocker.request_history[0].qs == {
+        "order_by": ["created_at"],
+        "sort": ["desc"],
+        "per_page": ["2"],
+        "state": ["opened"],
+        "page": ["1"],
+    }
+
+    # The rest are requested only once needed.
+    assert list(mrs) == [{"iid": 3, "labels": ["mirror-tool"]}]
+    assert requests_mocker.call_count == 2
+
+
+def test_find_own_mr(make_session, requests_mocker: requests_mock.Mocker):
+    """find_own_mr requests a single MR with the mirror-tool label."""
+
+    session = make_session()
+
+    requests_mocker.get(
+        MRS_URL + "?labels=mirror-tool&per_page=1&page=1",
+        json=[{"iid": 1, "labels": ["mirror-tool"], "sha": "a1b2", "author": {}}],
+        headers={"X-Next-Page": "2"},
+    )
+
+    assert session.find_own_mr({"state": "opened"}) == {
+        "iid": 1,
+        "labels": ["mirror-tool"],
+        "sha": "a1b2",
+    }
+    assert requests_mocker.call_count == 1
+
+
+def test_find_merged_mr_untrimmed(monkeypatch, requests_mocker: requests_mock.Mocker):
+    """Promotion keeps all fields of the merged MR for use in templates."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+    promote = GitlabPromote(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="https://example.com/push",
+        src="some-src",
+        dest="some-dest",
+    )
+    session = GitlabPromoteSession(promote, run_cmd=None)
+
+    mr = {
+        "iid": 1,
+        "labels": ["mirror-tool"],
+        "merge_commit_sha": "a1b2",
+        "author": {"name": "someone"},
+    }
+    requests_mocker.get(
+        MRS_URL
+        + "?target_branch=some-src&state=merged&labels=mirror-tool&per_page=1&page=1",
+        json=[mr],
+    )
+
+    assert session.find_merged_mr() == mr
@@ -1,11 +1,33 @@
 import logging
+import threading
 from subprocess import CompletedProcess
 
 import pytest
 import requests_mock
 
 from mirror_tool.conf import GitlabMerge, GitlabMergeComments
-from mirror_tool.gitlab import GitlabException, GitlabUpdateSession
+from mirror_tool.gitlab import GitlabException, GitlabUpdateSession, http_cache
+
+HEAD_SHA = "0123456789abcdef0123456789abcdef01234567"
+TREE_1 = "1" * 40
+TREE_2 = "2" * 40
+
+
+def mock_branches(requests_mocker):
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/branches/some-src",
+        status_code=404,
+        json={},
+    )
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/branches/some-dest",
+        json={"commit": {"id": "f00" * 13 + "f"}},
+    )
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/merge_base",
+        status_code=400,
+        json={"message": "Could not find ref"},
+    )
 
 
 def test_create_ok(monkeypatch, requests_mocker: requests_mock.Mocker, caplog):
@@ -41,12 +63,12 @@ def test_create_ok(monkeypatch, requests_mocker: requests_mock.Mocker, caplog):
     caplog.set_level(logging.INFO)
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_ok, updates=[])
 
-    # Set up the commands we expect it to run...
-    # git fetch
-    procs.append(CompletedProcess([], returncode=0))
+    # HEAD isn't known to GitLab, and src branch doesn't exist yet.
+    mock_branches(requests_mocker)
 
-    # merge-base is-ancestor (1 means is not ancestor)
-    procs.append(CompletedProcess([], returncode=1))
+    # Set up the commands we expect it to run...
+    # rev-parse
+    procs.append(CompletedProcess([], returncode=0, stdout=HEAD_SHA.encode() + b"\n"))
 
     # push
     procs.append(CompletedProcess([], returncode=0))
@@ -130,18 +152,22 @@ def test_update_ok(monkeypatch, requests_mocker: requests_mock.Mocker, caplog):
     caplog.set_level(logging.INFO)
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_ok, updates=[])
 
+    # HEAD isn't known to GitLab, and src branch doesn't exist yet.
+    mock_branches(requests_mocker)
+
     # Set up the commands we expect it to run...
-    # git fetch
-    procs.append(CompletedProcess([], returncode=0))
+    # rev-parse
+    procs.append(CompletedProcess([], returncode=0, stdout=HEAD_SHA.encode() + b"\n"))
 
-    # merge-base is-ancestor (1 == 'is not ancestor')
+    # rev-parse MR commit's tree (not available locally)
     procs.append(CompletedProcess([], returncode=1))
 
     # git fetch
     procs.append(CompletedProcess([], returncode=0))
 
-    # git diff (1 == 'there are changes')
-    procs.append(CompletedProcess([], returncode=1))
+    # rev-parse MR commit's tree, then HEAD's tree
+    procs.append(CompletedProcess([], returncode=0, stdout=TREE_1.encode()))
+    procs.append(CompletedProcess([], returncode=0, stdout=TREE_2.encode()))
 
     # push
     procs.append(CompletedProcess([], returncode=0))
@@ -210,18 +236,22 @@ def test_update_skips_no_diff(
     caplog.set_level(logging.INFO)
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_ok, updates=[])
 
+    # HEAD isn't known to GitLab, and src branch doesn't exist yet.
+    mock_branches(requests_mocker)
+
     # Set up the commands we expect it to run...
-    # git fetch
-    procs.append(CompletedProcess([], returncode=0))
+    # rev-parse
+    procs.append(CompletedProcess([], returncode=0, stdout=HEAD_SHA.encode() + b"\n"))
 
-    # merge-base is-ancestor (1 == 'is not ancestor')
+    # rev-parse MR commit's tree (not available locally)
     procs.append(CompletedProcess([], returncode=1))
 
     # git fetch
     procs.append(CompletedProcess([], returncode=0))
 
-    # git diff (0 == 'there are no changes')
-    procs.append(CompletedProcess([], returncode=0))
+    # rev-parse MR commit's tree, then HEAD's tree
+    procs.append(CompletedProcess([], returncode=0, stdout=TREE_1.encode()))
+    procs.append(CompletedProcess([], returncode=0, stdout=TREE_1.encode()))
 
     # It should succeed
     session.ensure_merge_request_exists()
@@ -266,6 +296,13 @@ def test_update_rejects_unknown(monkeypatch, requests_mocker: requests_mock.Mock
         ],
     )
 
+    # The src branch doesn't exist yet.
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/branches/some-src",
+        status_code=404,
+        json={},
+    )
+
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_ok, updates=[])
 
     # Make this check return False without having to mock the commands
@@ -313,6 +350,13 @@ def test_update_not_found(monkeypatch, requests_mocker: requests_mock.Mocker):
         json=[],
     )
 
+    # The src branch doesn't exist yet.
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/branches/some-src",
+        status_code=404,
+        json={},
+    )
+
     session = GitlabUpdateSession(merge, run_cmd=run_cmd_ok, updates=[])
 
     # Make this check return False without having to mock the commands
@@ -356,3 +400,198 @@ def test_update_noop_if_present(monkeypatch, requests_mocker: requests_mock.Mock
 
     # Lack of any requests_mocker or run_cmd mocking proves we didn't actually
     # do any commands or requests.
+
+
+def test_update_searches_meanwhile(monkeypatch, requests_mocker: requests_mock.Mocker):
+    """Session searches for an existing MR while checking the dest branch."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+
+    merge = GitlabMerge(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="https://example.com/push",
+        src="some-src",
+        dest="some-dest",
+    )
+
+    searched = threading.Event()
+
+    def search(request, context):
+        searched.set()
+        return [{"iid": 1, "labels": ["mirror-tool"], "sha": "a1b2"}]
+
+    requests_mocker.get(
+        "https://example.com/api/projects/123/merge_requests?state=opened&source_branch=some-src&target_branch=some-dest",
+        json=search,
+    )
+
+    session = GitlabUpdateSession(merge, run_cmd=None, updates=[])
+
+    # The search has to complete while the dest branch is still being checked.
+    monkeypatch.setattr(
+        session, "revision_in_remote_branch", lambda *_: not searched.wait(10)
+    )
+    uptodate = []
+    monkeypatch.setattr(
+        session, "is_mr_uptodate", lambda mr, _: uptodate.append(mr) or True
+    )
+
+    session.ensure_merge_request_exists()
+
+    # The MR found meanwhile was used.
+    assert uptodate == [{"iid": 1, "labels": ["mirror-tool"], "sha": "a1b2"}]
+
+
+def test_uptodate_compares_trees(monkeypatch, tmpdir):
+    """Session compares MR content by tree IDs, fetching the MR's commit only
+    if its tree ID isn't already known."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+
+    merge = GitlabMerge(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="http://example.com/push",
+    )
+    mr = {"sha": "a" * 40}
+
+    cmds = []
+    trees = {"HEAD^{tree}": TREE_1}
+
+    def run_cmd(cmd, **kwargs):
+        cmds.append(cmd[1])
+        if cmd[1] == "fetch":
+            trees["a" * 40 + "^{tree}"] = TREE_1
+        if cmd[1] == "rev-parse" and cmd[-1] not in trees:
+            return CompletedProcess(cmd, returncode=1)
+        return CompletedProcess(
+            cmd, returncode=0, stdout=trees.get(cmd[-1], "").encode()
+        )
+
+    def session():
+        return GitlabUpdateSession(
+            merge, run_cmd=run_cmd, updates=[], cache_dir=str(tmpdir)
+        )
+
+    # The first time, the MR commit has to be fetched.
+    first = session()
+    assert first.is_mr_uptodate(mr, "HEAD")
+    assert cmds == ["rev-parse", "fetch", "rev-parse", "rev-parse"]
+
+    # Later, its tree is known, within the same session and across sessions.
+    for s in (first, session()):
+        cmds.clear()
+        assert s.is_mr_uptodate(mr, "HEAD")
+        assert cmds == ["rev-parse"]
+
+    # A different tree means there are changes.
+    trees["HEAD^{tree}"] = TREE_2
+    assert not session().is_mr_uptodate(mr, "HEAD")
+
+    # An unusable cached tree ID is ignored.
+    tmpdir.join("trees", "a" * 40).write("oops")
+    cmds.clear()
+    assert not session().is_mr_uptodate(mr, "HEAD")
+    assert cmds == ["rev-parse", "rev-parse"]
+
+
+def test_tree_ids_bounded(monkeypatch, tmpdir):
+    """Only the most recently used tree IDs are kept in the cache dir."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+    monkeypatch.setattr(http_cache, "CACHE_LIMIT", 1)
+
+    merge = GitlabMerge(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="http://example.com/push",
+    )
+
+    def run_cmd(cmd, **kwargs):
+        return CompletedProcess(cmd, returncode=0, stdout=TREE_1.encode())
+
+    session = GitlabUpdateSession(
+        merge, run_cmd=run_cmd, updates=[], cache_dir=str(tmpdir)
+    )
+    for commit in ("a" * 40, "b" * 40):
+        assert session.tree_id(commit) == TREE_1
+
+    assert [p.basename for p in tmpdir.join("trees").listdir()] == ["b" * 40]
+
+
+def test_tree_id_cache_unwritable(monkeypatch, tmpdir, caplog):
+    """Failing to keep a tree ID in the cache dir doesn't fail the session."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+    merge = GitlabMerge(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="http://example.com/push",
+    )
+
+    def run_cmd(cmd, **kwargs):
+        return CompletedProcess(cmd, returncode=0, stdout=TREE_1.encode())
+
+    # The cache dir can't be created, as a file is in the way.
+    tmpdir.join("cache").write("")
+    session = GitlabUpdateSession(
+        merge, run_cmd=run_cmd, updates=[], cache_dir=str(tmpdir.join("cache"))
+    )
+
+    assert session.tree_id("a" * 40) == TREE_1
+    assert "Failed to write cache file" in caplog.text
+
+
+def test_ensure_pushed(monkeypatch, requests_mocker: requests_mock.Mocker):
+    """Session pushes only branches which need it, by a single atomic push
+    protected by leases."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+
+    merge = GitlabMerge(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="http://example.com/push",
+    )
+
+    branches_url = "https://example.com/api/projects/123/repository/branches/"
+    requests_mocker.get(branches_url + "current", json={"commit": {"id": HEAD_SHA}})
+    requests_mocker.get(branches_url + "old", json={"commit": {"id": TREE_1}})
+    requests_mocker.get(branches_url + "new", status_code=404, json={})
+    requests_mocker.get(branches_url + "unknown", status_code=403, json={})
+
+    cmds = []
+
+    def run_cmd(cmd, **kwargs):
+        cmds.append(cmd)
+        return CompletedProcess(cmd, returncode=0, stdout=HEAD_SHA.encode())
+
+    session = GitlabUpdateSession(merge, run_cmd=run_cmd, updates=[])
+
+    # Nothing is pushed if the branch is already current.
+    session.ensure_pushed_to("HEAD", "current")
+    assert [c[1] for c in cmds] == ["rev-parse"]
+
+    cmds.clear()
+    session.ensure_pushed(
+        {"current": HEAD_SHA, "old": HEAD_SHA, "new": HEAD_SHA, "unknown": HEAD_SHA}
+    )
+    assert cmds == [
+        [
+            "git",
+            "push",
+            "--atomic",
+            "http://example.com/push",
+            f"--force-with-lease=refs/heads/old:{TREE_1}",
+            "--force-with-lease=refs/heads/new:",
+            f"{HEAD_SHA}:refs/heads/old",
+            f"{HEAD_SHA}:refs/heads/new",
+            f"+{HEAD_SHA}:refs/heads/unknown",
+        ]
+    ]
+
+    # Having pushed, branches are looked up again.
+    calls = requests_mocker.call_count
+    session.ensure_pushed_to(HEAD_SHA, "current")
+    assert requests_mocker.call_count == calls + 1
@@ -73,6 +73,10 @@ def test_promote_already_present(
         ],
     )
 
+    # rev-parse: the revision isn't available locally, so it's checked
+    # by fetching the dest branch.
+    cmd_outputs.append(CompletedProcess([], 1))
+
     # fetch: succeeds
     cmd_outputs.append(CompletedProcess([], 0))
 
@@ -122,6 +126,14 @@ def test_promote_create_mr(monkeypatch, requests_mocker: requests_mock.Mocker, c
         ],
     )
 
+    # The working branch doesn't exist yet.
+    requests_mocker.get(
+        "https://example.com/api/projects/123/repository/branches/"
+        "mirror-tool%2Fpromote-some-src-to-some-dest",
+        status_code=404,
+        json={},
+    )
+
     # It should try to create an MR as well.
     requests_mocker.post(
         "https://example.com/api/projects/123/merge_requests",
@@ -129,6 +141,10 @@ def test_promote_create_mr(monkeypatch, requests_mocker: requests_mock.Mocker, c
         json={"web_url": "https://example.com/new-mr"},
     )
 
+    # rev-parse: the revision isn't available locally, so it's checked
+    # by fetching the dest branch.
+    cmd_outputs.append(CompletedProcess([], 1))
+
     # fetch: ok
     cmd_outputs.append(CompletedProcess([], 0))
 
@@ -329,3 +345,97 @@ def test_promote_create_mr(monkeypatch, requests_mocker: requests_mock.Mocker, c
 #         "Failed to create MR due to conflict, "
 #         "but also failed to locate an existing MR!"
 #     ) in str(excinfo.value)
+
+
+def test_revision_in_remote_branch(monkeypatch, requests_mocker: requests_mock.Mocker):
+    """Reachability is checked via the GitLab API, falling back to a fetch
+    only if the API can't tell."""
+
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123-not-a-real-token")
+
+    promote = GitlabPromote(
+        api_v4_url="https://example.com/api",
+        project_id=123,
+        push_url="http://example.com/push",
+    )
+
+    cmds = []
+
+    def run_cmd(cmd, **kwargs):
+        cmds.append(cmd)
+        return CompletedProcess(cmd, returncode=0)
+
+    branch_url = "https://example.com/api/projects/123/repository/branches/"
+    merge_base_url = "https://example.com/api/projects/123/repository/merge_base"
+    (sha1, sha2, sha3) = ["a" * 40, "b" * 40, "c" * 40]
+
+    requests_mocker.get(branch_url + "head%2Fbranch", json={"commit": {"id": sha1}})
+    requests_mocker.get(branch_url + "other", json={"commit": {"id": sha3}})
+    requests_mocker.get(branch_url + "missing", status_code=404, json={})
+    requests_mocker.get(
+        merge_base_url + f"?refs[]={sha2}&refs[]=other", json={"id": sha2}
+    )
+    requests_mocker.get(
+        merge_base_url + f"?refs[]={sha1}&refs[]=other", json={"id": sha3}
+    )
+    requests_mocker.get(
+        merge_base_url + f"?refs[]={sha3[:-1]}d&refs[]=other",
+        status_code=403,
+        json={},
+    )
+
+    session = GitlabPromoteSession(promote, run_cmd=run_cmd)
+
+    # Branch is at the commit
+    assert session.revision_in_remote_branch(sha1, "head/branch")
+
+    # Commit is an ancestor of the branch
+    assert session.revision_in_remote_branch(sha2, "other")
+
+    # Commit is not an ancestor of the branch
+    assert not session.revision_in_remote_branch(sha1, "other")
+
+    # None of the above needed any commands.
+    assert cmds == []
+
+    # If the API can't tell, the branch is fetched, once.
+    for _ in range(2):
+        assert session.revision_in_remote_branch(sha3[:-1] + "d", "other")
+    assert session.revision_in_remote_branch(sha1, "missing")
+    assert cmds == [
+        [
+            "git",
+            "fetch",
+            "--no-write-fetch-head",
+            "http://example.com/push",
+            "+refs/heads/other:refs/mirror-tool/dest/other",
+        ],
+        [
+            "git",
+            "merge-base",
+            "--is-ancestor",
+            sha3[:-1] + "d",
+            "refs/mirror-tool/dest/other",
+        ],
+        [
+            "git",
+            "merge-base",
+            "--is-ancestor",
+            sha3[:-1] + "d",
+            "refs/mirror-tool/dest/other",
+        ],
+        [
+            "git",
+            "fetch",
+            "--no-write-fetch-head",
+            "http://example.com/push",
+            "+refs/heads/missing:refs/mirror-tool/dest/missing",
+        ],
+        [
+            "git",
+            "merge-base",
+            "--is-ancestor",
+            sha1,
+            "refs/mirror-tool/dest/missing",
+        ],
+    ]
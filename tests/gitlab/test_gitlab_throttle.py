@@ -0,0 +1,129 @@
+import logging
+
+import pytest
+import requests_mock
+
+from mirror_tool.gitlab import GitlabException, throttle
+
+MRS_URL = "https://example.com/api/projects/123/merge_requests"
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1700000000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def session(make_session, monkeypatch):
+    session = make_session()
+
+    # Record delays instead of sleeping.
+    clock = FakeTime()
+    monkeypatch.setattr(throttle, "time", clock)
+    session.sleeps = clock.sleeps
+
+    return session
+
+
+def test_retries_rate_limited(session, requests_mocker: requests_mock.Mocker, caplog):
+    """Rate-limited requests are retried after the time requested by GitLab."""
+
+    requests_mocker.post(
+        MRS_URL,
+        [
+            {"status_code": 429, "headers": {"Retry-After": "3"}},
+            {"status_code": 429, "headers": {"Retry-After": "600"}},
+            {"status_code": 201, "json": {"iid": 1}},
+        ],
+    )
+
+    caplog.set_level(logging.INFO)
+    assert session.create_mr()
+
+    assert requests_mocker.call_count == 3
+
+    # It should have waited as requested, within limits.
+    assert len(session.sleeps) == 2
+    assert session.sleeps == [3, 60]
+
+    session.log_stats()
+    assert "Unexpected response from GitLab: 429" in caplog.text
+    assert "2 request(s) were retried" in caplog.text
+
+
+def test_retries_idempotent_only(session, requests_mocker: requests_mock.Mocker):
+    """Server errors are retried with backoff, only for idempotent requests."""
+
+    requests_mocker.get(
+        MRS_URL,
+        [{"status_code": 502}, {"status_code": 503}, {"json": [{"iid": 1}]}],
+    )
+    requests_mocker.post(MRS_URL, status_code=502, json={})
+
+    assert list(session.find_mrs({})) == [{"iid": 1}]
+    assert requests_mocker.call_count == 3
+
+    # Backoff is doubled each time, with some jitter.
+    assert 0.5 <= session.sleeps[0] <= 1.5
+    assert 1.0 <= session.sleeps[1] <= 3.0
+
+    # A POST may already have had an effect, so it's not retried.
+    with pytest.raises(GitlabException):
+        session.create_mr()
+    assert requests_mocker.call_count == 4
+    assert session.requests.retry_count == 2
+
+
+def test_gives_up(session, requests_mocker: requests_mock.Mocker):
+    """Requests are retried a limited number of times."""
+
+    requests_mocker.get(MRS_URL, status_code=503, json={})
+
+    response = session.requests.get(MRS_URL)
+    assert response.status_code == 503
+    assert requests_mocker.call_count == 6
+    assert len(session.sleeps) == 5
+
+
+def test_paces_requests(session, requests_mocker: requests_mock.Mocker, caplog):
+    """Requests are spread over the time until the rate limit resets."""
+
+    reset = "1700000010"
+    requests_mocker.get(
+        MRS_URL,
+        json=[],
+        headers={"RateLimit-Remaining": "4", "RateLimit-Reset": reset},
+    )
+    requests_mocker.get(
+        MRS_URL + "/1",
+        json={},
+        headers={"RateLimit-Remaining": "lots", "RateLimit-Reset": reset},
+    )
+    requests_mocker.get(MRS_URL + "/2", json={})
+
+    session.requests.get(MRS_URL)
+    assert session.sleeps == []
+
+    # The next request waits for its share of the remaining time.
+    session.requests.get(MRS_URL + "/1")
+    assert len(session.sleeps) == 1
+    assert session.sleeps == [2]
+
+    # Unparseable headers are ignored.
+    session.requests.get(MRS_URL + "/2")
+    assert len(session.sleeps) == 1
+
+    caplog.set_level(logging.INFO)
+    session.log_stats()
+    assert "GitLab requests were delayed by 2.0 seconds in total" in caplog.text
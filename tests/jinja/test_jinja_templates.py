@@ -0,0 +1,102 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from mirror_tool import jinja
+from mirror_tool.cmd import entrypoint
+from mirror_tool.jinja import (
+    jinja_bytecode_cache,
+    jinja_env,
+    jinja_render,
+    jinja_template,
+)
+
+
+@pytest.fixture
+def no_bytecode_cache():
+    yield
+    jinja_bytecode_cache(None)
+
+
+def test_compiles_once():
+    """Each distinct template is compiled once per environment."""
+
+    template = jinja_template("hello {{ name }}")
+
+    assert jinja_template("hello {{ name }}") is template
+    assert jinja_template("bye {{ name }}") is not template
+    assert jinja_template("hello {{ name }}", strict=True) is not template
+
+    assert jinja_render("hello {{ name }}", name="world") == "hello world"
+
+
+def test_bytecode_cache(tmpdir, monkeypatch, no_bytecode_cache):
+    """Compiled templates can be reused from a cache dir."""
+
+    cache_dir = tmpdir.join("jinja")
+    jinja_bytecode_cache(str(cache_dir))
+
+    source = "cached {{ name }} %s" % tmpdir
+    jinja_template(source)
+    assert len(cache_dir.listdir()) == 1
+
+    # As if in a later run, the template is loaded without compiling it.
+    jinja_bytecode_cache(str(cache_dir))
+    monkeypatch.setattr(jinja_env(), "compile", None)
+    assert jinja_render(source, name="template") == "cached template %s" % tmpdir
+
+
+def test_bytecode_cache_bounded(tmpdir, monkeypatch, no_bytecode_cache):
+    """Only the most recently used compiled templates are kept."""
+
+    monkeypatch.setattr(jinja, "BYTECODE_CACHE_LIMIT", 2)
+    cache_dir = tmpdir.join("jinja")
+    sources = ["template %s %s" % (i, tmpdir) for i in range(3)]
+
+    for source in sources[:2]:
+        jinja_bytecode_cache(str(cache_dir))
+        jinja_template(source)
+    for path in cache_dir.listdir():
+        os.utime(str(path), (0, 0))
+
+    # In later runs, the first template is used again before another one.
+    for source in (sources[0], sources[2]):
+        jinja_bytecode_cache(str(cache_dir))
+        jinja_template(source)
+
+    # The second template was removed, so it has to be compiled again.
+    jinja_bytecode_cache(str(cache_dir))
+    compiled = []
+    compile = jinja_env().compile
+    monkeypatch.setattr(
+        jinja_env(), "compile", lambda *args: compiled.append(1) or compile(*args)
+    )
+    for source in (sources[0], sources[2]):
+        jinja_template(source)
+    assert not compiled
+    jinja_template(sources[1])
+    assert len(compiled) == 1
+
+
+def test_cmd_uses_cache_dir(tmpdir, monkeypatch, no_bytecode_cache):
+    """Compiled templates are kept within --cache-dir."""
+
+    tmpdir.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror: []
+            commitmsg: "a template unique to %s"
+            """
+            % tmpdir
+        )
+    )
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setattr(
+        sys, "argv", ["", "--cache-dir", str(tmpdir.join("cache")), "validate-config"]
+    )
+
+    entrypoint()
+
+    assert tmpdir.join("cache", "jinja").listdir()
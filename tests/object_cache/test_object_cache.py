@@ -0,0 +1,279 @@
+import fcntl
+import logging
+import os
+import subprocess
+
+import pytest
+
+from mirror_tool.cmd import MirrorTool
+from mirror_tool.object_cache import ObjectCache
+
+
+@pytest.fixture
+def upstream(tmpdir, run_git):
+    # An upstream repo with two unrelated branches 'a' and 'b'.
+    repo = tmpdir.join("upstream")
+    run_git("init", "-b", "a", repo)
+    for branch in ("a", "b"):
+        run_git("checkout", "--orphan", branch, cwd=str(repo))
+        repo.join(f"file-{branch}").write_binary(os.urandom(20000))
+        run_git("add", f"file-{branch}", cwd=str(repo))
+        run_git("commit", "-m", f"commit on {branch}", cwd=str(repo))
+    return repo
+
+
+def new_cache(tmpdir, max_size_mb=0):
+    return ObjectCache(
+        str(tmpdir.join("cache")), max_size_mb=max_size_mb, run_cmd=MirrorTool().run_cmd
+    )
+
+
+def fill_cache(cache, upstream):
+    cache.open()
+    cache.git(
+        "fetch",
+        str(upstream),
+        "+refs/heads/a:refs/test/a",
+        "+refs/heads/b:refs/test/b",
+    )
+
+    # 'b' is used more recently than 'a'.
+    cache.touch("refs/test/a")
+    cache.touch("refs/test/b")
+    used_dir = os.path.join(cache.path, "mirror-tool", "used")
+    for name in os.listdir(used_dir):
+        path = os.path.join(used_dir, name)
+        with open(path) as f:
+            mtime = 1000 if f.read() == "refs/test/a" else 2000
+        os.utime(path, (mtime, mtime))
+
+
+def cache_refs(cache):
+    return cache.git(
+        "for-each-ref", "--format=%(refname)", capture_output=True
+    ).stdout.split()
+
+
+def test_evict_lru(tmpdir, upstream):
+    """Cache evicts least recently used refs until within its maximum size."""
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+    assert cache.size() > 0
+
+    cache.evict()
+
+    # Everything had to be evicted to reach the maximum size of 0
+    assert cache_refs(cache) == []
+    assert cache.size() == 0
+    assert os.listdir(os.path.join(cache.path, "mirror-tool", "used")) == []
+
+    cache.close()
+
+
+def test_evict_stops_when_small_enough(tmpdir, upstream, caplog):
+    """Cache only evicts as much as needed, oldest first."""
+    caplog.set_level(logging.INFO)
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+
+    # Make it so that the cache will fit once any one ref is evicted.
+    cache.max_size = cache.size() - 1
+
+    cache.evict()
+
+    # It should have evicted only the older ref
+    assert cache_refs(cache) == [b"refs/test/b"]
+    assert "Evicting refs/test/a from object cache" in caplog.text
+    assert "refs/test/b from" not in caplog.text
+
+    cache.close()
+
+
+def test_evict_protected(tmpdir, upstream):
+    """Cache does not evict protected refs, even if over maximum size."""
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+
+    cache.evict(protect=["refs/test/a"])
+
+    assert cache_refs(cache) == [b"refs/test/a"]
+    assert cache.size() > 0
+
+    cache.close()
+
+
+def test_evict_when_busy(tmpdir, upstream, caplog):
+    """Cache does not evict anything while in use by others."""
+    caplog.set_level(logging.INFO)
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+
+    # Someone else is also using the cache.
+    other = new_cache(tmpdir)
+    other.open()
+
+    cache.evict()
+
+    # Nothing could be evicted
+    assert "in use by another process, not evicting" in caplog.text
+    assert cache_refs(cache) == [b"refs/test/a", b"refs/test/b"]
+
+    # Once the other user is done, eviction can proceed.
+    other.close()
+    cache.evict()
+    assert cache_refs(cache) == []
+
+    cache.close()
+
+
+def test_evict_batches(tmpdir, upstream):
+    """Cache evicts refs in batches, with a single gc per batch."""
+
+    cmds = []
+
+    def run_cmd(args, **kwargs):
+        cmds.append(args)
+        return MirrorTool().run_cmd(args, **kwargs)
+
+    cache = ObjectCache(str(tmpdir.join("cache")), max_size_mb=0, run_cmd=run_cmd)
+    cache.open()
+    cache.git(
+        "fetch", str(upstream), *[f"+refs/heads/a:refs/test/{i}" for i in range(8)]
+    )
+    for i in range(8):
+        cache.touch(f"refs/test/{i}")
+
+    cache.evict()
+
+    # Everything was evicted, two refs at a time.
+    assert cache_refs(cache) == []
+    assert len([cmd for cmd in cmds if "gc" in cmd]) == 4
+
+    cache.close()
+
+
+def test_attach_once(tmpdir, run_git, monkeypatch):
+    """Cache is only added to alternates once."""
+
+    repo = tmpdir.join("repo")
+    run_git("init", repo)
+    monkeypatch.chdir(str(repo))
+
+    cache = new_cache(tmpdir)
+    cache.open()
+    cache.open()
+    cache.attach()
+    cache.attach()
+    cache.close()
+
+    assert repo.join(".git/objects/info/alternates").read() == (
+        str(tmpdir.join("cache/objects")) + "\n"
+    )
+
+
+def test_detach(tmpdir, run_git, monkeypatch, upstream):
+    """Detaching copies borrowed objects and keeps other alternates."""
+
+    repo = tmpdir.join("repo")
+    run_git("init", repo)
+    monkeypatch.chdir(str(repo))
+
+    alternates = repo.join(".git/objects/info/alternates")
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+    cache.attach()
+    alternates.write("/some/other/objects\n", mode="a")
+    run_git("fetch", cache.path, "+refs/test/a:refs/heads/a")
+
+    cache.detach()
+    cache.detach()
+
+    assert alternates.read() == "/some/other/objects\n"
+    alternates.remove()
+
+    # The repo no longer needs the cache
+    cache.evict()
+    cache.close()
+    run_git("fsck", "--connectivity-only", cwd=str(repo))
+
+
+def test_detach_copies_borrowed_only(tmpdir, run_git, monkeypatch, upstream):
+    """Detaching copies only the objects which may have been borrowed."""
+
+    repo = tmpdir.join("repo")
+    run_git("init", "-b", "main", repo)
+    monkeypatch.chdir(str(repo))
+    repo.join("local").write("local content")
+    run_git("add", "local")
+    run_git("commit", "-m", "local commit")
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+    # Nothing is copied if nothing was borrowed.
+    cache.attach()
+    cache.detach()
+    assert repo.join(".git/objects/pack").listdir() == []
+
+    cache.attach()
+    run_git("fetch", cache.path, "+refs/test/a:refs/heads/a")
+    cache.detach()
+
+    # Only the objects of the fetched upstream were packed.
+    (pack,) = repo.join(".git/objects/pack").listdir("*.idx")
+    packed = subprocess.check_output(["git", "show-index"], stdin=pack.open("rb"))
+    upstream_commit = subprocess.check_output(
+        ["git", "rev-parse", "a"], text=True
+    ).strip()
+    local_commit = subprocess.check_output(
+        ["git", "rev-parse", "main"], text=True
+    ).strip()
+    assert upstream_commit in packed.decode()
+    assert local_commit not in packed.decode()
+
+    cache.evict()
+    cache.close()
+    run_git("fsck", "--connectivity-only", cwd=str(repo))
+
+
+def test_detach_attached_earlier(tmpdir, run_git, monkeypatch, upstream):
+    """Detaching a repo attached by another process copies all objects."""
+
+    repo = tmpdir.join("repo")
+    run_git("init", repo)
+    monkeypatch.chdir(str(repo))
+
+    other = new_cache(tmpdir)
+    fill_cache(other, upstream)
+    other.attach()
+    run_git("fetch", other.path, "+refs/test/a:refs/heads/a")
+    other.close()
+
+    cache = new_cache(tmpdir)
+    cache.open()
+    cache.detach()
+
+    cache.evict()
+    cache.close()
+    run_git("fsck", "--connectivity-only", cwd=str(repo))
+
+
+def test_evict_while_evicting(tmpdir, upstream, caplog):
+    """Only one process evicts at a time."""
+    caplog.set_level(logging.INFO)
+
+    cache = new_cache(tmpdir)
+    fill_cache(cache, upstream)
+
+    with open(os.path.join(cache.path, "mirror-tool", "evict-lock"), "at") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        cache.evict()
+
+    assert "being evicted by another process" in caplog.text
+    assert cache_refs(cache) == [b"refs/test/a", b"refs/test/b"]
+
+    cache.close()
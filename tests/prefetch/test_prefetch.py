@@ -0,0 +1,134 @@
+import sys
+import textwrap
+
+import pytest
+
+from mirror_tool.cmd import entrypoint
+
+
+@pytest.fixture
+def upstream(tmpdir, run_git):
+    repo = tmpdir.join("repo1")
+    run_git("init", "-b", "main", repo)
+    repo.join("file1").write("1")
+    run_git("add", "file1", cwd=str(repo))
+    run_git("commit", "-m", "commit in repo1", cwd=str(repo))
+    return repo
+
+
+@pytest.fixture
+def make_superproject(tmpdir, run_git):
+    def make(name):
+        reposuper = tmpdir.join(name)
+        run_git("init", "-b", "main", reposuper)
+        reposuper.join(".mirror-tool.yaml").write(
+            textwrap.dedent(
+                """
+                mirror:
+                - url: ../repo1
+                  ref: refs/heads/main
+                  dir: mirror1
+                git_config:
+                  user.name: test
+                  user.email: tester@example.com
+                """
+            )
+        )
+        run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+        run_git("commit", "-m", "add config", cwd=str(reposuper))
+        return reposuper
+
+    return make
+
+
+def run_tool(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", [""] + list(args))
+    entrypoint()
+
+
+def test_prefetch_then_update(
+    upstream, make_superproject, monkeypatch, caplog, run_git
+):
+    """update-local --no-fetch uses revisions fetched by an earlier prefetch."""
+
+    reposuper = make_superproject("super")
+    monkeypatch.chdir(str(reposuper))
+
+    run_tool(monkeypatch, "prefetch")
+    assert "Mirror(s) fetched." in caplog.text
+
+    # Now upstream changes after the prefetch.
+    upstream.join("file1").write("2")
+    run_git("commit", "-am", "update in repo1", cwd=str(upstream))
+
+    caplog.clear()
+    run_tool(monkeypatch, "update-local", "--no-fetch")
+
+    # It should have updated without fetching anything
+    assert "Mirror(s) locally updated." in caplog.text
+    assert "+ git fetch" not in caplog.text
+
+    # And so it's updated to the prefetched revision
+    assert reposuper.join("mirror1/file1").read() == "1"
+
+
+def test_update_not_prefetched(make_superproject, monkeypatch, caplog):
+    """update-local --no-fetch fails if mirrors weren't prefetched."""
+
+    reposuper = make_superproject("super")
+    monkeypatch.chdir(str(reposuper))
+
+    with pytest.raises(SystemExit) as excinfo:
+        run_tool(monkeypatch, "update-local", "--no-fetch")
+
+    # It should exit with this non-zero code
+    assert excinfo.value.code == 81
+
+    # And tell us why
+    assert "Mirror(s) have not been fetched: mirror1 (try `prefetch')" in caplog.text
+
+
+def test_prefetch_to_cache(
+    upstream, make_superproject, tmpdir, monkeypatch, caplog, run_git
+):
+    """update-local --no-fetch can use revisions prefetched into an object
+    cache from another repo."""
+
+    monkeypatch.setenv("MIRROR_TOOL_CACHE_DIR", str(tmpdir.join("cache")))
+
+    # Prefetch from one superproject.
+    monkeypatch.chdir(str(make_superproject("super1")))
+    run_tool(monkeypatch, "prefetch")
+
+    # Then update another.
+    reposuper = make_superproject("super2")
+    monkeypatch.chdir(str(reposuper))
+    caplog.clear()
+    run_tool(monkeypatch, "update-local", "--no-fetch")
+
+    # It should have updated, only fetching from the cache
+    assert "Mirror(s) locally updated." in caplog.text
+    assert "+ git fetch" in caplog.text
+    assert "../repo1" not in caplog.text
+    assert reposuper.join("mirror1/file1").read() == "1"
+
+    # If the config now has a mirror not present in the cache...
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1
+            - url: ../repo2
+              ref: refs/heads/main
+              dir: mirror2
+            """
+        )
+    )
+    caplog.clear()
+
+    # Then it can't be used without fetching
+    with pytest.raises(SystemExit):
+        run_tool(monkeypatch, "update-local", "--no-fetch")
+    assert "Mirror(s) have not been fetched: mirror2" in caplog.text
@@ -1,6 +1,8 @@
 import sys
 import textwrap
 
+import pytest
+
 from mirror_tool.cmd import entrypoint
 from mirror_tool.gitlab import GitlabPromoteSession
 
@@ -73,3 +75,63 @@ def test_promote_nothing(tmpdir, monkeypatch, caplog):
 
     # It should tell us there was nothing to do
     assert "No remote targets have any promotion rules" in caplog.text
+
+
+def test_promote_concurrently(tmpdir, monkeypatch, caplog):
+    """mirror-tool processes all promotion rules, sharing connections,
+    even if some rules fail."""
+
+    tmpdir.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            f"""
+            mirror: []
+            gitlab_promote:
+            - src: mysrc
+              dest: mydest
+            - src: mysrc2
+              dest: mydest2
+            - src: mysrc3
+              dest: mydest
+            """
+        )
+    )
+
+    monkeypatch.chdir(str(tmpdir))
+
+    monkeypatch.setattr(sys, "argv", ["", "promote"])
+
+    monkeypatch.setenv("CI_API_V4_URL", "https://gitlab.example.com/api")
+    monkeypatch.setenv("CI_PROJECT_ID", "123")
+    monkeypatch.setenv("CI_PROJECT_URL", "https://gitlab.example.com/best/project")
+    monkeypatch.setenv("GITLAB_MIRROR_TOKEN", "abc123")
+
+    sessions = []
+
+    def fake_ensure(self):
+        sessions.append(self)
+        if self.gitlab_promote.src == "mysrc2":
+            raise RuntimeError("simulated failure")
+
+    monkeypatch.setattr(
+        GitlabPromoteSession,
+        "ensure_promotion_merge_request_exists",
+        fake_ensure,
+    )
+
+    # It should fail overall
+    with pytest.raises(SystemExit) as excinfo:
+        entrypoint()
+    assert excinfo.value.code == 83
+
+    # But only after trying every rule
+    assert len(sessions) == 3
+
+    # All sessions used the same connection pool
+    adapters = {id(s.requests.adapters["https://"]) for s in sessions}
+    assert len(adapters) == 1
+
+    # Outcome is reported per rule
+    assert "mysrc => mydest promotion done." in caplog.text
+    assert "mysrc2 => mydest2 promotion failed." in caplog.text
+    assert "mysrc3 => mydest promotion done." in caplog.text
+    assert "1 of 3 promotion(s) failed." in caplog.text
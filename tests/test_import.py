@@ -1,3 +1,17 @@
+import pytest
+
+
 def test_can_import():
     """Trivial test, to be removed once real tests are implemented."""
     from mirror_tool import cmd
+
+
+def test_gitlab_exports():
+    """mirror_tool.gitlab exports its public names, imported when used."""
+    from mirror_tool import gitlab
+    from mirror_tool.gitlab.common import GitlabSession
+
+    assert gitlab.GitlabSession is GitlabSession
+
+    with pytest.raises(AttributeError):
+        gitlab.no_such_name
@@ -0,0 +1,128 @@
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from mirror_tool.cmd import entrypoint
+
+
+@pytest.fixture
+def reposuper(tmpdir, run_git):
+    for i in (1, 2):
+        repo = tmpdir.join(f"repo{i}")
+        run_git("init", "-b", "main", repo)
+        repo.join(f"file{i}").write(str(i))
+        run_git("add", f"file{i}", cwd=str(repo))
+        run_git("commit", "-m", f"commit in repo{i}", cwd=str(repo))
+
+    reposuper = tmpdir.join("super")
+    run_git("init", "-b", "main", reposuper)
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1-copy
+            - url: ../repo2
+              ref: refs/heads/main
+              dir: mirror2
+            combine_commits: true
+            commitmsg_combined: |-
+              Update mirrors
+              {% for update in updates %}
+              - {{ update.mirror.dir }}: {{ update.commit_count }} commit(s)
+              {%- endfor %}
+            git_config:
+              user.name: test
+              user.email: tester@example.com
+            """
+        )
+    )
+    run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+    run_git("commit", "-m", "add config", cwd=str(reposuper))
+
+    return reposuper
+
+
+def git_output(*args):
+    return subprocess.check_output(["git"] + list(args), text=True)
+
+
+@pytest.mark.parametrize("args", [[], ["--no-checkout"]])
+def test_update_combined(reposuper, tmpdir, monkeypatch, run_git, args):
+    """With combine_commits, all mirrors are updated by a single merge commit."""
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"] + args)
+
+    base = git_output("rev-parse", "HEAD").strip()
+    rev1 = git_output("-C", "../repo1", "rev-parse", "HEAD").strip()
+    rev2 = git_output("-C", "../repo2", "rev-parse", "HEAD").strip()
+
+    entrypoint()
+
+    # It should have made one commit merging both upstreams.
+    assert git_output("log", "-1", "--format=%P").split() == [base, rev1, rev2]
+    assert git_output("rev-parse", "HEAD~").strip() == base
+    assert git_output("ls-tree", "-r", "--name-only", "HEAD") == (
+        ".mirror-tool.yaml\nmirror1-copy/file1\nmirror1/file1\nmirror2/file2\n"
+    )
+
+    # With the message rendered once for all mirrors.
+    assert git_output("log", "-1", "--format=%B") == (
+        "Update mirrors\n\n"
+        "- mirror1: 1 commit(s)\n"
+        "- mirror1-copy: 1 commit(s)\n"
+        "- mirror2: 1 commit(s)\n\n"
+        f"Mirror-Tool-Upstream: {rev1} mirror1\n"
+        f"Mirror-Tool-Upstream: {rev1} mirror1-copy\n"
+        f"Mirror-Tool-Upstream: {rev2} mirror2\n\n"
+    )
+
+    if not args:
+        # The working tree was updated too.
+        assert reposuper.join("mirror1/file1").read() == "1"
+        assert git_output("status", "--porcelain") == ""
+
+    # Update only one upstream.
+    tmpdir.join("repo2/file2").write("22")
+    run_git("commit", "-am", "update repo2", cwd=str(tmpdir.join("repo2")))
+    rev2 = git_output("-C", "../repo2", "rev-parse", "HEAD").strip()
+    head = git_output("rev-parse", "HEAD").strip()
+
+    entrypoint()
+
+    # Then only that upstream is merged.
+    assert git_output("log", "-1", "--format=%P").split() == [head, rev2]
+    assert git_output("log", "-1", "--format=%s").strip() == "Update mirrors"
+    assert git_output("show", "HEAD:mirror2/file2") == "22"
+
+    # A mirror's content is restored without merging an upstream revision
+    # which was merged already.
+    run_git("reset", "--quiet", "--hard", cwd=str(reposuper))
+    reposuper.join("mirror1-copy/file1").write("local change")
+    run_git("commit", "-am", "local change", cwd=str(reposuper))
+    head = git_output("rev-parse", "HEAD").strip()
+
+    entrypoint()
+
+    assert git_output("log", "-1", "--format=%P").split() == [head]
+    assert git_output("show", "HEAD:mirror1-copy/file1") == "1"
+
+    # Nothing is merged if there are no updates...
+    head = git_output("rev-parse", "HEAD").strip()
+    entrypoint()
+    assert git_output("rev-parse", "HEAD").strip() == head
+
+    # ...unless forced, and then no merged revisions become parents again.
+    monkeypatch.setattr(sys, "argv", ["", "update-local", "--allow-empty"] + args)
+    entrypoint()
+    assert git_output("log", "-1", "--format=%P").split() == [head]
+    assert git_output("rev-parse", "HEAD^{tree}") == git_output(
+        "rev-parse", f"{head}^{{tree}}"
+    )
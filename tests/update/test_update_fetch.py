@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from mirror_tool.cmd import entrypoint
+
+
+def test_update_fetch_config(tmpdir, monkeypatch, caplog, run_git):
+    """update-local fetches all mirrors up front, according to fetch config,
+    using a single fetch for each url."""
+
+    repo1 = tmpdir.join("repo1")
+    repo2 = tmpdir.join("repo2")
+    reposuper = tmpdir.join("super")
+
+    run_git("init", "-b", "main", repo1)
+    run_git("init", "-b", "main", repo2)
+    run_git("init", "-b", "main", reposuper)
+
+    repo1.join("file1").write("1")
+    run_git("add", "file1", cwd=str(repo1))
+    run_git("commit", "-m", "commit in repo1", cwd=str(repo1))
+
+    # repo1 also has another branch with different content
+    run_git("checkout", "-b", "other", cwd=str(repo1))
+    repo1.join("file1-other").write("1")
+    run_git("add", "file1-other", cwd=str(repo1))
+    run_git("commit", "-m", "commit in repo1 other", cwd=str(repo1))
+
+    repo2.join("file2").write("2")
+    run_git("add", "file2", cwd=str(repo2))
+    run_git("commit", "-m", "commit in repo2", cwd=str(repo2))
+
+    # Note that repo1 is mirrored several times here.
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            f"""
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1
+            - url: ../repo2
+              ref: refs/heads/main
+              dir: mirror2
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1-again
+            - url: ../repo1
+              ref: refs/heads/other
+              dir: mirror1-other
+            fetch:
+              jobs: 2
+              jobs_per_host: 1
+            git_config:
+              user.name: test
+              user.email: tester@example.com
+            """
+        )
+    )
+    run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+    run_git("commit", "-m", "add config", cwd=str(reposuper))
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+
+    # It should run OK
+    entrypoint()
+    assert "Mirror(s) locally updated." in caplog.text
+
+    # Each distinct upstream url should have been fetched exactly once
+    assert caplog.text.count("+ git fetch") == 2
+
+    # And every mirror should have been updated
+    assert os.path.exists(str(reposuper.join("mirror1/file1")))
+    assert os.path.exists(str(reposuper.join("mirror2/file2")))
+    assert os.path.exists(str(reposuper.join("mirror1-again/file1")))
+    assert not os.path.exists(str(reposuper.join("mirror1-again/file1-other")))
+
+    # With each mirror at its own ref
+    assert os.path.exists(str(reposuper.join("mirror1-other/file1-other")))
+
+    # And all of those updates should have been committed
+    assert subprocess.check_output(["git", "status", "--porcelain"]) == b""
@@ -0,0 +1,202 @@
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from mirror_tool.cmd import entrypoint
+
+
+@pytest.fixture
+def reposuper(tmpdir, run_git):
+    for i in (1, 2):
+        repo = tmpdir.join(f"repo{i}")
+        run_git("init", "-b", "main", repo)
+        repo.mkdir("src").join(f"file{i}").write(str(i))
+        run_git("add", "src", cwd=str(repo))
+        run_git("commit", "-m", f"commit in repo{i}", cwd=str(repo))
+
+    reposuper = tmpdir.join("super")
+    run_git("init", "-b", "main", reposuper)
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: vendor/deep/mirror1
+            - url: ../repo2
+              ref: refs/heads/main
+              dir: mirror2
+            git_config:
+              user.name: test
+              user.email: tester@example.com
+            commitmsg: "merging {{mirror.dir}}"
+            """
+        )
+    )
+    # Some existing content, both alongside and within mirrors.
+    reposuper.mkdir("vendor").join("README").write("vendored code")
+    reposuper.mkdir("mirror2").join("junk").write("junk")
+    run_git("add", ".", cwd=str(reposuper))
+    run_git("commit", "-m", "initial", cwd=str(reposuper))
+
+    return reposuper
+
+
+def git_output(*args, cwd):
+    return subprocess.check_output(["git"] + list(args), cwd=str(cwd), text=True)
+
+
+def test_update_no_checkout(tmpdir, reposuper, monkeypatch, caplog, run_git):
+    """update-local --no-checkout creates the same commits as update-local,
+    without touching the working tree."""
+
+    run_git("clone", reposuper, tmpdir.join("super2"))
+    super2 = tmpdir.join("super2")
+
+    # Commits in both repos must have the same timestamps to be identical.
+    monkeypatch.setenv("GIT_AUTHOR_DATE", "2022-05-10T05:28:26Z")
+    monkeypatch.setenv("GIT_COMMITTER_DATE", "2022-05-10T05:28:26Z")
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+    entrypoint()
+
+    monkeypatch.chdir(str(super2))
+    monkeypatch.setattr(sys, "argv", ["", "update-local", "--no-checkout"])
+    entrypoint()
+
+    # It should have resulted in exactly the same trees and commit messages.
+    for cwd in (reposuper, super2):
+        assert git_output("ls-tree", "-r", "--name-only", "HEAD", cwd=cwd) == (
+            ".mirror-tool.yaml\nmirror2/src/file2\n"
+            "vendor/README\nvendor/deep/mirror1/src/file1\n"
+        )
+    assert git_output("rev-parse", "HEAD^{tree}", cwd=super2) == git_output(
+        "rev-parse", "HEAD^{tree}", cwd=reposuper
+    )
+    assert git_output("log", "--format=%B%P", cwd=super2) == git_output(
+        "log", "--format=%B%P", cwd=reposuper
+    )
+
+    # Working tree and index weren't touched.
+    assert not super2.join("vendor/deep").exists()
+    assert super2.join("mirror2/junk").exists()
+    assert git_output("diff", "--cached", "--name-only", "HEAD~2", cwd=super2) == ""
+
+    # Running again should not create any more commits.
+    head = git_output("rev-parse", "HEAD", cwd=super2)
+    caplog.clear()
+    entrypoint()
+    assert "vendor/deep/mirror1 is already up-to-date." in caplog.text
+    assert git_output("rev-parse", "HEAD", cwd=super2) == head
+
+    # Unless forced.
+    monkeypatch.setattr(
+        sys, "argv", ["", "update-local", "--no-checkout", "--allow-empty"]
+    )
+    entrypoint()
+    assert git_output("rev-parse", "HEAD~2", cwd=super2) == head
+
+
+def test_update_no_checkout_bare(tmpdir, reposuper, monkeypatch, run_git):
+    """update-local --no-checkout works in a bare repository."""
+
+    run_git("clone", "--bare", reposuper, tmpdir.join("super.git"))
+    superbare = tmpdir.join("super.git")
+
+    monkeypatch.chdir(str(superbare))
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["", "--conf", str(reposuper.join(".mirror-tool.yaml")), "update-local"]
+        + ["--no-checkout"],
+    )
+    entrypoint()
+
+    assert git_output("show", "HEAD:vendor/deep/mirror1/src/file1", cwd=superbare) == (
+        "1"
+    )
+    assert git_output("show", "HEAD:mirror2/src/file2", cwd=superbare) == "2"
+    assert git_output("show", "HEAD:vendor/README", cwd=superbare) == ("vendored code")
+
+
+def test_update_no_checkout_same_upstream(tmpdir, reposuper, monkeypatch, run_git):
+    """update-local --no-checkout doesn't merge an upstream revision twice when
+    several mirrors share an upstream, same as update-local."""
+
+    config = reposuper.join(".mirror-tool.yaml")
+    config.write(
+        config.read().replace(
+            "- url: ../repo2",
+            "- url: ../repo1\n  ref: refs/heads/main\n  dir: mirror1-copy\n"
+            "- url: ../repo2",
+        )
+    )
+    run_git("commit", "-am", "add mirror", cwd=str(reposuper))
+    run_git("clone", reposuper, tmpdir.join("super2"))
+    super2 = tmpdir.join("super2")
+
+    monkeypatch.setenv("GIT_AUTHOR_DATE", "2022-05-10T05:28:26Z")
+    monkeypatch.setenv("GIT_COMMITTER_DATE", "2022-05-10T05:28:26Z")
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+    entrypoint()
+
+    monkeypatch.chdir(str(super2))
+    monkeypatch.setattr(sys, "argv", ["", "update-local", "--no-checkout"])
+    entrypoint()
+
+    rev1 = git_output("rev-parse", "HEAD", cwd=tmpdir.join("repo1")).strip()
+    log = git_output("log", "--first-parent", "--format=%P", cwd=super2)
+
+    # Only the first of the mirrors of repo1 merged it.
+    assert [len(parents.split()) for parents in log.splitlines()] == [2, 1, 2, 1, 0]
+    assert log.splitlines()[2].split()[1] == rev1
+
+    assert git_output("log", "--format=%B%P", cwd=super2) == git_output(
+        "log", "--format=%B%P", cwd=reposuper
+    )
+
+
+def test_update_no_checkout_message_cleanup(tmpdir, reposuper, monkeypatch, run_git):
+    """update-local --no-checkout cleans up commit messages the same way as
+    update-local."""
+
+    config = reposuper.join(".mirror-tool.yaml")
+    config.write(
+        config.read().replace(
+            'commitmsg: "merging {{mirror.dir}}"',
+            "commitmsg: |\n"
+            "  \n"
+            "  Update {{ mirror.dir }}   \n"
+            "  \n"
+            "  \n"
+            "  {% for commit in commits %}\n"
+            "  - {{ commit.subject }}\n"
+            "  {% endfor %}\n",
+        )
+    )
+    run_git("commit", "-am", "multi-line message", cwd=str(reposuper))
+    run_git("clone", reposuper, tmpdir.join("super2"))
+    super2 = tmpdir.join("super2")
+
+    monkeypatch.setenv("GIT_AUTHOR_DATE", "2022-05-10T05:28:26Z")
+    monkeypatch.setenv("GIT_COMMITTER_DATE", "2022-05-10T05:28:26Z")
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+    entrypoint()
+
+    monkeypatch.chdir(str(super2))
+    monkeypatch.setattr(sys, "argv", ["", "update-local", "--no-checkout"])
+    entrypoint()
+
+    message = git_output("log", "-1", "--format=%B", cwd=super2)
+    assert message.startswith("Update mirror2\n\n- commit in repo2\n\nMirror-Tool")
+    assert message == git_output("log", "-1", "--format=%B", cwd=reposuper)
+    assert git_output("rev-parse", "HEAD", cwd=super2) == git_output(
+        "rev-parse", "HEAD", cwd=reposuper
+    )
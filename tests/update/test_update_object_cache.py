@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from mirror_tool.cmd import entrypoint
+
+
+def test_update_object_cache(tmpdir, monkeypatch, caplog, run_git):
+    """update-local can fetch through a persistent object cache."""
+
+    repo1 = tmpdir.join("repo1")
+    cache = tmpdir.join("cache")
+
+    run_git("init", "-b", "main", repo1)
+    repo1.join("file1").write("1")
+    run_git("add", "file1", cwd=str(repo1))
+    run_git("commit", "-m", "commit in repo1", cwd=str(repo1))
+
+    monkeypatch.setenv("MIRROR_TOOL_CACHE_DIR", str(cache))
+
+    def update_superproject(name):
+        reposuper = tmpdir.join(name)
+        run_git("init", "-b", "main", reposuper)
+        reposuper.join(".mirror-tool.yaml").write(
+            textwrap.dedent(
+                """
+                mirror:
+                - url: ../repo1
+                  ref: refs/heads/main
+                  dir: mirror1
+                git_config:
+                  user.name: test
+                  user.email: tester@example.com
+                """
+            )
+        )
+        run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+        run_git("commit", "-m", "add config", cwd=str(reposuper))
+
+        monkeypatch.chdir(str(reposuper))
+        monkeypatch.setattr(sys, "argv", ["", "update-local"])
+        entrypoint()
+
+        return reposuper
+
+    # Update a superproject using the cache.
+    super1 = update_superproject("super1")
+
+    # It should have updated as usual
+    assert "Mirror(s) locally updated." in caplog.text
+    assert super1.join("mirror1/file1").read() == "1"
+
+    # It should have used the cache as an alternate object store
+    assert "Using object cache at" in caplog.text
+
+    # The upstream commit was fetched into the cache
+    upstream = subprocess.check_output(
+        ["git", "rev-parse", "main"], cwd=str(repo1), text=True
+    ).strip()
+    assert (
+        subprocess.run(
+            ["git", "--git-dir", str(cache.join("git")), "cat-file", "-e", upstream]
+        ).returncode
+        == 0
+    )
+
+    # But once done, the superproject no longer depends on the cache, so it
+    # stays intact whatever is later evicted
+    assert not super1.join(".git/objects/info/alternates").exists()
+    subprocess.check_call(["git", "fsck", "--connectivity-only"], cwd=str(super1))
+
+    # Now a new commit arrives upstream...
+    repo1.join("file1").write("2")
+    run_git("commit", "-am", "update in repo1", cwd=str(repo1))
+
+    # And another superproject is updated with the same cache.
+    caplog.clear()
+    super2 = update_superproject("super2")
+
+    # It should work, with the new content
+    assert "Mirror(s) locally updated." in caplog.text
+    assert super2.join("mirror1/file1").read() == "2"
+
+    # And the superproject's history should be complete
+    subprocess.check_call(["git", "fsck", "--connectivity-only"], cwd=str(super2))
@@ -0,0 +1,107 @@
+import sys
+import textwrap
+
+import pytest
+
+from mirror_tool.cmd import entrypoint
+
+
+@pytest.fixture
+def repos(tmpdir, run_git):
+    # Upstream repos 1..3, and superproject using them.
+    for i in (1, 2, 3):
+        repo = tmpdir.join(f"repo{i}")
+        run_git("init", "-b", "main", repo)
+        repo.join(f"file{i}").write(str(i))
+        run_git("add", f"file{i}", cwd=str(repo))
+        run_git("commit", "-m", f"commit in repo{i}", cwd=str(repo))
+
+    reposuper = tmpdir.join("super")
+    run_git("init", "-b", "main", reposuper)
+    reposuper.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+            mirror:
+            - url: ../repo1
+              ref: refs/heads/main
+              dir: mirror1
+            - url: ../repo2
+              ref: refs/heads/main
+              dir: mirror2
+            # Short ref names can't be checked before fetching
+            - url: ../repo3
+              ref: main
+              dir: mirror3
+            git_config:
+              user.name: test
+              user.email: tester@example.com
+            """
+        )
+    )
+    run_git("add", ".mirror-tool.yaml", cwd=str(reposuper))
+    run_git("commit", "-m", "add config", cwd=str(reposuper))
+
+    return tmpdir
+
+
+def fetched_urls(caplog):
+    return [
+        record.getMessage().split()[-2]
+        for record in caplog.records
+        if record.getMessage().startswith("+ git fetch")
+    ]
+
+
+def test_update_skips_unchanged(repos, monkeypatch, caplog, run_git):
+    """update-local skips fetching and updating mirrors which haven't changed."""
+
+    reposuper = repos.join("super")
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+
+    # Initially, everything has to be updated.
+    entrypoint()
+    assert fetched_urls(caplog) == ["../repo1", "../repo2", "../repo3"]
+    assert "already up-to-date" not in caplog.text
+
+    # If I run again without any changes...
+    caplog.clear()
+    entrypoint()
+
+    # It should have skipped everything it could
+    assert "mirror1 is already up-to-date." in caplog.text
+    assert "mirror2 is already up-to-date." in caplog.text
+    assert fetched_urls(caplog) == ["../repo3"]
+
+    # Now let's make some changes:
+    # - a new commit in repo1, but with no changes in content
+    # - a local change to the content in mirror2
+    run_git("commit", "--allow-empty", "-m", "empty", cwd=str(repos.join("repo1")))
+    reposuper.join("mirror2/file2").write("oops")
+    run_git("commit", "-am", "oops", cwd=str(reposuper))
+
+    caplog.clear()
+    entrypoint()
+
+    # Both of those mirrors should have been updated
+    assert "already up-to-date" not in caplog.text
+    assert fetched_urls(caplog) == ["../repo1", "../repo2", "../repo3"]
+    assert reposuper.join("mirror2/file2").read() == "2"
+
+
+def test_update_probe_disabled(repos, monkeypatch, caplog):
+    """update-local always fetches every mirror if probe is disabled."""
+
+    reposuper = repos.join("super")
+    with reposuper.join(".mirror-tool.yaml").open("a") as f:
+        f.write("fetch:\n  probe: false\n")
+
+    monkeypatch.chdir(str(reposuper))
+    monkeypatch.setattr(sys, "argv", ["", "update-local"])
+
+    entrypoint()
+    caplog.clear()
+    entrypoint()
+
+    assert "already up-to-date" not in caplog.text
+    assert fetched_urls(caplog) == ["../repo1", "../repo2", "../repo3"]
@@ -112,3 +112,32 @@ def test_duplicate_mirror_dirs(tmpdir, monkeypatch, caplog):
     # It should tell us exactly the wrong field
     assert "Path: mirror" in caplog.text
     assert "Multiple mirrors defined using same dir" in caplog.text
+
+
+def test_all_errors_reported(tmpdir, monkeypatch, caplog):
+    """validate-config should report every error, not only the first."""
+
+    monkeypatch.setattr(sys, "argv", ["", "validate-config"])
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join(".mirror-tool.yaml").write(
+        textwrap.dedent(
+            """
+                mirror:
+                - url: ../foo
+                  dir: /foo
+                - url: ../bar
+                  ref: refs/heads/main
+                  bar: baz
+            """
+        )
+    )
+
+    with pytest.raises(SystemExit) as excinfo:
+        entrypoint()
+
+    assert excinfo.value.code == 80
+
+    assert "Path: mirror.0\n" in caplog.text
+    assert "Path: mirror.0.dir\n" in caplog.text
+    assert "Path: mirror.1\n" in caplog.text
+    assert "3 configuration error(s)" in caplog.text
@@ -0,0 +1,60 @@
+from mirror_tool import conf
+from mirror_tool.conf import Config, config_validator
+
+
+def make_config(count):
+    return Config(
+        {
+            "mirror": [
+                {
+                    "url": f"https://example.com/repo{i}",
+                    "ref": "refs/heads/main",
+                    "dir": f"deps/repo{i}",
+                }
+                for i in range(count)
+            ],
+            "gitlab_promote": [
+                {"src": f"branch{i}", "dest": f"branch{i + 1}"} for i in range(20)
+            ],
+        }
+    )
+
+
+def validate_calls(count, monkeypatch):
+    """Validates a config with 'count' mirrors, returning the number of
+    schema passes and template validations made."""
+    calls = {"config_validator": 0, "jinja_validate": 0}
+    jinja_validate = conf.jinja_validate
+
+    def count_config_validator():
+        calls["config_validator"] += 1
+        return config_validator()
+
+    def count_jinja_validate(*args, **kwargs):
+        calls["jinja_validate"] += 1
+        return jinja_validate(*args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(conf, "config_validator", count_config_validator)
+        m.setattr(conf, "jinja_validate", count_jinja_validate)
+        assert make_config(count).validation_errors() == []
+    return calls
+
+
+def test_scales_linearly(monkeypatch):
+    """Validating up to 10k mirrors takes one pass over the config, with no
+    per-mirror work besides the schema and duplicate dir checks."""
+
+    config_validator.cache_clear()
+
+    small = validate_calls(1000, monkeypatch)
+    large = validate_calls(10000, monkeypatch)
+
+    # The validator was built only once, for all validations.
+    assert config_validator.cache_info().misses == 1
+
+    # Each validation made a single schema pass, and validated the same
+    # templates regardless of the number of mirrors.
+    assert small == large
+    assert large["config_validator"] == 1
+    assert large["jinja_validate"] == 2 + 4 + 20 * 4